@@ -13,6 +13,7 @@ from elysia.objects import (
     Return,
     Text,
     Response,
+    TextDelta,
     Update,
     Status,
     Warning,
@@ -121,6 +121,7 @@ async def process(data: dict, websocket: WebSocket, user_manager: UserManager):
                     )
 
                     # only send if it's the first prompt
+                    # (the title is started by the tree when the final response starts, so is usually ready)
                     if tree.tree_index == 0:
                         await websocket.send_json(
                             await format_title_response(
@@ -421,6 +421,9 @@ class TreeManager:
         tree: Tree = self.get_tree(conversation_id)
         self.update_tree_last_request(conversation_id)
 
+        # the API sends the title and follow-up suggestions after the response, so start them alongside it
+        tree.prefetch_title_and_suggestions = True
+
         # wait for the tree to be idle
         await self.trees[conversation_id]["event"].wait()
 
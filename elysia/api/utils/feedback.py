@@ -10,6 +10,7 @@ from weaviate.util import generate_uuid5
 
 from elysia.tree.tree import Tree
 from elysia.util.parsing import format_datetime
+from elysia.util.retrieve_feedback import feedback_example_cache
 from elysia.api.core.log import logger
 import weaviate.classes.config as wc
 
@@ -189,6 +190,7 @@ async def create_feedback(
     feedback_collection = client.collections.get("ELYSIA_FEEDBACK__")
 
     history = tree.history[query_id]
+    training_updates = [update.to_json() for update in history["training_updates"]]
 
     # new_tasks_completed = []
     # for task_prompt in history["tree_data"].tasks_completed:
@@ -217,9 +219,7 @@ async def create_feedback(
         "conversation_id": conversation_id,
         "query_id": query_id,
         "feedback": int(feedback),
-        "modules_used": list(
-            set([h["module_name"] for h in history["training_updates"]])
-        ),
+        "modules_used": list(set([h["module_name"] for h in training_updates])),
         "user_prompt": history["tree_data"].user_prompt,
         "conversation_history": history["tree_data"].conversation_history,
         "tasks_completed": history["tree_data"].tasks_completed,
@@ -233,7 +233,7 @@ async def create_feedback(
         "feedback_date": format_datetime(
             date_now.replace(hour=0, minute=0, second=0, microsecond=0)
         ),
-        "training_updates": json.dumps(history["training_updates"]),
+        "training_updates": json.dumps(training_updates),
         "initialisation": history["initialisation"],
     }
 
@@ -258,6 +258,10 @@ async def create_feedback(
             )
     except Exception as e:
         logger.exception(f"Whilst inserting feedback to the feedback collection")
+        return
+
+    # cached examples for these modules are refreshed (in the background) when next used
+    feedback_example_cache.mark_stale(properties["modules_used"])
 
 
 async def view_feedback(user_id: str, conversation_id: str, query_id: str, client):
@@ -293,6 +297,7 @@ async def remove_feedback(user_id: str, conversation_id: str, query_id: str, cli
         }
     )
     await feedback_collection.data.delete_by_id(uuid=session_uuid)
+    feedback_example_cache.mark_stale()
 
 
 async def feedback_metadata(client, user_id: str):
@@ -1,5 +1,8 @@
 import os
+import json
+import hashlib
 import logging
+import threading
 import litellm
 from litellm import (
     AuthenticationError,
@@ -10,13 +13,19 @@ from litellm import (
 from litellm.utils import get_valid_models, check_valid_key
 from rich.logging import RichHandler
 from typing import Callable, Literal
+from collections import OrderedDict
 
 import spacy
 import random
 
 from dotenv import load_dotenv
 from dspy import LM
-from copy import deepcopy
+
+from elysia.lm.elysia_lm import ElysiaLM
+from elysia.lm.lm_cache import LMResponseCache, get_response_cache
+from elysia.lm.lm_governor import LMGovernor, get_lm_governor
+from elysia.lm.answer_cache import AnswerCache, get_answer_cache
+from elysia.lm.lm_history import LMHistory
 
 load_dotenv(override=True)
 
@@ -83,9 +92,58 @@ provider_to_api_keys = {
     "databricks": ["databricks_api_key", "databricks_api_base"],
     "bedrock": ["aws_access_key_id", "aws_secret_access_key", "aws_region_name"],
     "snowflake": ["snowflake_jwt", "snowflake_account_id"],
+    # served locally, without an API key
+    "ollama": [],
+}
+
+
+# how each API key is passed to litellm with an LM call, for keys not named "<provider>_api_key"
+api_key_to_lm_kwarg = {
+    "databricks_api_base": "api_base",
+    "aws_access_key_id": "aws_access_key_id",
+    "aws_secret_access_key": "aws_secret_access_key",
+    "aws_region_name": "aws_region_name",
+    "snowflake_jwt": "api_key",
 }
 
 
+def get_lm_credentials(provider: str, api_keys: dict[str, str]) -> dict[str, str]:
+    """
+    The credentials for an LM provider, as keyword arguments for `dspy.LM` (which passes them to litellm with every call).
+    This avoids reading the API keys from `os.environ`, so trees with different API keys can run concurrently.
+    """
+    credentials = {}
+    for api_key in _provider_api_keys(provider):
+        if api_key not in api_keys or api_keys[api_key] == "":
+            continue
+
+        if api_key == "snowflake_account_id":
+            credentials["api_base"] = (
+                f"https://{api_keys[api_key]}.snowflakecomputing.com"
+                "/api/v2/cortex/inference:complete"
+            )
+        else:
+            credentials[api_key_to_lm_kwarg.get(api_key, "api_key")] = api_keys[api_key]
+
+    return credentials
+
+
+def get_missing_lm_credentials(provider: str, api_keys: dict[str, str]) -> list[str]:
+    """
+    The API keys an LM provider needs that are not set in `api_keys`.
+    Providers not in `provider_to_api_keys` need a `"<provider>_api_key"`.
+    """
+    return [
+        api_key
+        for api_key in _provider_api_keys(provider)
+        if api_keys.get(api_key, "") == ""
+    ]
+
+
+def _provider_api_keys(provider: str) -> list[str]:
+    return provider_to_api_keys.get(provider, [f"{provider.split('/')[0]}_api_key"])
+
+
 def get_available_models(api_keys: list[str]):
     available_models = []
     for api_key in api_keys:
@@ -177,6 +235,33 @@ class Settings:
         self.USE_FEEDBACK = False
         self.BASE_USE_REASONING = True
         self.COMPLEX_USE_REASONING = True
+        self.PARALLEL_TOOL_CALLS = False
+        self.STREAM_TEXT_RESPONSES = False
+        self.EARLY_QUERY_EXECUTION = False
+
+        # Prompt size
+        self.ENVIRONMENT_TOKEN_BUDGET: int | None = None
+        self.CONVERSATION_HISTORY_WINDOW: int | None = None
+        self.PROMPT_TOKEN_BUDGET: int | None = None
+
+        # LLM response cache
+        self.LM_CACHE_PATH: str | None = None
+        self.LM_CACHE_MAX_BYTES: int = 100_000_000
+        self.LM_CACHE_TTL: float | None = 7 * 24 * 60 * 60
+
+        # LLM request limits (process-wide)
+        self.LM_MAX_IN_FLIGHT: int | None = None
+        self.LM_REQUESTS_PER_MINUTE: int | dict[str, int] | None = None
+
+        # Hedged requests for the base model
+        self.BASE_HEDGE_PERCENTILE: float | None = None
+        self.HEDGE_PROVIDER: str | None = None
+        self.HEDGE_MODEL: str | None = None
+
+        # Answer cache
+        self.ANSWER_CACHE_MAX_ENTRIES: int | None = None
+        self.ANSWER_CACHE_MAX_BYTES: int = 50_000_000
+        self.ANSWER_CACHE_SIMILARITY: float = 0.95
 
     def setup_app_logger(self, logger: logging.Logger):
         """
@@ -344,6 +429,55 @@ class Settings:
                     If True, the model will generate reasoning before coming to its solution.
                 - complex_use_reasoning (bool): Whether to use reasoning output for the complex model.
                     If True, the model will generate reasoning before coming to its solution.
+                - parallel_tool_calls (bool): EXPERIMENTAL. Whether the decision node can choose several independent tools at once.
+                    If True, the decision node can return additional actions alongside its main choice (e.g. querying one collection
+                    while aggregating another), which are run concurrently and merged into the environment in the order they were chosen.
+                - stream_text_responses (bool): Whether text responses (the final response and summaries) are streamed from the LLM.
+                    If True, pieces of the response are returned as `text_delta` payloads while it is being generated,
+                    followed by the complete response as usual. Defaults to False.
+                - early_query_execution (bool): EXPERIMENTAL. Whether the query tool starts its Weaviate queries while the LLM is still generating.
+                    If True, the query creator output is streamed and each query is executed as soon as it is complete,
+                    and its results are used if it matches the final output (otherwise the query is run again as usual).
+                    Not used when `use_feedback` is True. Defaults to False.
+                - environment_token_budget (int | None): The approximate number of tokens the environment can use in LLM prompts.
+                    If set, the environment is packed into this budget before being shown to the LLM, favouring recent and relevant results,
+                    collapsing repeated objects, truncating long text and replacing older results with their summaries.
+                    The full environment is still available to tools. Defaults to None (no limit).
+                - conversation_history_window (int | None): The number of most recent conversation messages shown to the LLM verbatim.
+                    Older messages are folded into a rolling summary by the base model, in the background after each completed query.
+                    The full conversation history is still stored in the tree. Defaults to None (all messages are shown).
+                - prompt_token_budget (int | None): The maximum number of (estimated) tokens in a prompt to the LLM.
+                    Prompts over the budget are shrunk before they are sent, by reducing the environment, then the collection schemas,
+                    then the conversation history. If None, 90% of the model's context window is used (when the model is known to litellm).
+                    Defaults to None.
+                - lm_cache_path (str | None): The path to a local SQLite file used to cache LLM responses.
+                    If set, identical LLM calls (same model, messages and sampling parameters) are answered from this file instead of the provider.
+                    Defaults to None (no response cache).
+                - lm_cache_max_bytes (int): The maximum size of the LLM response cache, in bytes.
+                    The least recently used responses are evicted when the cache is larger than this. Defaults to 100MB.
+                - lm_cache_ttl (float | None): The number of seconds a cached LLM response is valid for.
+                    If None, responses never expire. Defaults to one week.
+                - lm_max_in_flight (int | None): The maximum number of LLM requests in progress at once, across every tree in the process.
+                    Requests over the limit wait, with decisions and tool calls served ahead of titles, suggestions and summaries.
+                    Defaults to None (no limit).
+                - lm_requests_per_minute (int | dict[str, int] | None): The maximum rate of LLM requests to each model, across every tree in the process.
+                    Either one limit for every model, or a dictionary keyed by model (e.g. `"openai/gpt-4o"`) or provider (e.g. `"openai"`).
+                    Defaults to None (no limit).
+                - base_hedge_percentile (float | None): The percentile (0-100) of recent base model latencies after which
+                    a duplicate request is sent for decisions and tool calls, and the first response is used.
+                    Defaults to None (no hedged requests).
+                - hedge_provider (str | None): The provider of the model the duplicate (hedged) requests are sent to.
+                    Requests that fail are also retried with this model. Defaults to None (the base model is used).
+                - hedge_model (str | None): The model the duplicate (hedged) requests are sent to.
+                    Defaults to None (the base model is used).
+                - answer_cache_max_entries (int | None): The maximum number of full tree answers kept in memory.
+                    If set, the first prompt of a conversation that is near-identical to a recently answered one,
+                    against the same collections (and collection metadata) and tree, replays the stored answer
+                    without any LLM or Weaviate calls. Defaults to None (no answer cache).
+                - answer_cache_max_bytes (int): The maximum total size of the stored answers, in bytes. Defaults to 50MB.
+                - answer_cache_similarity (float): The minimum character trigram similarity (between 0 and 1)
+                    for a prompt to match a stored prompt. Prompts only match if their words and numbers are the same
+                    (apart from common words such as "the" or "is"). Defaults to 0.95.
                 - Additional API keys to set. E.g. `openai_apikey="..."`, if this argument ends with `apikey` or `api_key`,
                     it will be added to the `API_KEYS` dictionary.
 
@@ -468,6 +602,74 @@ class Settings:
             self.COMPLEX_USE_REASONING = kwargs["complex_use_reasoning"]
             kwargs.pop("complex_use_reasoning")
 
+        if "parallel_tool_calls" in kwargs:
+            self.PARALLEL_TOOL_CALLS = kwargs["parallel_tool_calls"]
+            kwargs.pop("parallel_tool_calls")
+
+        if "stream_text_responses" in kwargs:
+            self.STREAM_TEXT_RESPONSES = kwargs["stream_text_responses"]
+            kwargs.pop("stream_text_responses")
+
+        if "early_query_execution" in kwargs:
+            self.EARLY_QUERY_EXECUTION = kwargs["early_query_execution"]
+            kwargs.pop("early_query_execution")
+
+        if "environment_token_budget" in kwargs:
+            self.ENVIRONMENT_TOKEN_BUDGET = kwargs["environment_token_budget"]
+            kwargs.pop("environment_token_budget")
+
+        if "conversation_history_window" in kwargs:
+            self.CONVERSATION_HISTORY_WINDOW = kwargs["conversation_history_window"]
+            kwargs.pop("conversation_history_window")
+
+        if "prompt_token_budget" in kwargs:
+            self.PROMPT_TOKEN_BUDGET = kwargs["prompt_token_budget"]
+            kwargs.pop("prompt_token_budget")
+
+        if "lm_cache_path" in kwargs:
+            self.LM_CACHE_PATH = kwargs["lm_cache_path"]
+            kwargs.pop("lm_cache_path")
+
+        if "lm_cache_max_bytes" in kwargs:
+            self.LM_CACHE_MAX_BYTES = kwargs["lm_cache_max_bytes"]
+            kwargs.pop("lm_cache_max_bytes")
+
+        if "lm_cache_ttl" in kwargs:
+            self.LM_CACHE_TTL = kwargs["lm_cache_ttl"]
+            kwargs.pop("lm_cache_ttl")
+
+        if "lm_max_in_flight" in kwargs:
+            self.LM_MAX_IN_FLIGHT = kwargs["lm_max_in_flight"]
+            kwargs.pop("lm_max_in_flight")
+
+        if "lm_requests_per_minute" in kwargs:
+            self.LM_REQUESTS_PER_MINUTE = kwargs["lm_requests_per_minute"]
+            kwargs.pop("lm_requests_per_minute")
+
+        if "base_hedge_percentile" in kwargs:
+            self.BASE_HEDGE_PERCENTILE = kwargs["base_hedge_percentile"]
+            kwargs.pop("base_hedge_percentile")
+
+        if "hedge_provider" in kwargs:
+            self.HEDGE_PROVIDER = kwargs["hedge_provider"]
+            kwargs.pop("hedge_provider")
+
+        if "hedge_model" in kwargs:
+            self.HEDGE_MODEL = kwargs["hedge_model"]
+            kwargs.pop("hedge_model")
+
+        if "answer_cache_max_entries" in kwargs:
+            self.ANSWER_CACHE_MAX_ENTRIES = kwargs["answer_cache_max_entries"]
+            kwargs.pop("answer_cache_max_entries")
+
+        if "answer_cache_max_bytes" in kwargs:
+            self.ANSWER_CACHE_MAX_BYTES = kwargs["answer_cache_max_bytes"]
+            kwargs.pop("answer_cache_max_bytes")
+
+        if "answer_cache_similarity" in kwargs:
+            self.ANSWER_CACHE_SIMILARITY = kwargs["answer_cache_similarity"]
+            kwargs.pop("answer_cache_similarity")
+
         if "api_keys" in kwargs and isinstance(kwargs["api_keys"], dict):
             for key, value in kwargs["api_keys"].items():
                 self.set_api_key(value, key)
@@ -596,28 +798,27 @@ class ElysiaKeyManager:
 
         return False
 
-    def __enter__(self):
-
-        # save existing env
-        self.existing_env = deepcopy(os.environ)
+    def _models(self) -> list[tuple[str | None, str | None]]:
+        models = [
+            (self.settings.BASE_MODEL, self.settings.BASE_PROVIDER),
+            (self.settings.COMPLEX_MODEL, self.settings.COMPLEX_PROVIDER),
+        ]
+        if "HEDGE_PROVIDER" in dir(self.settings) and self.settings.HEDGE_PROVIDER:
+            models.append((self.settings.HEDGE_MODEL, self.settings.HEDGE_PROVIDER))
+        return models
 
-        # blank out the environ except for certain values
-        os.environ = {
-            "MODEL_API_BASE": self.settings.MODEL_API_BASE,
-            "WCD_URL": self.settings.WCD_URL,
-            "WCD_API_KEY": self.settings.WCD_API_KEY,
-        }
-
-        # update all api keys in env
-        for api_key, value in self.settings.API_KEYS.items():
-            os.environ[api_key.upper()] = value
+    def _missing_api_keys(self, provider: str | None) -> list[str]:
+        if provider is None:
+            return []
+        return get_missing_lm_credentials(provider, self.settings.API_KEYS)
 
-        pass
+    def __enter__(self):
+        # API keys are passed with each LM call (see `load_lm`) and in the Weaviate client headers,
+        # so nothing global (e.g. os.environ) is changed here and trees with different keys can run concurrently.
+        # LMs refuse calls when their provider's API keys are missing, rather than litellm reading them from the environment
+        return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        # reset env to original
-        os.environ = self.existing_env
-
         if exc_type is NotFoundError or exc_type is BadRequestError:
             self._check_model_availability(
                 self.settings.BASE_MODEL, self.settings.BASE_PROVIDER
@@ -627,34 +828,26 @@ class ElysiaKeyManager:
             )
 
         if exc_type is AuthenticationError or exc_type is BadRequestError:
-            missing_base_api_keys = [
-                api_key
-                for api_key in provider_to_api_keys[self.settings.BASE_PROVIDER]
-                if api_key not in self.settings.API_KEYS
-            ]
-            missing_complex_api_keys = [
+            for model, provider in self._models():
+                missing_api_keys = self._missing_api_keys(provider)
+                if len(missing_api_keys) > 0:
+                    raise APIKeyError(
+                        f"You are trying to use the model '{model}' "
+                        f"but you do not have one of the following API keys: {', '.join(missing_api_keys)}. "
+                        f"Please update your API keys in the settings."
+                    )
+
+            relevant_api_keys = set(
                 api_key
-                for api_key in provider_to_api_keys[self.settings.COMPLEX_PROVIDER]
-                if api_key not in self.settings.API_KEYS
-            ]
-            if len(missing_base_api_keys) > 0:
-                raise APIKeyError(
-                    f"You are trying to use the model '{self.settings.BASE_MODEL}' "
-                    f"but you do not have one of the following API keys: {', '.join(missing_base_api_keys)}. "
-                    f"Please update your API keys in the settings."
-                )
-            if len(missing_complex_api_keys) > 0:
-                raise APIKeyError(
-                    f"You are trying to use the model '{self.settings.COMPLEX_MODEL}' "
-                    f"but you do not have one of the following API keys: {', '.join(missing_complex_api_keys)}. "
-                    f"Please update your API keys in the settings."
-                )
-
+                for _, provider in self._models()
+                if provider is not None
+                for api_key in _provider_api_keys(provider)
+            )
             raise APIKeyError(
                 f"One of your API keys is incorrect. "
                 f"Please update your API keys in the settings. "
                 f"The relevant API keys are: "
-                f"{set(provider_to_api_keys[self.settings.BASE_PROVIDER] + provider_to_api_keys[self.settings.COMPLEX_PROVIDER])}"
+                f"{relevant_api_keys}"
             )
 
         if (
@@ -704,13 +897,79 @@ def check_complex_lm_settings(settings: Settings):
         )
 
 
+def load_response_cache(settings: Settings) -> LMResponseCache | None:
+    if "LM_CACHE_PATH" not in dir(settings) or settings.LM_CACHE_PATH is None:
+        return None
+
+    return get_response_cache(
+        settings.LM_CACHE_PATH,
+        max_bytes=settings.LM_CACHE_MAX_BYTES,
+        ttl=settings.LM_CACHE_TTL,
+    )
+
+
+def load_lm_governor(settings: Settings) -> LMGovernor:
+    return get_lm_governor(
+        max_in_flight=(
+            settings.LM_MAX_IN_FLIGHT if "LM_MAX_IN_FLIGHT" in dir(settings) else None
+        ),
+        requests_per_minute=(
+            settings.LM_REQUESTS_PER_MINUTE
+            if "LM_REQUESTS_PER_MINUTE" in dir(settings)
+            else None
+        ),
+    )
+
+
+def load_answer_cache(settings: Settings) -> AnswerCache | None:
+    if (
+        "ANSWER_CACHE_MAX_ENTRIES" not in dir(settings)
+        or settings.ANSWER_CACHE_MAX_ENTRIES is None
+    ):
+        return None
+
+    return get_answer_cache(
+        max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+        max_bytes=settings.ANSWER_CACHE_MAX_BYTES,
+        similarity_threshold=settings.ANSWER_CACHE_SIMILARITY,
+    )
+
+
+def load_hedge_lm(settings: Settings) -> LM | None:
+    if (
+        "HEDGE_PROVIDER" not in dir(settings)
+        or settings.HEDGE_PROVIDER is None
+        or settings.HEDGE_MODEL is None
+    ):
+        return None
+
+    return load_lm(
+        settings.HEDGE_PROVIDER,
+        settings.HEDGE_MODEL,
+        settings.MODEL_API_BASE if "MODEL_API_BASE" in dir(settings) else None,
+        governor=load_lm_governor(settings),
+        api_keys=settings.API_KEYS,
+    )
+
+
 def load_base_lm(settings: Settings) -> LM:
     check_base_lm_settings(settings)
 
+    hedge_percentile = (
+        settings.BASE_HEDGE_PERCENTILE
+        if "BASE_HEDGE_PERCENTILE" in dir(settings)
+        else None
+    )
+
     return load_lm(
         settings.BASE_PROVIDER,
         settings.BASE_MODEL,
         settings.MODEL_API_BASE if "MODEL_API_BASE" in dir(settings) else None,
+        response_cache=load_response_cache(settings),
+        governor=load_lm_governor(settings),
+        api_keys=settings.API_KEYS,
+        hedge_percentile=hedge_percentile,
+        hedge_lm=load_hedge_lm(settings) if hedge_percentile is not None else None,
     )
 
 
@@ -721,13 +980,25 @@ def load_complex_lm(settings: Settings) -> LM:
         settings.COMPLEX_PROVIDER,
         settings.COMPLEX_MODEL,
         settings.MODEL_API_BASE if "MODEL_API_BASE" in dir(settings) else None,
+        response_cache=load_response_cache(settings),
+        governor=load_lm_governor(settings),
+        api_keys=settings.API_KEYS,
     )
 
 
+# the number of most recent calls kept in the history of each LM
+LM_HISTORY_LENGTH = 20
+
+
 def load_lm(
     provider: str | None,
     lm_name: str | None,
     model_api_base: str | None = None,
+    response_cache: LMResponseCache | None = None,
+    governor: LMGovernor | None = None,
+    api_keys: dict[str, str] | None = None,
+    hedge_percentile: float | None = None,
+    hedge_lm: LM | None = None,
 ) -> LM:
 
     if provider is None or lm_name is None:
@@ -736,12 +1007,111 @@ def load_lm(
     api_base = model_api_base if provider == "ollama" else None
     full_lm_name = f"{provider}/{lm_name}"
 
+    lm_kwargs = {"api_base": api_base, "max_tokens": 8000}
     if lm_name.startswith("o1") or lm_name.startswith("o3"):
-        return LM(
-            model=full_lm_name, api_base=api_base, max_tokens=8000, temperature=1.0
-        )
+        lm_kwargs["temperature"] = 1.0
+
+    # litellm would read any credentials not passed from the process environment,
+    # so the LM refuses calls if any of the provider's API keys are missing instead
+    api_keys = api_keys if api_keys is not None else {}
+    lm_kwargs.update(get_lm_credentials(provider, api_keys))
+
+    lm = ElysiaLM(
+        model=full_lm_name,
+        response_cache=response_cache,
+        governor=governor,
+        hedge_percentile=hedge_percentile,
+        hedge_lm=hedge_lm,
+        missing_api_keys=get_missing_lm_credentials(provider, api_keys),
+        **lm_kwargs,
+    )
+
+    # only the most recent calls are kept, usage is accumulated as calls are made
+    lm.history = LMHistory(LM_HISTORY_LENGTH)
+    return lm
+
+
+# LMs shared by all low memory trees in the process, see `borrow_base_lm`
+LM_POOL_SIZE = 32
+_lm_pool: OrderedDict[tuple, LM] = OrderedDict()
+_lm_pool_lock = threading.Lock()
+
 
-    return LM(model=full_lm_name, api_base=api_base, max_tokens=8000)
+def _lm_pool_key(
+    settings: Settings, role: str, provider: str | None, lm_name: str | None
+):
+    # the role ("base" or "complex") is part of the key, as base LMs are loaded with e.g. hedging that complex LMs are not
+    return (
+        role,
+        provider,
+        lm_name,
+        settings.MODEL_API_BASE if "MODEL_API_BASE" in dir(settings) else None,
+        _credentials_hash(settings, provider),
+        settings.LM_CACHE_PATH if "LM_CACHE_PATH" in dir(settings) else None,
+        _hedge_settings(settings) if role == "base" else None,
+    )
+
+
+def _credentials_hash(settings: Settings, provider: str | None) -> str:
+    credentials = (
+        get_lm_credentials(provider, settings.API_KEYS) if provider is not None else {}
+    )
+    return hashlib.sha256(json.dumps(credentials, sort_keys=True).encode()).hexdigest()
+
+
+def _hedge_settings(settings: Settings) -> tuple:
+    hedge_provider = (
+        settings.HEDGE_PROVIDER if "HEDGE_PROVIDER" in dir(settings) else None
+    )
+    return (
+        (
+            settings.BASE_HEDGE_PERCENTILE
+            if "BASE_HEDGE_PERCENTILE" in dir(settings)
+            else None
+        ),
+        hedge_provider,
+        settings.HEDGE_MODEL if "HEDGE_MODEL" in dir(settings) else None,
+        _credentials_hash(settings, hedge_provider),
+    )
+
+
+def _borrow_lm(key: tuple, load: Callable[[], LM]) -> LM:
+    with _lm_pool_lock:
+        if key in _lm_pool:
+            _lm_pool.move_to_end(key)
+            lm = _lm_pool[key]
+        else:
+            lm = load()
+            _lm_pool[key] = lm
+            if len(_lm_pool) > LM_POOL_SIZE:
+                _lm_pool.popitem(last=False)
+
+    return lm
+
+
+def borrow_base_lm(settings: Settings) -> LM:
+    """
+    Returns a base LM from a process-wide pool, shared with any other settings that have the same
+    base provider, model, API base and credentials, loading it if it is not in the pool yet.
+    Used by low memory trees instead of loading a new LM for every call.
+    The least recently used LMs are removed from the pool when it holds more than `LM_POOL_SIZE` LMs.
+    """
+    return _borrow_lm(
+        _lm_pool_key(settings, "base", settings.BASE_PROVIDER, settings.BASE_MODEL),
+        lambda: load_base_lm(settings),
+    )
+
+
+def borrow_complex_lm(settings: Settings) -> LM:
+    """
+    Returns a complex LM from a process-wide pool. See `borrow_base_lm`.
+    """
+    return _borrow_lm(
+        _lm_pool_key(
+            settings, "complex", settings.COMPLEX_PROVIDER, settings.COMPLEX_MODEL
+        ),
+        lambda: load_complex_lm(settings),
+    )
 
 
 # global settings that should never be used by the frontend
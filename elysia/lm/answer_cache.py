@@ -0,0 +1,232 @@
+import re
+import json
+import math
+import threading
+from collections import Counter, OrderedDict
+from copy import deepcopy
+from typing import Any
+
+
+def normalise_prompt(prompt: str) -> str:
+    """
+    Lowercase a prompt, collapse whitespace and remove trailing punctuation,
+    so prompts that only differ in formatting are treated as identical.
+    """
+    return re.sub(r"\s+", " ", prompt.lower()).strip().rstrip("?!. ")
+
+
+# words that can differ between two prompts asking the same question
+_stopwords = {
+    "a", "an", "the", "this", "that", "these", "those",
+    "is", "are", "was", "were", "be", "been", "am", "do", "does", "did",
+    "i", "me", "my", "we", "our", "us", "you", "your", "it", "its", "they", "them", "their",
+    "of", "in", "on", "at", "for", "with", "by", "about",
+    "please", "can", "could", "would", "will", "should", "there", "here", "what", "which",
+}  # fmt: skip
+
+
+def prompt_key_tokens(prompt: str) -> tuple[str, ...]:
+    """
+    The words and numbers of a (normalised) prompt, in order, apart from common words such as "the" or "is".
+    Prompts must have the same key tokens to be near-identical, so prompts that only differ in e.g. a number or a name do not match.
+    """
+    return tuple(
+        token
+        for token in re.findall(r"\w+(?:\.\d+)?", normalise_prompt(prompt))
+        if token not in _stopwords
+    )
+
+
+def _ngrams(text: str, n: int = 3) -> Counter:
+    text = f" {text} "
+    return Counter(text[i : i + n] for i in range(max(len(text) - n + 1, 1)))
+
+
+def _norm(ngrams: Counter) -> float:
+    return math.sqrt(sum(count * count for count in ngrams.values()))
+
+
+def prompt_similarity(prompt_a: str, prompt_b: str) -> float:
+    """
+    Cosine similarity (between 0 and 1) of the character trigram counts of two (normalised) prompts.
+    """
+    ngrams_a = _ngrams(normalise_prompt(prompt_a))
+    ngrams_b = _ngrams(normalise_prompt(prompt_b))
+    return _cosine(ngrams_a, _norm(ngrams_a), ngrams_b, _norm(ngrams_b))
+
+
+def prompt_ngrams(prompt: str) -> tuple[Counter, float]:
+    """
+    The character trigram counts of a (normalised) prompt and their norm, for use with `ngram_similarity`.
+    """
+    ngrams = _ngrams(normalise_prompt(prompt))
+    return ngrams, _norm(ngrams)
+
+
+def ngram_similarity(
+    ngrams_a: tuple[Counter, float], ngrams_b: tuple[Counter, float]
+) -> float:
+    """
+    Cosine similarity (between 0 and 1) of two outputs of `prompt_ngrams`.
+    """
+    return _cosine(ngrams_a[0], ngrams_a[1], ngrams_b[0], ngrams_b[1])
+
+
+def _cosine(ngrams_a: Counter, norm_a: float, ngrams_b: Counter, norm_b: float):
+    if norm_a == 0 or norm_b == 0:
+        return 0.0
+    if len(ngrams_a) > len(ngrams_b):
+        ngrams_a, ngrams_b = ngrams_b, ngrams_a
+    dot = sum(count * ngrams_b[ngram] for ngram, count in ngrams_a.items())
+    return dot / (norm_a * norm_b)
+
+
+class CachedAnswer:
+    """
+    A stored answer to a prompt: the frontend payloads the tree returned,
+    the assistant messages added to the conversation history and the environment after the answer.
+    """
+
+    def __init__(
+        self,
+        prompt: str,
+        fingerprint: str,
+        payloads: list[dict],
+        conversation: list[dict],
+        environment: dict,
+    ):
+        self.prompt = normalise_prompt(prompt)
+        self.fingerprint = fingerprint
+        self.payloads = payloads
+        self.conversation = conversation
+        self.environment = environment
+
+        self.key_tokens = prompt_key_tokens(self.prompt)
+        self.ngrams = _ngrams(self.prompt)
+        self.norm = _norm(self.ngrams)
+        self.size = len(
+            json.dumps([payloads, conversation, environment], default=str).encode()
+        )
+
+
+class AnswerCache:
+    """
+    An in-memory cache of full tree answers, keyed on the user prompt and a fingerprint of the tree and collection state.
+
+    A prompt is a hit if a stored prompt with the same fingerprint is identical after normalisation,
+    or has the same key tokens (see `prompt_key_tokens`) and a character trigram similarity of at least `similarity_threshold`.
+    The least recently used answers are evicted when there are more than `max_entries` answers,
+    or when the answers take up more than `max_bytes` (in their JSON form).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        max_bytes: int = 50_000_000,
+        similarity_threshold: float = 0.95,
+    ):
+        """
+        Args:
+            max_entries (int): The maximum number of stored answers. Defaults to 1000.
+            max_bytes (int): The maximum total size of the stored answers, in bytes. Defaults to 50MB.
+            similarity_threshold (float): The minimum similarity (between 0 and 1) for a prompt to match a stored prompt.
+                Defaults to 0.95.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.similarity_threshold = similarity_threshold
+
+        self._entries: OrderedDict[tuple[str, str], CachedAnswer] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, prompt: str, fingerprint: str) -> CachedAnswer | None:
+        """
+        Returns the stored answer for a prompt similar to `prompt` with the same `fingerprint`, or None if there is none.
+        """
+        key = (fingerprint, normalise_prompt(prompt))
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+            key_tokens = prompt_key_tokens(key[1])
+            ngrams = _ngrams(key[1])
+            norm = _norm(ngrams)
+
+            best_key, best_similarity = None, self.similarity_threshold
+            for entry_key, entry in self._entries.items():
+                if entry.fingerprint != fingerprint or entry.key_tokens != key_tokens:
+                    continue
+                similarity = _cosine(ngrams, norm, entry.ngrams, entry.norm)
+                if similarity >= best_similarity:
+                    best_key, best_similarity = entry_key, similarity
+
+            if best_key is None:
+                return None
+
+            self._entries.move_to_end(best_key)
+            return self._entries[best_key]
+
+    def set(
+        self,
+        prompt: str,
+        fingerprint: str,
+        payloads: list[dict],
+        conversation: list[dict],
+        environment: dict,
+    ) -> None:
+        """
+        Store the answer to `prompt`, evicting the least recently used answers if the cache is too large.
+        """
+        entry = CachedAnswer(
+            prompt, fingerprint, deepcopy(payloads), deepcopy(conversation), environment
+        )
+        if entry.size > self.max_bytes:
+            return
+
+        key = (fingerprint, entry.prompt)
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key).size
+
+            self._entries[key] = entry
+            self._size += entry.size
+
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+
+    def clear(self) -> None:
+        """
+        Remove all stored answers.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+# one answer cache per process, shared across every tree
+_answer_cache: AnswerCache | None = None
+
+
+def get_answer_cache(
+    max_entries: int = 1000,
+    max_bytes: int = 50_000_000,
+    similarity_threshold: float = 0.95,
+) -> AnswerCache:
+    """
+    Returns the process-wide `AnswerCache`, creating it if it does not exist yet.
+    The bounds and similarity threshold are updated to the values given.
+    """
+    global _answer_cache
+    if _answer_cache is None:
+        _answer_cache = AnswerCache(max_entries, max_bytes, similarity_threshold)
+    else:
+        _answer_cache.max_entries = max_entries
+        _answer_cache.max_bytes = max_bytes
+        _answer_cache.similarity_threshold = similarity_threshold
+    return _answer_cache
@@ -0,0 +1,210 @@
+import time
+import asyncio
+from collections import deque
+from typing import Any
+
+import dspy
+from dspy import LM
+from litellm import AuthenticationError
+
+from elysia.lm.lm_cache import LMResponseCache
+from elysia.lm.lm_governor import LMGovernor, current_lm_priority
+
+
+class ElysiaLM(LM):
+    """
+    The `dspy.LM` used by Elysia (created by `load_lm`).
+
+    - If a `response_cache` is given, responses are looked up in the `LMResponseCache` before calling the provider.
+        Only calls with a text prompt or a list of messages are cached, and only if the response is JSON serialisable.
+        Responses served from the cache are not added to the LM history, so they are not counted as calls (or cost) by the `Tracker`.
+        The number of hits and misses are kept in `cache_hits` and `cache_misses`.
+    - If a `governor` is given, async calls to the provider wait for the `LMGovernor`
+        (process-wide rate limits, in-flight cap and priorities) before being sent.
+    - If a `hedge_percentile` is given, interactive async calls (see `lm_priority`) that have not returned
+        after that percentile of the recent call latencies send a duplicate request, to the `hedge_lm` if given
+        (otherwise to this LM), and the first response is used while the other request is cancelled.
+        If the request fails, the `hedge_lm` is tried instead.
+        Hedging starts once `min_hedge_samples` calls have completed, and streamed calls are never hedged.
+        Calls answered by the `hedge_lm` are recorded in its own history, which the `Tracker` adds to this LM's usage.
+    - If any `missing_api_keys` are given, every call raises a litellm `AuthenticationError` (including cached calls),
+        so litellm never falls back to the API keys in the process environment.
+    """
+
+    # passed with each call, but do not change the response (so are not part of the cache key)
+    credential_kwargs = [
+        "api_key",
+        "aws_access_key_id",
+        "aws_secret_access_key",
+        "aws_region_name",
+    ]
+
+    def __init__(
+        self,
+        model: str,
+        response_cache: LMResponseCache | None = None,
+        governor: LMGovernor | None = None,
+        hedge_percentile: float | None = None,
+        hedge_lm: LM | None = None,
+        min_hedge_samples: int = 20,
+        missing_api_keys: list[str] | None = None,
+        **kwargs,
+    ):
+        super().__init__(model=model, **kwargs)
+        self.response_cache = response_cache
+        self.governor = governor
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        self.hedge_percentile = hedge_percentile
+        self.hedge_lm = hedge_lm
+        self.min_hedge_samples = min_hedge_samples
+        self.latencies: deque[float] = deque(maxlen=200)
+        self.hedged_calls = 0
+        self.failovers = 0
+
+        self.missing_api_keys = missing_api_keys or []
+
+    def _check_api_keys(self) -> None:
+        if len(self.missing_api_keys) > 0:
+            raise AuthenticationError(
+                message=f"Missing API keys: {', '.join(self.missing_api_keys)}",
+                llm_provider=self.model.split("/")[0],
+                model=self.model,
+            )
+
+    def _cache_key(
+        self, prompt: str | None, messages: list[dict] | None, kwargs: dict
+    ) -> str | None:
+        if self.response_cache is None:
+            return None
+        if prompt is not None and not isinstance(prompt, str):
+            return None
+        call_kwargs = {
+            key: value
+            for key, value in {**self.kwargs, **kwargs}.items()
+            if key not in self.credential_kwargs
+        }
+        return self.response_cache.make_key(self.model, prompt, messages, call_kwargs)
+
+    def _lookup(self, key: str | None) -> Any | None:
+        if key is None:
+            return None
+        outputs = self.response_cache.get(key)  # type: ignore
+        if outputs is not None:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+        return outputs
+
+    def _store(self, key: str | None, outputs: Any) -> None:
+        if key is None:
+            return
+        try:
+            self.response_cache.set(key, outputs)  # type: ignore
+        except (TypeError, ValueError):
+            # not JSON serialisable (e.g. tool call objects), so not cached
+            pass
+
+    def __call__(self, prompt=None, *, messages=None, **kwargs):
+        self._check_api_keys()
+        key = self._cache_key(prompt, messages, kwargs)
+        outputs = self._lookup(key)
+        if outputs is not None:
+            return outputs
+
+        outputs = super().__call__(prompt, messages=messages, **kwargs)
+        self._store(key, outputs)
+        return outputs
+
+    async def acall(self, prompt=None, *, messages=None, **kwargs):
+        self._check_api_keys()
+        key = self._cache_key(prompt, messages, kwargs)
+        outputs = self._lookup(key)
+        if outputs is not None:
+            return outputs
+
+        # a streamed call sends its chunks as they arrive, so cannot be raced against a duplicate
+        if (
+            self.hedge_percentile is not None
+            and current_lm_priority() == "interactive"
+            and dspy.settings.send_stream is None
+        ):
+            outputs = await self._hedged_acall(prompt, messages, kwargs)
+        else:
+            outputs = await self._provider_acall(prompt, messages, kwargs)
+
+        self._store(key, outputs)
+        return outputs
+
+    async def _provider_acall(self, prompt, messages, kwargs: dict):
+        start = time.perf_counter()
+        if self.governor is not None:
+            async with self.governor.slot(self.model):
+                outputs = await super().acall(prompt, messages=messages, **kwargs)
+        else:
+            outputs = await super().acall(prompt, messages=messages, **kwargs)
+        self.latencies.append(time.perf_counter() - start)
+        return outputs
+
+    def _secondary_acall(self, prompt, messages, kwargs: dict):
+        if self.hedge_lm is not None:
+            return self.hedge_lm.acall(prompt, messages=messages, **kwargs)
+        return self._provider_acall(prompt, messages, kwargs)
+
+    def hedge_delay(self) -> float | None:
+        """
+        The number of seconds to wait for a response before sending a duplicate request,
+        the `hedge_percentile` of the recent call latencies.
+        None if there are not enough calls yet.
+        """
+        if (
+            self.hedge_percentile is None
+            or len(self.latencies) < self.min_hedge_samples
+        ):
+            return None
+        latencies = sorted(self.latencies)
+        index = int(len(latencies) * self.hedge_percentile / 100)
+        return latencies[min(index, len(latencies) - 1)]
+
+    async def _hedged_acall(self, prompt, messages, kwargs: dict):
+        primary = asyncio.ensure_future(self._provider_acall(prompt, messages, kwargs))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay())
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+
+        if primary in done:
+            if primary.exception() is None:
+                return primary.result()
+            if self.hedge_lm is None:
+                raise primary.exception()  # type: ignore
+
+            # fail over to the secondary LM
+            self.failovers += 1
+            try:
+                return await self._secondary_acall(prompt, messages, kwargs)
+            except Exception:
+                raise primary.exception()  # type: ignore
+
+        # the primary request is slow, race it against a duplicate
+        self.hedged_calls += 1
+        secondary = asyncio.ensure_future(
+            self._secondary_acall(prompt, messages, kwargs)
+        )
+        pending = {primary, secondary}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        # both failed
+        raise primary.exception()  # type: ignore
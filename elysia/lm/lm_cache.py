@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any
+
+
+class LMResponseCache:
+    """
+    A local, disk-backed cache of LM responses, stored in a SQLite file.
+
+    Responses are keyed on the model, the (normalised) messages and the sampling parameters of the call.
+    Entries older than `ttl` seconds are treated as misses and removed,
+    and when the cache grows larger than `max_bytes` the least recently used entries are evicted.
+    The same file can be shared by several LMs (and several trees), see `get_response_cache`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 100_000_000,
+        ttl: float | None = 7 * 24 * 60 * 60,
+    ):
+        """
+        Args:
+            path (str): The path to the SQLite file. Created if it does not exist.
+            max_bytes (int): The maximum total size of the stored responses, in bytes.
+                Defaults to 100MB.
+            ttl (float | None): The number of seconds a response is valid for.
+                If None, responses never expire. Defaults to one week.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        directory = os.path.dirname(path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, "
+            "value TEXT NOT NULL, "
+            "size INTEGER NOT NULL, "
+            "created REAL NOT NULL, "
+            "accessed REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+        self._size = self._total_size()
+
+    def __deepcopy__(self, memo: dict) -> "LMResponseCache":
+        # copies of an LM (e.g. `dspy.LM.copy`) keep using the same file
+        return self
+
+    def __len__(self) -> int:
+        with self._lock:
+            row = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()
+        return row[0]
+
+    @staticmethod
+    def make_key(
+        model: str,
+        prompt: str | None,
+        messages: list[dict] | None,
+        kwargs: dict,
+    ) -> str:
+        """
+        Create the cache key for an LM call.
+        Message contents are stripped of surrounding whitespace, so prompts that only differ in formatting share a key.
+        """
+        if messages is not None:
+            messages = [
+                {
+                    key: value.strip() if isinstance(value, str) else value
+                    for key, value in message.items()
+                }
+                for message in messages
+            ]
+
+        key = json.dumps(
+            {
+                "model": model,
+                "prompt": prompt.strip() if isinstance(prompt, str) else prompt,
+                "messages": messages,
+                "kwargs": kwargs,
+            },
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def get(self, key: str) -> Any | None:
+        """
+        Returns the stored response for `key`, or None if there is no (valid) response stored.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, size, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            value, size, created = row
+            if self.ttl is not None and now - created > self.ttl:
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._size -= size
+                return None
+
+            self._connection.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (now, key)
+            )
+
+        return json.loads(value)
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        Store a response under `key`. The response must be JSON serialisable.
+        Evicts the least recently used responses if the cache is larger than `max_bytes`.
+        """
+        value = json.dumps(value)
+        size = len(value.encode())
+        if size > self.max_bytes:
+            return
+
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._size += size - (row[0] if row is not None else 0)
+
+            if self._size > self.max_bytes:
+                self._evict(now)
+
+    def _total_size(self) -> int:
+        return self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    def _evict(self, now: float) -> None:
+        if self.ttl is not None:
+            self._connection.execute(
+                "DELETE FROM responses WHERE created < ?", (now - self.ttl,)
+            )
+
+        # other processes may share the file, so recount before evicting
+        self._size = self._total_size()
+        excess = self._size - self.max_bytes
+        if excess <= 0:
+            return
+
+        evicted = []
+        for key, size in self._connection.execute(
+            "SELECT key, size FROM responses ORDER BY accessed ASC"
+        ):
+            evicted.append((key,))
+            excess -= size
+            self._size -= size
+            if excess <= 0:
+                break
+
+        self._connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def clear(self) -> None:
+        """
+        Remove all stored responses.
+        """
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+            self._size = 0
+
+
+# one cache per file, shared across every LM that uses it
+_response_caches: dict[str, LMResponseCache] = {}
+
+
+def get_response_cache(
+    path: str,
+    max_bytes: int = 100_000_000,
+    ttl: float | None = 7 * 24 * 60 * 60,
+) -> LMResponseCache:
+    """
+    Returns the `LMResponseCache` for the file at `path`, creating it if it does not exist yet.
+    The size bound and TTL are updated to the values given.
+    """
+    path = os.path.abspath(path)
+    if path not in _response_caches:
+        _response_caches[path] = LMResponseCache(path, max_bytes=max_bytes, ttl=ttl)
+    else:
+        _response_caches[path].max_bytes = max_bytes
+        _response_caches[path].ttl = ttl
+    return _response_caches[path]
@@ -0,0 +1,269 @@
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Iterator, Literal
+
+Priority = Literal["interactive", "background"]
+
+# lower values are served first
+_priority_order: dict[str, int] = {"interactive": 0, "background": 1}
+
+_lm_priority: ContextVar[str] = ContextVar("lm_priority", default="interactive")
+
+
+@contextmanager
+def lm_priority(priority: Priority) -> Iterator[None]:
+    """
+    Set the priority of any LM calls made within this context (including in tasks created within it).
+    Calls are "interactive" by default, and "background" calls (e.g. titles and suggestions) wait behind them.
+
+    Example:
+        ```python
+        with lm_priority("background"):
+            title = await create_conversation_title(conversation, lm)
+        ```
+    """
+    token = _lm_priority.set(priority)
+    try:
+        yield
+    finally:
+        _lm_priority.reset(token)
+
+
+def current_lm_priority() -> str:
+    """
+    The priority of LM calls made in the current context (see `lm_priority`).
+    """
+    return _lm_priority.get()
+
+
+class _TokenBucket:
+    def __init__(self, requests_per_minute: float):
+        self.rate = requests_per_minute / 60
+        self.capacity = max(requests_per_minute / 60, 1.0)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+
+    def reserve(self) -> float:
+        """
+        Take a token, returns how many seconds to wait before it is available.
+        """
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.last_refill) * self.rate
+        )
+        self.last_refill = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class LMGovernor:
+    """
+    Process-wide limits on the LM calls made through Elysia, shared by every tree.
+
+    - `requests_per_minute` limits each model (or provider) with a token bucket,
+    - `max_in_flight` caps the number of LM requests in progress at once, across all models,
+    - requests waiting for an in-flight slot are served by priority (see `lm_priority`), then in order of arrival.
+
+    The time each request waits is recorded per priority, see `get_metrics`.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int | None = None,
+        requests_per_minute: int | dict[str, int] | None = None,
+    ):
+        """
+        Args:
+            max_in_flight (int | None): The maximum number of LM requests in progress at once.
+                If None, there is no limit. Defaults to None.
+            requests_per_minute (int | dict[str, int] | None): The maximum rate of requests to each model.
+                Either one limit for every model, or a dictionary of limits keyed by model (e.g. `"openai/gpt-4o"`)
+                or provider (e.g. `"openai"`). Models without a limit are not rate limited. Defaults to None.
+        """
+        self.max_in_flight = max_in_flight
+        self.requests_per_minute = requests_per_minute
+
+        self.in_flight = 0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._granted: set[asyncio.Future] = set()
+        self._counter = itertools.count()
+        self._buckets: dict[str, _TokenBucket] = {}
+        self._lock = threading.Lock()
+
+        self.metrics = {
+            priority: {"requests": 0, "total_wait": 0.0, "max_wait": 0.0}
+            for priority in _priority_order
+        }
+
+    def __deepcopy__(self, memo: dict) -> "LMGovernor":
+        # copies of an LM (e.g. `dspy.LM.copy`) keep using the same limits
+        return self
+
+    def configure(
+        self,
+        max_in_flight: int | None = None,
+        requests_per_minute: int | dict[str, int] | None = None,
+    ) -> None:
+        with self._lock:
+            self.max_in_flight = max_in_flight
+            if requests_per_minute != self.requests_per_minute:
+                self.requests_per_minute = requests_per_minute
+                self._buckets = {}
+            self._wake_waiters()
+
+    def _rate_limit(self, model: str) -> int | None:
+        if self.requests_per_minute is None or isinstance(
+            self.requests_per_minute, int
+        ):
+            return self.requests_per_minute
+        if model in self.requests_per_minute:
+            return self.requests_per_minute[model]
+        for provider, limit in self.requests_per_minute.items():
+            if model.startswith(provider + "/"):
+                return limit
+        return None
+
+    def _reserve_rate(self, model: str) -> float:
+        limit = self._rate_limit(model)
+        if limit is None:
+            return 0.0
+        with self._lock:
+            if model not in self._buckets:
+                self._buckets[model] = _TokenBucket(limit)
+            return self._buckets[model].reserve()
+
+    def _wake_waiters(self) -> None:
+        # called with the lock held
+        while self._waiters and (
+            self.max_in_flight is None or self.in_flight < self.max_in_flight
+        ):
+            _, _, waiter = heapq.heappop(self._waiters)
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            self._granted.add(waiter)
+            waiter.get_loop().call_soon_threadsafe(_set_result, waiter)
+
+    async def _acquire(self, priority: str) -> None:
+        with self._lock:
+            if not self._waiters and (
+                self.max_in_flight is None or self.in_flight < self.max_in_flight
+            ):
+                self.in_flight += 1
+                return
+
+            waiter = asyncio.get_running_loop().create_future()
+            heapq.heappush(
+                self._waiters,
+                (_priority_order[priority], next(self._counter), waiter),
+            )
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                # the slot may have been handed over just before cancelling
+                if waiter in self._granted:
+                    self._granted.discard(waiter)
+                    self._release()
+                else:
+                    waiter.cancel()
+            raise
+
+        with self._lock:
+            self._granted.discard(waiter)
+
+    def _release(self) -> None:
+        # called with the lock held
+        self.in_flight -= 1
+        self._wake_waiters()
+
+    def _record_wait(self, priority: str, wait: float) -> None:
+        with self._lock:
+            metrics = self.metrics[priority]
+            metrics["requests"] += 1
+            metrics["total_wait"] += wait
+            metrics["max_wait"] = max(metrics["max_wait"], wait)
+
+    @asynccontextmanager
+    async def slot(
+        self, model: str, priority: Priority | None = None
+    ) -> AsyncIterator[None]:
+        """
+        Wait until a request to `model` is allowed, and hold an in-flight slot for the duration of the context.
+
+        Args:
+            model (str): The full model name (e.g. `"openai/gpt-4o"`).
+            priority (Priority | None): The priority of the request.
+                If None, the priority set by `lm_priority` is used (defaults to "interactive").
+        """
+        if priority is None:
+            priority = current_lm_priority()  # type: ignore
+
+        start = time.perf_counter()
+        rate_wait = self._reserve_rate(model)
+        if rate_wait > 0:
+            await asyncio.sleep(rate_wait)
+        await self._acquire(priority)  # type: ignore
+        self._record_wait(priority, time.perf_counter() - start)  # type: ignore
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._release()
+
+    def get_metrics(self) -> dict:
+        """
+        The number of requests, total and maximum queue wait (in seconds) for each priority,
+        and the average wait, along with the number of requests currently in flight and waiting.
+        """
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "waiting": sum(not waiter.done() for *_, waiter in self._waiters),
+                **{
+                    priority: {
+                        **metrics,
+                        "avg_wait": (
+                            metrics["total_wait"] / metrics["requests"]
+                            if metrics["requests"] > 0
+                            else 0.0
+                        ),
+                    }
+                    for priority, metrics in self.metrics.items()
+                },
+            }
+
+
+def _set_result(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+# one governor per process, shared across every LM
+_lm_governor: LMGovernor | None = None
+
+
+def get_lm_governor(
+    max_in_flight: int | None = None,
+    requests_per_minute: int | dict[str, int] | None = None,
+) -> LMGovernor:
+    """
+    Returns the process-wide `LMGovernor`, creating it if it does not exist yet.
+    The limits are updated to the values given.
+    """
+    global _lm_governor
+    if _lm_governor is None:
+        _lm_governor = LMGovernor(max_in_flight, requests_per_minute)
+    elif (
+        _lm_governor.max_in_flight != max_in_flight
+        or _lm_governor.requests_per_minute != requests_per_minute
+    ):
+        _lm_governor.configure(max_in_flight, requests_per_minute)
+    return _lm_governor
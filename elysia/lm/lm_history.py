@@ -0,0 +1,35 @@
+from typing import Any
+
+
+class LMHistory(list):
+    """
+    The history of a `dspy.LM`, keeping only the most recent `max_length` calls.
+
+    Running totals of the calls, input/output tokens and cost of every call ever made are kept as entries are added,
+    so usage can be read without the full history (see `Tracker.update_lm_costs`).
+    """
+
+    def __init__(self, max_length: int | None = 20):
+        """
+        Args:
+            max_length (int | None): The number of most recent calls to keep.
+                If None, every call is kept. Defaults to 20.
+        """
+        super().__init__()
+        self.max_length = max_length
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost = 0.0
+
+    def append(self, entry: Any) -> None:
+        self.calls += 1
+        if isinstance(entry, dict):
+            usage = entry.get("usage") or {}
+            self.input_tokens += usage.get("prompt_tokens") or 0
+            self.output_tokens += usage.get("completion_tokens") or 0
+            self.cost += entry.get("cost") or 0
+
+        super().append(entry)
+        if self.max_length is not None and len(self) > self.max_length:
+            del self[: len(self) - self.max_length]
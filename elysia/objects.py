@@ -117,6 +117,7 @@ class Tool(metaclass=ToolMeta):
         status: str = "",
         inputs: dict = {},
         end: bool = False,
+        availability_depends_on: list[str] | None = None,
         **kwargs,
     ):
         """
@@ -136,11 +137,17 @@ class Tool(metaclass=ToolMeta):
                 }
                 ```
             end (bool): Whether the tool is an end tool. Optional, defaults to False.
+            availability_depends_on (list[str] | None): The fields of the `TreeData` that `is_tool_available` depends on,
+                e.g. `["environment", "collection_names"]`. Optional, defaults to None.
+                If set, the result of `is_tool_available` is cached and only re-evaluated when one of these fields
+                (or whether there is a Weaviate client) changes. Use `[]` if it only depends on the Weaviate client.
+                If None, `is_tool_available` is evaluated on every decision.
         """
         self.name = name
         self.description = description
         self.inputs = inputs
         self.end = end
+        self.availability_depends_on = availability_depends_on
 
         if status == "":
             self.status = f"Running {self.name}..."
@@ -574,6 +581,20 @@ class Update(Return):
         }
 
 
+class TextDelta(Update):
+    """
+    A piece of a text response while it is being generated, when text responses are streamed (`settings.STREAM_TEXT_RESPONSES`).
+    Deltas with the same `stream_id` are consecutive pieces of the same response,
+    and are followed by the complete `Text` result, which replaces them.
+    Deltas are not added to the conversation history.
+    """
+
+    def __init__(self, text: str, stream_id: str):
+        self.text = text
+        self.stream_id = stream_id
+        Update.__init__(self, "text_delta", {"text": text, "stream_id": stream_id})
+
+
 class Status(Update):
     """
     Status message to be sent to the frontend for real-time updates in words.
@@ -25,6 +25,27 @@ from elysia.util.objects import TrainingUpdate, FewShotExamples
 from elysia.util.parsing import format_aggregation_response
 
 
+# The output field depends only on whether the collections are vectorised,
+# so the two possible signatures are built once and reused across calls
+_aggregation_prompts: dict[bool, type[dspy.Signature]] = {}
+
+
+def _aggregation_prompt(vectorised: bool) -> type[dspy.Signature]:
+    if vectorised not in _aggregation_prompts:
+        _aggregation_prompts[vectorised] = AggregationPrompt.append(
+            name="aggregation_queries",
+            type_=(
+                Union[list[VectorisedAggregationOutput], None]
+                if vectorised
+                else Union[list[AggregationOutput], None]
+            ),
+            field=dspy.OutputField(
+                desc=construct_aggregation_output_prompt(vectorised),
+            ),
+        )
+    return _aggregation_prompts[vectorised]
+
+
 class Aggregate(Tool):
     def __init__(
         self,
@@ -54,6 +75,7 @@ class Aggregate(Tool):
                 },
             },
             end=False,
+            availability_depends_on=[],
         )
 
     async def is_tool_available(
@@ -126,9 +148,6 @@ class Aggregate(Tool):
                 inputs["collection_names"], schemas
             )
 
-        # Set up the dspy model
-        aggregation_prompt = AggregationPrompt
-
         # check if collections are vectorised
         vectorised_by_collection = {
             collection_name: (
@@ -141,22 +160,8 @@ class Aggregate(Tool):
             for collection_name in collection_names
         }
 
-        if any(vectorised_by_collection.values()):
-            aggregation_prompt = aggregation_prompt.append(
-                name="aggregation_queries",
-                type_=Union[list[VectorisedAggregationOutput], None],
-                field=dspy.OutputField(
-                    desc=construct_aggregation_output_prompt(True),
-                ),
-            )
-        else:
-            aggregation_prompt = aggregation_prompt.append(
-                name="aggregation_queries",
-                type_=Union[list[AggregationOutput], None],
-                field=dspy.OutputField(
-                    desc=construct_aggregation_output_prompt(False),
-                ),
-            )
+        # Set up the dspy model
+        aggregation_prompt = _aggregation_prompt(any(vectorised_by_collection.values()))
 
         aggregate_generator = ElysiaChainOfThought(
             aggregation_prompt,
@@ -322,11 +327,11 @@ class Aggregate(Tool):
         yield TrainingUpdate(
             module_name="aggregate",
             inputs={
-                **tree_data.to_json(),
                 "available_collections": collection_names,
                 "previous_aggregation_queries": previous_aggregations,
             },
             outputs=aggregation.__dict__["_store"],
+            tree_data=tree_data,
         )
         if self.logger:
             self.logger.debug("Aggregation Tool finished!")
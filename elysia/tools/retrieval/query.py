@@ -1,6 +1,8 @@
-from typing import AsyncGenerator, Union
+import json
+import asyncio
+from typing import Any, AsyncGenerator, Union
 from logging import Logger
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 
 from rich import print
 from rich.panel import Panel
@@ -29,6 +31,34 @@ from elysia.tree.objects import TreeData
 from elysia.util.client import ClientManager
 from elysia.util.objects import TrainingUpdate, TreeUpdate, FewShotExamples
 from elysia.util.return_types import all_return_types
+from elysia.util.streaming import JSONListStream
+
+
+# The output field depends only on whether the collections are vectorised,
+# so the two possible signatures are built once and reused across calls
+_query_creator_prompts: dict[bool, type[dspy.Signature]] = {}
+
+
+def _query_creator_prompt(vectorised: bool) -> type[dspy.Signature]:
+    if vectorised not in _query_creator_prompts:
+        _query_creator_prompts[vectorised] = QueryCreatorPrompt.append(
+            name="query_outputs",
+            type_=(
+                Union[list[QueryOutput], None]
+                if vectorised
+                else Union[list[NonVectorisedQueryOutput], None]
+            ),
+            field=dspy.OutputField(
+                desc=construct_query_output_prompt(vectorised),
+            ),
+        )
+    return _query_creator_prompts[vectorised]
+
+
+def _retrieve_exception(task: asyncio.Task) -> None:
+    # early queries whose results are not used should not log "exception was never retrieved"
+    if not task.cancelled():
+        task.exception()
 
 
 class Query(Tool):
@@ -68,6 +98,7 @@ class Query(Tool):
                 },
             },
             end=False,
+            availability_depends_on=["collection_names"],
         )
 
         self.logger = logger
@@ -189,6 +220,112 @@ class Query(Tool):
 
         return error_message
 
+    def _early_query_args(
+        self,
+        item: Any,
+        vectorised: bool,
+        fields_to_search: Any,
+        schemas: dict,
+        searchable_fields: dict,
+        collection_names: list[str],
+    ) -> tuple[QueryOutput, dict] | None:
+        """
+        Validate a query output parsed from the streamed LLM output, and correct it in the same way as the complete output.
+        Returns the query output and the fields to search, or None if the query should not be executed early
+        (it is invalid, the fields to search are not known yet, or it may need chunking).
+        """
+        if not isinstance(fields_to_search, dict):
+            return None
+
+        try:
+            query_output = (
+                QueryOutput if vectorised else NonVectorisedQueryOutput
+            ).model_validate(item)
+        except ValidationError:
+            return None
+
+        query_output.target_collections = self._fix_collection_names(
+            query_output.target_collections, schemas
+        )
+
+        fields_to_search = self._fix_collection_names_in_dict(fields_to_search, schemas)
+        if any(
+            collection_name not in collection_names
+            for collection_name in fields_to_search
+        ):
+            return None
+
+        for collection_name in fields_to_search:
+            if fields_to_search[collection_name] is not None and (
+                schemas[collection_name]["named_vectors"] is None
+                or searchable_fields[collection_name] == []
+            ):
+                fields_to_search[collection_name] = None
+
+        # chunking depends on the display type, which is not checked here
+        if any(
+            self._evaluate_needs_chunking(
+                "document", query_output.search_type, schemas[collection_name]
+            )
+            for collection_name in query_output.target_collections
+        ):
+            return None
+
+        return query_output, fields_to_search
+
+    async def _execute_early_query(
+        self,
+        client_manager: ClientManager,
+        query_output: QueryOutput,
+        fields_to_search: dict,
+        schemas: dict,
+    ):
+        async with client_manager.connect_to_async_client() as client:
+            return await execute_weaviate_query(
+                client,
+                query_output,
+                named_vector_fields=fields_to_search,
+                property_types={
+                    collection_name: {
+                        field["name"]: field["type"]
+                        for field in schemas[collection_name]["fields"]
+                    }
+                    for collection_name in query_output.target_collections
+                },
+                schema=schemas,
+            )
+
+    def _take_early_query(
+        self,
+        early_queries: dict[int, tuple[dict, dict, asyncio.Task]],
+        index: int,
+        query_output: QueryOutput,
+        fields_to_search: dict,
+    ) -> asyncio.Task | None:
+        """
+        Returns the early query for the `index`th query output if it was executed with exactly the same arguments,
+        otherwise cancels it and returns None.
+        """
+        if index not in early_queries:
+            return None
+
+        early_query_output, early_fields_to_search, task = early_queries.pop(index)
+        if (
+            early_query_output == query_output.model_dump()
+            and early_fields_to_search == fields_to_search
+        ):
+            return task
+
+        task.cancel()
+        return None
+
+    def _cancel_early_queries(
+        self, early_queries: dict[int, tuple[dict, dict, asyncio.Task]]
+    ) -> None:
+        for _, _, task in early_queries.values():
+            task.cancel()
+        early_queries.clear()
+
     async def __call__(
         self,
         tree_data: TreeData,
@@ -230,9 +367,6 @@ class Query(Tool):
         if self.logger:
             self.logger.debug(f"Collection names received: {collection_names}")
 
-        # Set up the dspy model
-        query_creator_prompt = QueryCreatorPrompt
-
         # check if collections are vectorised
         vectorised = any(
             (
@@ -245,22 +379,8 @@ class Query(Tool):
             for collection_name in collection_names
         )
 
-        if vectorised:
-            query_creator_prompt = query_creator_prompt.append(
-                name="query_outputs",
-                type_=Union[list[QueryOutput], None],
-                field=dspy.OutputField(
-                    desc=construct_query_output_prompt(True),
-                ),
-            )
-        else:
-            query_creator_prompt = query_creator_prompt.append(
-                name="query_outputs",
-                type_=Union[list[NonVectorisedQueryOutput], None],
-                field=dspy.OutputField(
-                    desc=construct_query_output_prompt(False),
-                ),
-            )
+        # Set up the dspy model
+        query_creator_prompt = _query_creator_prompt(vectorised)
 
         query_generator = ElysiaChainOfThought(
             query_creator_prompt,
@@ -306,347 +426,430 @@ class Query(Tool):
             if schemas[collection_name]["named_vectors"] is not None
         }
 
-        # Generate query with LLM
+        # Queries started while the LLM is still generating, keyed by their position in the query outputs
+        early_queries: dict[int, tuple[dict, dict, asyncio.Task]] = {}
+
         try:
-            if tree_data.settings.USE_FEEDBACK:
-                query, example_uuids = (
-                    await query_generator.aforward_with_feedback_examples(
-                        feedback_model="query",
-                        client_manager=client_manager,
-                        base_lm=base_lm,
-                        complex_lm=complex_lm,
+            # Generate query with LLM
+            try:
+                if tree_data.settings.USE_FEEDBACK:
+                    query, example_uuids = (
+                        await query_generator.aforward_with_feedback_examples(
+                            feedback_model="query",
+                            client_manager=client_manager,
+                            base_lm=base_lm,
+                            complex_lm=complex_lm,
+                            available_collections=collection_names,
+                            previous_queries=previous_queries,
+                            collection_display_types=display_types,
+                            display_type_descriptions=display_type_descriptions,
+                            searchable_fields=searchable_fields,
+                            num_base_lm_examples=6,
+                            return_example_uuids=True,
+                        )
+                    )
+                elif tree_data.settings.EARLY_QUERY_EXECUTION:
+                    # fields_to_search is generated before query_outputs,
+                    # so each query can be executed as soon as it has been generated
+                    fields_to_search_text = ""
+                    fields_to_search = None
+                    query_output_stream = JSONListStream()
+                    num_query_outputs = 0
+
+                    async for chunk in query_generator.aforward_streaming(
+                        ["fields_to_search", "query_outputs"],
+                        lm=complex_lm,
+                        available_collections=collection_names,
+                        previous_queries=previous_queries,
+                        collection_display_types=display_types,
+                        display_type_descriptions=display_type_descriptions,
+                        searchable_fields=searchable_fields,
+                    ):
+                        if isinstance(chunk, dspy.Prediction):
+                            query = chunk
+                            continue
+
+                        field_name, text = chunk
+                        if field_name == "fields_to_search":
+                            fields_to_search_text += text
+                            continue
+
+                        if fields_to_search is None:
+                            try:
+                                fields_to_search = json.loads(fields_to_search_text)
+                            except json.JSONDecodeError:
+                                pass
+
+                        for item in query_output_stream.feed(text):
+                            early_query_args = self._early_query_args(
+                                item,
+                                vectorised,
+                                fields_to_search,
+                                schemas,
+                                searchable_fields,
+                                collection_names,
+                            )
+                            if early_query_args is not None:
+                                early_query_output, early_fields_to_search = (
+                                    early_query_args
+                                )
+                                task = asyncio.create_task(
+                                    self._execute_early_query(
+                                        client_manager,
+                                        early_query_output.model_copy(deep=True),
+                                        early_fields_to_search,
+                                        schemas,
+                                    )
+                                )
+                                task.add_done_callback(_retrieve_exception)
+                                early_queries[num_query_outputs] = (
+                                    early_query_output.model_dump(),
+                                    early_fields_to_search,
+                                    task,
+                                )
+                                if self.logger:
+                                    self.logger.debug(
+                                        f"Started early query: {early_query_output}"
+                                    )
+                            num_query_outputs += 1
+                else:
+                    query = await query_generator.aforward(
+                        lm=complex_lm,
                         available_collections=collection_names,
                         previous_queries=previous_queries,
                         collection_display_types=display_types,
                         display_type_descriptions=display_type_descriptions,
                         searchable_fields=searchable_fields,
-                        num_base_lm_examples=6,
-                        return_example_uuids=True,
                     )
-                )
-            else:
-                query = await query_generator.aforward(
-                    lm=complex_lm,
-                    available_collections=collection_names,
-                    previous_queries=previous_queries,
-                    collection_display_types=display_types,
-                    display_type_descriptions=display_type_descriptions,
-                    searchable_fields=searchable_fields,
-                )
 
-        except Exception as e:
-            yield Error(error_message=str(e))
-            return
+            except Exception as e:
+                yield Error(error_message=str(e))
+                return
 
-        if self.logger and query.query_outputs is not None:
-            self.logger.debug(f"Query: {query.query_outputs}")
-            self.logger.debug(f"Fields to search: {query.fields_to_search}")
-            self.logger.debug(f"Data display: {query.data_display}")
+            if self.logger and query.query_outputs is not None:
+                self.logger.debug(f"Query: {query.query_outputs}")
+                self.logger.debug(f"Fields to search: {query.fields_to_search}")
+                self.logger.debug(f"Data display: {query.data_display}")
 
-        # Yield results to front end
-        yield Response(text=query.message_update)
-        if tree_data.settings.USE_FEEDBACK:
-            yield FewShotExamples(uuids=example_uuids)
+            # Yield results to front end
+            yield Response(text=query.message_update)
+            if tree_data.settings.USE_FEEDBACK:
+                yield FewShotExamples(uuids=example_uuids)
+
+            # Return if model deems query impossible
+            if (
+                query.impossible
+                or query.query_outputs is None
+                or all(q is None for q in query.query_outputs)
+                or len(query.query_outputs) == 0
+            ):
 
-        # Return if model deems query impossible
-        if (
-            query.impossible
-            or query.query_outputs is None
-            or all(q is None for q in query.query_outputs)
-            or len(query.query_outputs) == 0
-        ):
+                for collection_name in collection_names:
+                    metadata = {
+                        "collection_name": collection_name,
+                        "impossible": tree_data.user_prompt,
+                        "impossible_reasoning": (
+                            query.reasoning
+                            if tree_data.settings.COMPLEX_USE_REASONING
+                            else ""
+                        ),
+                        "query_output": (
+                            query.query_outputs.model_dump()
+                            if query.query_outputs is not None
+                            else None
+                        ),
+                    }
+                    yield Retrieval([], metadata)
 
-            for collection_name in collection_names:
-                metadata = {
-                    "collection_name": collection_name,
-                    "impossible": tree_data.user_prompt,
-                    "impossible_reasoning": (
-                        query.reasoning
-                        if tree_data.settings.COMPLEX_USE_REASONING
-                        else ""
-                    ),
-                    "query_output": (
-                        query.query_outputs.model_dump()
-                        if query.query_outputs is not None
-                        else None
-                    ),
-                }
-                yield Retrieval([], metadata)
+                if self.logger:
+                    self.logger.warning(
+                        f"Model judged query to be impossible. Returning to the decision tree..."
+                    )
+                return
 
-            if self.logger:
-                self.logger.warning(
-                    f"Model judged query to be impossible. Returning to the decision tree..."
+            # extract and error handle the query output
+            for current_query_output in query.query_outputs:
+
+                current_query_output.target_collections = self._fix_collection_names(
+                    current_query_output.target_collections, schemas
                 )
-            return
 
-        # extract and error handle the query output
-        for current_query_output in query.query_outputs:
+                for collection_name in current_query_output.target_collections:
+                    if collection_name not in collection_names:
+                        yield Error(
+                            feedback=(
+                                f"Collection {collection_name} in target_collections field of the query output, "
+                                "but not found in the available collections. "
+                                "Make sure you are using the correct collection names."
+                            ),
+                        )
+                        return
 
-            current_query_output.target_collections = self._fix_collection_names(
-                current_query_output.target_collections, schemas
+            query.data_display = self._fix_collection_names_in_dict(
+                query.data_display, schemas
             )
+            query.fields_to_search = self._fix_collection_names_in_dict(
+                query.fields_to_search, schemas
+            )
+
+            for collection_name in query.data_display:
 
-            for collection_name in current_query_output.target_collections:
                 if collection_name not in collection_names:
                     yield Error(
                         feedback=(
-                            f"Collection {collection_name} in target_collections field of the query output, "
+                            f"Collection {collection_name} in data_display keys, "
                             "but not found in the available collections. "
                             "Make sure you are using the correct collection names."
                         ),
                     )
                     return
 
-        query.data_display = self._fix_collection_names_in_dict(
-            query.data_display, schemas
-        )
-        query.fields_to_search = self._fix_collection_names_in_dict(
-            query.fields_to_search, schemas
-        )
-
-        for collection_name in query.data_display:
-
-            if collection_name not in collection_names:
-                yield Error(
-                    feedback=(
-                        f"Collection {collection_name} in data_display keys, "
-                        "but not found in the available collections. "
-                        "Make sure you are using the correct collection names."
-                    ),
-                )
-                return
-
-        for collection_name in query.fields_to_search:
-            if collection_name not in collection_names:
-                yield Error(
-                    feedback=(
-                        f"Collection {collection_name} in fields_to_search keys, "
-                        "but not found in the available collections. "
-                        "Make sure you are using the correct collection names."
-                    ),
-                )
-                return
-
-        # if the fields_to_search is non-empty but there are no named vectors, ignore this and reset it
-        for collection_name in query.fields_to_search:
-            if query.fields_to_search[collection_name] is not None and (
-                schemas[collection_name]["named_vectors"] is None
-                or searchable_fields[collection_name] == []
-            ):
-                query.fields_to_search[collection_name] = None
+            for collection_name in query.fields_to_search:
+                if collection_name not in collection_names:
+                    yield Error(
+                        feedback=(
+                            f"Collection {collection_name} in fields_to_search keys, "
+                            "but not found in the available collections. "
+                            "Make sure you are using the correct collection names."
+                        ),
+                    )
+                    return
 
-        # Go through outputs for each unique query
-        for i, query_output in enumerate(query.query_outputs):
-            collection_names = query_output.target_collections.copy()
+            # if the fields_to_search is non-empty but there are no named vectors, ignore this and reset it
+            for collection_name in query.fields_to_search:
+                if query.fields_to_search[collection_name] is not None and (
+                    schemas[collection_name]["named_vectors"] is None
+                    or searchable_fields[collection_name] == []
+                ):
+                    query.fields_to_search[collection_name] = None
 
-            for collection_name in collection_names:
+            # Go through outputs for each unique query
+            for i, query_output in enumerate(query.query_outputs):
+                collection_names = query_output.target_collections.copy()
 
-                display_type = query.data_display[collection_name].display_type
+                for collection_name in collection_names:
 
-                # Evaluate if this collection/query needs chunking
-                needs_chunking = self._evaluate_needs_chunking(
-                    display_type,
-                    query_output.search_type,
-                    schemas[collection_name],
-                )
-                content_field, _ = self._evaluate_content_field(
-                    schemas[collection_name]["fields"],
-                )  # used for chunking
+                    display_type = query.data_display[collection_name].display_type
 
-                if needs_chunking and content_field is not None:
+                    # Evaluate if this collection/query needs chunking
+                    needs_chunking = self._evaluate_needs_chunking(
+                        display_type,
+                        query_output.search_type,
+                        schemas[collection_name],
+                    )
+                    content_field, _ = self._evaluate_content_field(
+                        schemas[collection_name]["fields"],
+                    )  # used for chunking
 
-                    if self.logger:
-                        self.logger.debug(f"Chunking {collection_name}")
+                    if needs_chunking and content_field is not None:
 
-                    # set up chunking (create reference in this collection)
-                    collection_chunker = AsyncCollectionChunker(collection_name)
-                    await collection_chunker.create_chunked_reference(
-                        content_field, client_manager
-                    )
+                        if self.logger:
+                            self.logger.debug(f"Chunking {collection_name}")
 
-                    # create a copy of the query output
-                    query_output_copy = query_output.model_copy(deep=True)
+                        # set up chunking (create reference in this collection)
+                        collection_chunker = AsyncCollectionChunker(collection_name)
+                        await collection_chunker.create_chunked_reference(
+                            content_field, client_manager
+                        )
 
-                    # update the limit to be larger
-                    query_output_copy.limit = query_output.limit * 3
+                        # create a copy of the query output
+                        query_output_copy = query_output.model_copy(deep=True)
+
+                        # update the limit to be larger
+                        query_output_copy.limit = query_output.limit * 3
+
+                        # update the collection to be the unchunked collection ONLY
+                        query_output_copy.target_collections = [collection_name]
+
+                        # run this augmented query for the unchunked collection
+                        async with client_manager.connect_to_async_client() as client:
+                            try:
+                                unchunked_response, _ = await execute_weaviate_query(
+                                    client,
+                                    query_output_copy,
+                                    reference_property="isChunked",
+                                    named_vector_fields=query.fields_to_search,
+                                    property_types={
+                                        collection_name: {field["name"]: field["type"]}
+                                        for field in schemas[collection_name]["fields"]
+                                    },
+                                    schema=schemas,
+                                )
+                            except QueryError as e:
+                                yield Error(feedback=str(e))
+                                continue
+                            except Exception as e:
+                                yield Error(error_message=str(e))
+                                continue
+
+                        # chunk the unchunked response
+                        yield Status(
+                            f"Chunking {len(unchunked_response[0].objects)} objects in {collection_name}..."
+                        )
+                        await collection_chunker(
+                            unchunked_response[0], content_field, client_manager
+                        )
 
-                    # update the collection to be the unchunked collection ONLY
-                    query_output_copy.target_collections = [collection_name]
+                        # modify the original query output to be the chunked collection
+                        for j, c in enumerate(query_output.target_collections):
+                            if c == collection_name:
+                                query_output.target_collections[j] = (
+                                    f"ELYSIA_CHUNKED_{collection_name.lower()}__"
+                                )
+                        query.fields_to_search[
+                            f"ELYSIA_CHUNKED_{collection_name.lower()}__"
+                        ] = None
+
+                        if self.logger:
+                            self.logger.debug(
+                                f"Chunked {collection_name} and updated query output to {query_output.target_collections}"
+                            )
 
-                    # run this augmented query for the unchunked collection
-                    async with client_manager.connect_to_async_client() as client:
-                        try:
-                            unchunked_response, _ = await execute_weaviate_query(
+                # Use the results of the query if it was already executed while the LLM was generating
+                early_query = self._take_early_query(
+                    early_queries, i, query_output, query.fields_to_search
+                )
+                if self.logger and early_query is not None:
+                    self.logger.debug(f"Using early query results for query {i}")
+
+                # Execute query within Weaviate
+                async with client_manager.connect_to_async_client() as client:
+                    try:
+                        if early_query is not None:
+                            responses, code_strings = await early_query
+                        else:
+                            responses, code_strings = await execute_weaviate_query(
                                 client,
-                                query_output_copy,
-                                reference_property="isChunked",
+                                query_output,
                                 named_vector_fields=query.fields_to_search,
                                 property_types={
-                                    collection_name: {field["name"]: field["type"]}
-                                    for field in schemas[collection_name]["fields"]
+                                    collection_name: {
+                                        field["name"]: field["type"]
+                                        for field in schemas[collection_name]["fields"]
+                                    }
+                                    for collection_name in collection_names
                                 },
                                 schema=schemas,
                             )
-                        except QueryError as e:
-                            yield Error(feedback=str(e))
-                            continue
-                        except Exception as e:
+                    except QueryError as e:
+                        yield Error(feedback=str(e))
+                        continue
+                    except Exception as e:
+                        for collection_name in collection_names:
                             yield Error(error_message=str(e))
-                            continue
+                        continue
 
-                    # chunk the unchunked response
                     yield Status(
-                        f"Chunking {len(unchunked_response[0].objects)} objects in {collection_name}..."
-                    )
-                    await collection_chunker(
-                        unchunked_response[0], content_field, client_manager
+                        f"Retrieved {sum(len(x.objects) for x in responses)} objects from {len(collection_names)} collections..."
                     )
 
-                    # modify the original query output to be the chunked collection
-                    for j, c in enumerate(query_output.target_collections):
-                        if c == collection_name:
-                            query_output.target_collections[j] = (
-                                f"ELYSIA_CHUNKED_{collection_name.lower()}__"
+                for k, (collection_name, response) in enumerate(
+                    zip(collection_names, responses)
+                ):
+                    if self.logger and self.logger.level <= 20:
+                        print(
+                            Panel.fit(
+                                code_strings[k],
+                                title=f"{collection_name} (Weaviate Query)",
+                                border_style="yellow",
+                                padding=(1, 1),
                             )
-                    query.fields_to_search[
-                        f"ELYSIA_CHUNKED_{collection_name.lower()}__"
-                    ] = None
-
-                    if self.logger:
-                        self.logger.debug(
-                            f"Chunked {collection_name} and updated query output to {query_output.target_collections}"
                         )
 
-            # Execute query within Weaviate
-            async with client_manager.connect_to_async_client() as client:
-                try:
-                    responses, code_strings = await execute_weaviate_query(
-                        client,
-                        query_output,
-                        named_vector_fields=query.fields_to_search,
-                        property_types={
-                            collection_name: {
-                                field["name"]: field["type"]
-                                for field in schemas[collection_name]["fields"]
-                            }
-                            for collection_name in collection_names
+                    # Get display type and summarise items bool
+                    display_type = query.data_display[collection_name].display_type
+                    summarise_items = query.data_display[
+                        collection_name
+                    ].summarise_items
+
+                    # get query output formatted
+                    query_output_formatted = query_output.model_dump()
+                    query_output_formatted["target_collections"] = collection_names
+
+                    # Get the objects from the response
+                    objects = []
+                    for obj in response.objects:
+                        objects.append({k: v for k, v in obj.properties.items()})
+                        objects[-1]["uuid"] = str(obj.uuid)
+
+                    # Write various metadata for LLM parsing
+                    metadata = {
+                        "collection_name": collection_name,
+                        "display_type": display_type,
+                        "needs_summarising": summarise_items,
+                        "query_text": query_output.search_query,
+                        "query_type": query_output.search_type,
+                        "chunked": self._evaluate_needs_chunking(
+                            display_type,
+                            query_output.search_type,
+                            schemas[collection_name],
+                        ),
+                        "query_output": query_output_formatted,
+                        "code": {
+                            "language": "python",
+                            "title": "Query",
+                            "text": code_strings[k],
                         },
-                        schema=schemas,
-                    )
-                except QueryError as e:
-                    yield Error(feedback=str(e))
-                    continue
-                except Exception as e:
-                    for collection_name in collection_names:
-                        yield Error(error_message=str(e))
-                    continue
-
-                yield Status(
-                    f"Retrieved {sum(len(x.objects) for x in responses)} objects from {len(collection_names)} collections..."
-                )
-
-            for k, (collection_name, response) in enumerate(
-                zip(collection_names, responses)
-            ):
-                if self.logger and self.logger.level <= 20:
-                    print(
-                        Panel.fit(
-                            code_strings[k],
-                            title=f"{collection_name} (Weaviate Query)",
-                            border_style="yellow",
-                            padding=(1, 1),
+                    }
+
+                    # Create the retrieval object
+                    if display_type in self.retrieval_map:
+                        output = self.retrieval_map[display_type](
+                            objects,
+                            metadata,
+                            mapping=(
+                                schemas[collection_name]["mappings"][display_type]
+                                if display_type != "table"
+                                else None
+                            ),
+                        )
+                    else:
+                        output = Retrieval(
+                            objects,
+                            metadata,
+                            payload_type=display_type,
+                            name=collection_name,
+                            mapping=(
+                                schemas[collection_name]["mappings"][display_type]
+                                if display_type != "table"
+                                else None
+                            ),
                         )
-                    )
-
-                # Get display type and summarise items bool
-                display_type = query.data_display[collection_name].display_type
-                summarise_items = query.data_display[collection_name].summarise_items
-
-                # get query output formatted
-                query_output_formatted = query_output.model_dump()
-                query_output_formatted["target_collections"] = collection_names
-
-                # Get the objects from the response
-                objects = []
-                for obj in response.objects:
-                    objects.append({k: v for k, v in obj.properties.items()})
-                    objects[-1]["uuid"] = str(obj.uuid)
-
-                # Write various metadata for LLM parsing
-                metadata = {
-                    "collection_name": collection_name,
-                    "display_type": display_type,
-                    "needs_summarising": summarise_items,
-                    "query_text": query_output.search_query,
-                    "query_type": query_output.search_type,
-                    "chunked": self._evaluate_needs_chunking(
-                        display_type,
-                        query_output.search_type,
-                        schemas[collection_name],
-                    ),
-                    "query_output": query_output_formatted,
-                    "code": {
-                        "language": "python",
-                        "title": "Query",
-                        "text": code_strings[k],
-                    },
-                }
-
-                # Create the retrieval object
-                if display_type in self.retrieval_map:
-                    output = self.retrieval_map[display_type](
-                        objects,
-                        metadata,
-                        mapping=(
-                            schemas[collection_name]["mappings"][display_type]
-                            if display_type != "table"
-                            else None
-                        ),
-                    )
-                else:
-                    output = Retrieval(
-                        objects,
-                        metadata,
-                        payload_type=display_type,
-                        name=collection_name,
-                        mapping=(
-                            schemas[collection_name]["mappings"][display_type]
-                            if display_type != "table"
-                            else None
-                        ),
-                    )
-
-                # If the display type is document or conversation, initialise the object (requires some async operations)
-                if isinstance(output, DocumentRetrieval) or isinstance(
-                    output, ConversationRetrieval
-                ):
-                    await output.async_init(client_manager)
 
-                if summarise_items and self.summariser_in_tree:
-                    if (
-                        "items_to_summarise"
-                        not in tree_data.environment.hidden_environment
+                    # If the display type is document or conversation, initialise the object (requires some async operations)
+                    if isinstance(output, DocumentRetrieval) or isinstance(
+                        output, ConversationRetrieval
                     ):
+                        await output.async_init(client_manager)
+
+                    if summarise_items and self.summariser_in_tree:
+                        if (
+                            "items_to_summarise"
+                            not in tree_data.environment.hidden_environment
+                        ):
+                            tree_data.environment.hidden_environment[
+                                "items_to_summarise"
+                            ] = []
                         tree_data.environment.hidden_environment[
                             "items_to_summarise"
-                        ] = []
-                    tree_data.environment.hidden_environment[
-                        "items_to_summarise"
-                    ].append(output)
-                else:
-                    yield output
-
-        # if successful, yield training update
-        yield TrainingUpdate(
-            module_name="query",
-            inputs={
-                "available_collections": collection_names,
-                "previous_queries": previous_queries,
-                "collection_display_types": display_types,
-                "searchable_fields": searchable_fields,
-                **tree_data.to_json(),
-            },
-            outputs=query.__dict__["_store"],
-        )
-        if self.logger:
-            self.logger.debug("Query Tool finished!")
+                        ].append(output)
+                    else:
+                        yield output
+
+            # if successful, yield training update
+            yield TrainingUpdate(
+                module_name="query",
+                inputs={
+                    "available_collections": collection_names,
+                    "previous_queries": previous_queries,
+                    "collection_display_types": display_types,
+                    "searchable_fields": searchable_fields,
+                },
+                outputs=query.__dict__["_store"],
+                tree_data=tree_data,
+            )
+            if self.logger:
+                self.logger.debug("Query Tool finished!")
+        finally:
+            # early queries whose results were not used are no longer needed
+            self._cancel_early_queries(early_queries)
@@ -1,12 +1,13 @@
 # Prompt Executors
 #
+import uuid
 import dspy
 import dspy.predict
 
 from elysia.util.elysia_chain_of_thought import ElysiaChainOfThought
 
 # LLM
-from elysia.objects import Response, Tool
+from elysia.objects import Response, TextDelta, Tool
 from elysia.tools.text.objects import TextWithTitle, TextWithCitations
 from elysia.tools.text.prompt_templates import (
     SummarizingPrompt,
@@ -17,6 +18,7 @@ from elysia.tools.text.prompt_templates import (
 # Objects
 from elysia.tree.objects import TreeData
 from elysia.util.client import ClientManager
+from elysia.util.streaming import JSONListStream
 
 
 class CitedSummarizer(Tool):
@@ -34,6 +36,7 @@ class CitedSummarizer(Tool):
             status="Summarizing...",
             inputs={},
             end=True,
+            availability_depends_on=["environment"],
         )
 
     async def is_tool_available(
@@ -65,9 +68,23 @@ class CitedSummarizer(Tool):
             message_update=False,
         )
 
-        summary = await summarizer.aforward(
-            lm=base_lm,
-        )
+        if tree_data.settings.STREAM_TEXT_RESPONSES:
+            # each cited text is sent once it has been fully generated
+            stream_id = str(uuid.uuid4())
+            cited_texts = JSONListStream()
+            spacer = ""
+            async for chunk in summarizer.aforward_streaming("cited_text", lm=base_lm):
+                if not isinstance(chunk, str):
+                    summary = chunk
+                    continue
+                for cited_text in cited_texts.feed(chunk):
+                    if isinstance(cited_text, dict) and cited_text.get("text"):
+                        yield TextDelta(spacer + cited_text["text"], stream_id)
+                        spacer = "" if cited_text["text"][-1].isspace() else " "
+        else:
+            summary = await summarizer.aforward(
+                lm=base_lm,
+            )
 
         yield TextWithCitations(
             cited_texts=summary.cited_text,
@@ -91,6 +108,7 @@ class Summarizer(Tool):
             status="Summarizing...",
             inputs={},
             end=True,
+            availability_depends_on=["environment"],
         )
 
     async def is_tool_available(
@@ -155,9 +173,17 @@ class TextResponse(Tool):
             message_update=False,
         )
 
-        output = await text_response.aforward(
-            lm=base_lm,
-        )
+        if tree_data.settings.STREAM_TEXT_RESPONSES:
+            stream_id = str(uuid.uuid4())
+            async for chunk in text_response.aforward_streaming("response", lm=base_lm):
+                if isinstance(chunk, str):
+                    yield TextDelta(chunk, stream_id)
+                else:
+                    output = chunk
+        else:
+            output = await text_response.aforward(
+                lm=base_lm,
+            )
 
         yield Response(text=output.response)
 
@@ -78,9 +78,9 @@ class Visualise(Tool):
                 module_name="visualise",
                 inputs={
                     "chart_type": chart_type,
-                    **tree_data.to_json(),
                 },
                 outputs=prediction.__dict__["_store"],
+                tree_data=tree_data,
             )
 
             if prediction.impossible:
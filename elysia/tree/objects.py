@@ -1,4 +1,5 @@
-from typing import Any
+import json
+from typing import Any, Callable
 from logging import Logger
 from datetime import datetime
 from pydantic import BaseModel, Field
@@ -8,7 +9,11 @@ from elysia.config import settings as environment_settings
 from elysia.objects import Result
 from elysia.util.client import ClientManager
 from elysia.util.parsing import format_dict_to_serialisable, remove_whitespace
-from copy import deepcopy
+from elysia.util.prompt_budget import PromptReductions
+from copy import copy, deepcopy
+from contextlib import contextmanager
+from contextvars import ContextVar
+from uuid import uuid4
 from weaviate.classes.query import Filter
 
 
@@ -65,13 +70,19 @@ class Environment:
         self,
         environment: dict[str, dict[str, Any]] | None = None,
         self_info: bool = True,
-        hidden_environment: dict[str, Any] = {},
+        hidden_environment: dict[str, Any] | None = None,
     ):
         if environment is None:
             environment = {}
+        if hidden_environment is None:
+            hidden_environment = {}
         self.environment = environment
         self.hidden_environment = hidden_environment
         self.self_info = self_info
+        self._version = 0
+        self._duplicate_index: dict[tuple[str, str], dict[str, str]] = {}
+        self._ref_index: dict[str, tuple[str, str, int, int]] = {}
+        self._result_info: dict[tuple[str, str], list[tuple[int, str | None]]] = {}
         if self_info:
             self.environment["SelfInfo"] = {}
             self.environment["SelfInfo"]["info"] = [
@@ -103,6 +114,109 @@ class Environment:
                 }
             ]
 
+        self._reindex_all()
+
+    @property
+    def version(self) -> int:
+        """
+        A counter that is incremented whenever the environment is changed via `add`, `add_objects`, `remove` or `replace`.
+        Changes made directly to `environment` or `hidden_environment` do not increment it, use `fingerprint` to detect those.
+        """
+        return self._version
+
+    def fingerprint(self) -> tuple:
+        """
+        A cheap, hashable summary of the environment, which changes when the environment changes.
+        Changes made via `add`, `add_objects`, `remove` or `replace` are always detected.
+        Changes made directly to `environment` or `hidden_environment` are detected when results, objects or hidden values are added, removed or replaced,
+        but not when an existing object or hidden value is modified in place, so tools should prefer the methods above.
+        """
+        return (
+            self._version,
+            tuple(
+                (
+                    tool_name,
+                    name,
+                    tuple(
+                        (id(result), len(result.get("objects", ())))
+                        for result in results
+                    ),
+                )
+                for tool_name, tool_results in self.environment.items()
+                for name, results in tool_results.items()
+            ),
+            tuple((key, id(value)) for key, value in self.hidden_environment.items()),
+        )
+
+    def snapshot(self) -> "Environment":
+        """
+        A cheap copy of the environment as it is now.
+        The lists of results are copied, but the results (and objects) within them are shared with this environment,
+        so the snapshot is unaffected by results later being added, removed or replaced, but should not be modified itself.
+        """
+        snapshot = copy(self)
+        snapshot.environment = {
+            tool_name: {name: list(results) for name, results in tool_results.items()}
+            for tool_name, tool_results in self.environment.items()
+        }
+        snapshot.hidden_environment = copy(self.hidden_environment)
+        snapshot._result_info = {
+            key: list(info) for key, info in self._result_info.items()
+        }
+        snapshot._duplicate_index = {
+            key: dict(index) for key, index in self._duplicate_index.items()
+        }
+        snapshot._ref_index = dict(self._ref_index)
+        return snapshot
+
+    @staticmethod
+    def _fingerprint(obj: dict) -> str:
+        """
+        A hashable fingerprint of the contents of an object, ignoring its `_REF_ID`.
+        Two objects with the same fingerprint are treated as duplicates.
+        """
+        contents = {key: value for key, value in obj.items() if key != "_REF_ID"}
+        try:
+            return json.dumps(contents, sort_keys=True, default=str)
+        except TypeError:
+            # e.g. keys of mixed types which cannot be sorted
+            return repr(contents)
+
+    @staticmethod
+    def _is_repeat(obj: dict) -> bool:
+        return obj.get("object_info") == "[repeat]" and len(obj) == 2
+
+    def _reindex(self, tool_name: str, name: str):
+        """
+        Rebuilds the duplicate and `_REF_ID` indices for the given `tool_name` and `name`
+        from the objects currently stored there.
+        """
+        self._ref_index = {
+            ref_id: location
+            for ref_id, location in self._ref_index.items()
+            if location[:2] != (tool_name, name)
+        }
+        index: dict[str, str] = {}
+        for i, env_item in enumerate(self.environment[tool_name][name]):
+            for j, obj in enumerate(env_item["objects"]):
+                if (
+                    isinstance(obj, dict)
+                    and "_REF_ID" in obj
+                    and not self._is_repeat(obj)
+                ):
+                    index.setdefault(self._fingerprint(obj), obj["_REF_ID"])
+                    self._ref_index.setdefault(obj["_REF_ID"], (tool_name, name, i, j))
+        self._duplicate_index[(tool_name, name)] = index
+
+    def _reindex_all(self):
+        self._duplicate_index = {}
+        self._ref_index = {}
+        for tool_name in self.environment:
+            if tool_name == "SelfInfo":
+                continue
+            for name in self.environment[tool_name]:
+                self._reindex(tool_name, name)
+
     def is_empty(self):
         """
         Check if the environment is empty.
@@ -150,6 +264,11 @@ class Environment:
 
         self.add_objects(tool_name, name, objects, metadata, include_duplicates)
 
+        # keep the result's own summary, used when the environment is rendered for the LLM
+        if len(objects) > 0 and (tool_name, name) in self._result_info:
+            version, _ = self._result_info[(tool_name, name)][-1]
+            self._result_info[(tool_name, name)][-1] = (version, result.llm_parse())
+
     def add_objects(
         self,
         tool_name: str,
@@ -184,6 +303,8 @@ class Environment:
         if name not in self.environment[tool_name]:
             self.environment[tool_name][name] = []
 
+        self._version += 1
+
         if len(objects) > 0:
             self.environment[tool_name][name].append(
                 {
@@ -191,35 +312,42 @@ class Environment:
                     "objects": [],
                 }
             )
+            self._result_info.setdefault((tool_name, name), []).append(
+                (self._version, None)
+            )
 
+            duplicate_index = self._duplicate_index.setdefault((tool_name, name), {})
             for i, obj in enumerate(objects):
                 # check if the object is already in the environment
-                obj_found = False
-                where_obj = None
-                for env_item in self.environment[tool_name][name]:
-                    if obj in env_item["objects"]:
-                        obj_found = True
-                        where_obj = env_item["objects"].index(obj)
-                        _REF_ID = env_item["objects"][where_obj]["_REF_ID"]
-                        break
-
-                if obj_found and not include_duplicates:
+                fingerprint = self._fingerprint(obj)
+                _REF_ID = duplicate_index.get(fingerprint)
+
+                if _REF_ID is not None and not include_duplicates:
                     self.environment[tool_name][name][-1]["objects"].append(
                         {
                             "object_info": f"[repeat]",
                             "_REF_ID": _REF_ID,
                         }
                     )
-                elif "_REF_ID" not in obj:
+                    continue
+
+                if "_REF_ID" not in obj:
                     _REF_ID = f"{tool_name}_{name}_{len(self.environment[tool_name][name])}_{i}"
-                    self.environment[tool_name][name][-1]["objects"].append(
-                        {
-                            "_REF_ID": _REF_ID,
-                            **obj,
-                        }
-                    )
-                else:
-                    self.environment[tool_name][name][-1]["objects"].append(obj)
+                    obj = {
+                        "_REF_ID": _REF_ID,
+                        **obj,
+                    }
+                self.environment[tool_name][name][-1]["objects"].append(obj)
+                duplicate_index.setdefault(fingerprint, obj["_REF_ID"])
+                self._ref_index.setdefault(
+                    obj["_REF_ID"],
+                    (
+                        tool_name,
+                        name,
+                        len(self.environment[tool_name][name]) - 1,
+                        len(self.environment[tool_name][name][-1]["objects"]) - 1,
+                    ),
+                )
 
     def remove(self, tool_name: str, name: str, index: int | None = None):
         """
@@ -236,10 +364,15 @@ class Environment:
         """
         if tool_name in self.environment:
             if name in self.environment[tool_name]:
+                self._version += 1
                 if index is None:
                     self.environment[tool_name][name] = []
+                    self._result_info.pop((tool_name, name), None)
                 else:
                     self.environment[tool_name][name].pop(index)
+                    if self._info_aligned(tool_name, name, offset=1):
+                        self._result_info[(tool_name, name)].pop(index)
+                self._reindex(tool_name, name)
 
     def replace(
         self,
@@ -264,6 +397,7 @@ class Environment:
         """
         if tool_name in self.environment:
             if name in self.environment[tool_name]:
+                self._version += 1
                 if index is None:
                     self.environment[tool_name][name] = [
                         {
@@ -271,11 +405,18 @@ class Environment:
                             "objects": objects,
                         }
                     ]
+                    self._result_info[(tool_name, name)] = [(self._version, None)]
                 else:
                     self.environment[tool_name][name][index] = {
                         "metadata": metadata,
                         "objects": objects,
                     }
+                    if self._info_aligned(tool_name, name):
+                        self._result_info[(tool_name, name)][index] = (
+                            self._version,
+                            None,
+                        )
+                self._reindex(tool_name, name)
 
     def find(self, tool_name: str, name: str, index: int | None = None):
         """
@@ -305,6 +446,191 @@ class Environment:
         else:
             return self.environment[tool_name][name][index]
 
+    def _info_aligned(self, tool_name: str, name: str, offset: int = 0) -> bool:
+        """
+        Whether the stored result information lines up with the results for `tool_name` and `name`,
+        which is not the case if the environment has been modified directly.
+        """
+        return len(self._result_info.get((tool_name, name), [])) == (
+            len(self.environment[tool_name][name]) + offset
+        )
+
+    def render(
+        self,
+        token_budget: int | None = None,
+        user_prompt: str = "",
+        max_text_length: int = 1000,
+    ) -> dict:
+        """
+        Renders the environment for use as an LLM input, within an (approximate) token budget.
+        The environment itself is unchanged, so tools still have access to all the data.
+
+        Results are added in order of priority: results which mention terms from the `user_prompt` come first,
+        then the most recently added results. Within each result, `[repeat]` objects are collapsed into a single item
+        and any long strings are truncated.
+        Results that do not fit in full are included with as many objects as fit, or otherwise replaced by their summary
+        (the `llm_parse()` of the original Result). Results that do not fit at all are left out.
+
+        Args:
+            token_budget (int | None): The approximate number of tokens the rendered environment should fit in.
+                If `None`, the environment is returned as is.
+            user_prompt (str): The user's prompt, used to prioritise relevant results.
+            max_text_length (int): The maximum number of characters of any string in the objects or metadata.
+                Longer strings are truncated.
+
+        Returns:
+            (dict): The rendered environment, keyed in the same way as the environment.
+        """
+        if token_budget is None:
+            return self.environment
+
+        rendered: dict[str, dict[str, dict[int, dict]]] = {}
+        remaining = token_budget
+
+        if "SelfInfo" in self.environment:
+            remaining -= _estimate_tokens(self.environment["SelfInfo"])
+
+        prompt_terms = {term for term in user_prompt.lower().split() if len(term) > 3}
+
+        candidates = []
+        for tool_name, tool_results in self.environment.items():
+            if tool_name == "SelfInfo":
+                continue
+            for name, results in tool_results.items():
+                aligned = self._info_aligned(tool_name, name)
+                for i, result in enumerate(results):
+                    version, summary = (
+                        self._result_info[(tool_name, name)][i]
+                        if aligned
+                        else (0, None)
+                    )
+                    if summary is None:
+                        summary = (
+                            f"Displayed: {len(result['objects'])} objects "
+                            f"from '{tool_name}' ({name})."
+                        )
+                    header = f"{tool_name} {name} {summary}".lower()
+                    relevant = any(term in header for term in prompt_terms)
+                    candidates.append(
+                        ((relevant, version, -i), tool_name, name, i, result, summary)
+                    )
+
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+
+        for _, tool_name, name, i, result, summary in candidates:
+            objects = _collapse_repeats(result["objects"])
+            metadata = _truncate_strings(result["metadata"], max_text_length)
+            entry = {"metadata": metadata, "objects": []}
+            cost = _estimate_tokens(entry)
+
+            for obj in objects:
+                obj = _truncate_strings(obj, max_text_length)
+                obj_cost = _estimate_tokens(obj)
+                if cost + obj_cost > remaining:
+                    break
+                entry["objects"].append(obj)
+                cost += obj_cost
+
+            if len(entry["objects"]) < len(objects):
+                # make room for the summary and a note of how many objects are missing
+                summary_cost = _estimate_tokens(summary) + 10
+                while len(entry["objects"]) > 0 and cost + summary_cost > remaining:
+                    cost -= _estimate_tokens(entry["objects"].pop())
+                omitted = len(objects) - len(entry["objects"])
+                if len(entry["objects"]) > 0:
+                    entry["summary"] = summary
+                    entry["objects"].append(f"[{omitted} more objects not shown]")
+                    cost += summary_cost
+                else:
+                    entry = {"summary": summary}
+                    cost = _estimate_tokens(entry)
+
+            if cost > remaining:
+                continue
+
+            remaining -= cost
+            rendered.setdefault(tool_name, {}).setdefault(name, {})[i] = entry
+
+        output = {}
+        if "SelfInfo" in self.environment:
+            output["SelfInfo"] = self.environment["SelfInfo"]
+        for tool_name, tool_results in self.environment.items():
+            if tool_name not in rendered:
+                continue
+            output[tool_name] = {
+                name: [
+                    rendered[tool_name][name][i]
+                    for i in sorted(rendered[tool_name][name])
+                ]
+                for name in tool_results
+                if name in rendered[tool_name]
+            }
+        return output
+
+    def locate_ref_id(self, ref_id: str) -> tuple[str, str, int, int] | None:
+        """
+        Finds where the object with the given `_REF_ID` is stored in the environment.
+        Objects marked as a `[repeat]` resolve to the original object.
+
+        Args:
+            ref_id (str): The `_REF_ID` of the object.
+
+        Returns:
+            (tuple[str, str, int, int]): The `tool_name`, `name`, index of the result and position of the object within the result,
+                so that the object is at `environment[tool_name][name][index]["objects"][position]`.
+            (None): If no object with the given `_REF_ID` is in the environment.
+        """
+        location = self._ref_index.get(ref_id)
+        if location is not None and not self._location_matches(ref_id, location):
+            # the environment has been modified outside of the add/remove/replace methods
+            self._reindex_all()
+            location = self._ref_index.get(ref_id)
+        return location
+
+    def _location_matches(self, ref_id: str, location: tuple[str, str, int, int]):
+        tool_name, name, index, position = location
+        try:
+            obj = self.environment[tool_name][name][index]["objects"][position]
+        except (KeyError, IndexError):
+            return False
+        return isinstance(obj, dict) and obj.get("_REF_ID") == ref_id
+
+    def find_by_ref_id(self, ref_id: str) -> dict | None:
+        """
+        Finds an object in the environment by its `_REF_ID`.
+        Objects marked as a `[repeat]` resolve to the original object.
+
+        Args:
+            ref_id (str): The `_REF_ID` of the object.
+
+        Returns:
+            (dict): The object with the given `_REF_ID`.
+            (None): If no object with the given `_REF_ID` is in the environment.
+        """
+        location = self.locate_ref_id(ref_id)
+        if location is None:
+            return None
+        tool_name, name, index, position = location
+        return self.environment[tool_name][name][index]["objects"][position]
+
+    def find_by_ref_ids(self, ref_ids: list[str]) -> dict[str, dict]:
+        """
+        Finds multiple objects in the environment by their `_REF_ID`s.
+
+        Args:
+            ref_ids (list[str]): The `_REF_ID`s of the objects.
+
+        Returns:
+            (dict[str, dict]): A dictionary mapping each `_REF_ID` to its object.
+                `_REF_ID`s that are not in the environment are omitted.
+        """
+        objects = {}
+        for ref_id in ref_ids:
+            obj = self.find_by_ref_id(ref_id)
+            if obj is not None:
+                objects[ref_id] = obj
+        return objects
+
     def to_json(self, remove_unserialisable: bool = False):
         """
         Converts the environment to a JSON serialisable format.
@@ -342,6 +668,46 @@ class Environment:
         )
 
 
+def _estimate_tokens(value: Any) -> int:
+    """
+    A rough estimate of the number of tokens in the JSON form of a value (around four characters per token).
+    """
+    return len(json.dumps(value, default=str)) // 4 + 1
+
+
+def _truncate_strings(value: Any, max_length: int) -> Any:
+    """
+    Copies a (nested) value, with any strings longer than `max_length` characters truncated.
+    """
+    if isinstance(value, str) and len(value) > max_length:
+        return value[:max_length] + "... [truncated]"
+    elif isinstance(value, dict):
+        return {key: _truncate_strings(item, max_length) for key, item in value.items()}
+    elif isinstance(value, list):
+        return [_truncate_strings(item, max_length) for item in value]
+    return value
+
+
+def _collapse_repeats(objects: list) -> list:
+    """
+    Replaces all `[repeat]` objects in a list of objects with a single item listing their `_REF_ID`s.
+    """
+    collapsed = []
+    repeated_ref_ids = []
+    for obj in objects:
+        if isinstance(obj, dict) and Environment._is_repeat(obj):
+            repeated_ref_ids.append(obj["_REF_ID"])
+        else:
+            collapsed.append(obj)
+
+    if len(repeated_ref_ids) > 0:
+        object_info = (
+            f"[repeat] {len(repeated_ref_ids)} objects already in the environment"
+        )
+        collapsed.append({"object_info": object_info, "_REF_IDs": repeated_ref_ids})
+    return collapsed
+
+
 def datetime_reference():
     date: datetime = datetime.now()
     return {
@@ -542,6 +908,13 @@ class CollectionData:
         )
 
 
+# the task and prompt reductions of actions run concurrently on the same tree data (see `TreeData.task_context`),
+# keyed by the tree data. Each asyncio task has its own copy of this, so concurrent actions do not see each other's task
+_task_contexts: ContextVar[dict[str, tuple[str, PromptReductions]]] = ContextVar(
+    "task_contexts", default={}
+)
+
+
 class TreeData:
     """
     Store of data across the tree.
@@ -608,6 +981,10 @@ class TreeData:
         else:
             self.conversation_history = conversation_history
 
+        # rolling summary of the messages before the conversation history window
+        self.conversation_summary = ""
+        self.num_summarised_messages = 0
+
         if environment is None:
             self.environment = Environment()
         else:
@@ -636,9 +1013,16 @@ class TreeData:
         self.collection_names = []
 
         # -- Errors --
+        self._context_id = str(uuid4())
         self.errors: dict[str, list[str]] = {}
         self.current_task = None
 
+        # -- Prompts shrunk to fit the prompt token budget, until reported by the tree --
+        self._prompt_reductions = PromptReductions()
+
+        # -- Tasks Completed Index --
+        self._index_tasks_completed()
+
     def set_property(self, property: str, value: Any):
         self.__dict__[property] = value
 
@@ -664,6 +1048,51 @@ class TreeData:
     def soft_reset(self):
         self.previous_reasoning = {}
 
+    @property
+    def current_task(self) -> str | None:
+        task_context = _task_contexts.get().get(self._context_id)
+        if task_context is not None:
+            return task_context[0]
+        return self.__dict__.get("current_task")
+
+    @current_task.setter
+    def current_task(self, task: str | None):
+        self.__dict__["current_task"] = task
+
+    @contextmanager
+    def task_context(self, task: str):
+        """
+        Within this context, `current_task` is `task` and prompt reductions are collected separately,
+        for the current asyncio task only.
+        Used to run several actions concurrently on the same tree data, without them using each other's task (e.g. for errors).
+
+        Yields:
+            (PromptReductions): The prompts shrunk to fit the prompt token budget within this context.
+        """
+        prompt_reductions = PromptReductions()
+        token = _task_contexts.set(
+            {**_task_contexts.get(), self._context_id: (task, prompt_reductions)}
+        )
+        try:
+            yield prompt_reductions
+        finally:
+            _task_contexts.reset(token)
+
+    def add_prompt_reduction(self, reduction: dict):
+        task_context = _task_contexts.get().get(self._context_id)
+        if task_context is not None:
+            task_context[1].append(reduction)
+        else:
+            self._prompt_reductions.append(reduction)
+
+    def pop_prompt_reductions(self) -> list[dict]:
+        """
+        Returns the prompts that have been shrunk to fit the prompt token budget since this was last called.
+        """
+        reductions = list(self._prompt_reductions)
+        self._prompt_reductions.clear()
+        return reductions
+
     def _update_task(self, task_dict, key, value):
         if value is not None:
             if key in task_dict:
@@ -682,64 +1111,69 @@ class TreeData:
                 # If key does not exist, create it
                 task_dict[key] = value
 
+    def _tasks_completed_state(self) -> tuple:
+        return (
+            id(self.tasks_completed),
+            len(self.tasks_completed),
+            len(self.tasks_completed[-1]["task"]) if self.tasks_completed else 0,
+        )
+
+    def _index_tasks_completed(self):
+        """
+        Builds the index of tasks completed, keyed by (prompt, task, iteration),
+        and clears the cache of the rendered tasks completed string.
+        """
+        self._prompt_index: dict[str, int] = {}
+        self._task_index: dict[tuple[str, str, int], tuple[int, dict]] = {}
+        for j, task_prompt in enumerate(self.tasks_completed):
+            self._prompt_index[task_prompt["prompt"]] = j
+            for task in task_prompt["task"]:
+                key = (task_prompt["prompt"], task["task"], task["iteration"])
+                self._task_index[key] = (j, task)
+
+        # a dict, so that shallow copies of the tree data share the cache
+        self._rendered_tasks_completed: dict[str, Any] = {
+            "prompts": [None] * len(self.tasks_completed),
+            "string": None,
+        }
+        self._indexed_state = self._tasks_completed_state()
+
+    def _check_tasks_completed_index(self):
+        # tasks_completed has been replaced or added to outside of update_tasks_completed
+        if self._indexed_state != self._tasks_completed_state():
+            self._index_tasks_completed()
+
     def update_tasks_completed(
         self, prompt: str, task: str, num_trees_completed: int, **kwargs
     ):
-        # search to see if the current prompt already has an entry for this task
-        prompt_found = False
-        task_found = False
-        iteration_found = False
-
-        for i, task_prompt in enumerate(self.tasks_completed):
-            if task_prompt["prompt"] == prompt:
-                prompt_found = True
-                for j, task_j in enumerate(task_prompt["task"]):
-                    if task_j["task"] == task:
-                        task_found = True
-                        task_i = j  # position of the task in the prompt
-
-                    if task_j["iteration"] == num_trees_completed:
-                        iteration_found = True
-
-        # If the prompt is not found, add it to the list
-        if not prompt_found:
-            self.tasks_completed.append({"prompt": prompt, "task": [{}]})
-            self.tasks_completed[-1]["task"][0]["task"] = task
-            self.tasks_completed[-1]["task"][0]["iteration"] = num_trees_completed
-            for kwarg in kwargs:
-                self._update_task(
-                    self.tasks_completed[-1]["task"][0], kwarg, kwargs[kwarg]
-                )
-            return
+        self._check_tasks_completed_index()
 
-        # If the prompt is found but the task is not, add it to the list
-        if prompt_found and not task_found:
-            self.tasks_completed[-1]["task"].append({})
-            self.tasks_completed[-1]["task"][-1]["task"] = task
-            self.tasks_completed[-1]["task"][-1]["iteration"] = num_trees_completed
+        # If the current prompt already has an entry for this task in this iteration, update the task
+        key = (prompt, task, num_trees_completed)
+        if key in self._task_index:
+            j, task_dict = self._task_index[key]
             for kwarg in kwargs:
-                self._update_task(
-                    self.tasks_completed[-1]["task"][-1], kwarg, kwargs[kwarg]
-                )
+                self._update_task(task_dict, kwarg, kwargs[kwarg])
+            self._rendered_tasks_completed["prompts"][j] = None
+            self._rendered_tasks_completed["string"] = None
             return
 
-        # task already exists in this query, but the iteration is new
-        if prompt_found and task_found and not iteration_found:
-            self.tasks_completed[-1]["task"].append({})
-            self.tasks_completed[-1]["task"][-1]["task"] = task
-            self.tasks_completed[-1]["task"][-1]["iteration"] = num_trees_completed
-            for kwarg in kwargs:
-                self._update_task(
-                    self.tasks_completed[-1]["task"][-1], kwarg, kwargs[kwarg]
-                )
-            return
-
-        # If the prompt is found and the task is found, update the task
-        if prompt_found and task_found:
-            for kwarg in kwargs:
-                self._update_task(
-                    self.tasks_completed[-1]["task"][task_i], kwarg, kwargs[kwarg]
-                )
+        # If the prompt is not found, add it to the list
+        if prompt not in self._prompt_index:
+            self.tasks_completed.append({"prompt": prompt, "task": []})
+            self._prompt_index[prompt] = len(self.tasks_completed) - 1
+            self._rendered_tasks_completed["prompts"].append(None)
+
+        # The task (or this iteration of the task) is new
+        task_dict = {"task": task, "iteration": num_trees_completed}
+        for kwarg in kwargs:
+            self._update_task(task_dict, kwarg, kwargs[kwarg])
+        self.tasks_completed[-1]["task"].append(task_dict)
+
+        self._task_index[key] = (len(self.tasks_completed) - 1, task_dict)
+        self._rendered_tasks_completed["prompts"][-1] = None
+        self._rendered_tasks_completed["string"] = None
+        self._indexed_state = self._tasks_completed_state()
 
     def set_current_task(self, task: str):
         self.current_task = task
@@ -756,40 +1190,146 @@ class TreeData:
         if task in self.errors:
             self.errors[task] = []
 
+    def snapshot(self) -> "TreeData":
+        """
+        A cheap copy of the tree data as it is now, for reading later (e.g. for training data or feedback).
+        Containers are copied, but the objects within them are shared, so this is much cheaper than a deepcopy.
+        The snapshot is unaffected by the tree later updating the environment, tasks completed or conversation history,
+        but should not be modified itself.
+        """
+        snapshot = copy(self)
+        for key, value in self.__dict__.items():
+            if isinstance(value, (list, dict)):
+                snapshot.__dict__[key] = copy(value)
+
+        snapshot.conversation_history = [
+            dict(message) for message in self.conversation_history
+        ]
+        snapshot.tasks_completed = [
+            {**task_prompt, "task": [dict(task) for task in task_prompt["task"]]}
+            for task_prompt in self.tasks_completed
+        ]
+        snapshot.errors = {task: list(errors) for task, errors in self.errors.items()}
+        snapshot.environment = self.environment.snapshot()
+        return snapshot
+
+    def fingerprint(self, fields: list[str]) -> tuple:
+        """
+        A cheap, hashable summary of some fields of the tree data, which changes when the tree updates those fields.
+        Used to avoid re-evaluating checks that only depend on these fields, e.g. `Tool.is_tool_available`.
+
+        Args:
+            fields (list[str]): The names of the fields to summarise, e.g. `["environment", "collection_names"]`.
+
+        Returns:
+            (tuple): A hashable tuple with one entry per field.
+        """
+        out = []
+        for field in fields:
+            value = getattr(self, field, None)
+            if field == "environment":
+                out.append((id(value), value.fingerprint()))
+            elif field == "conversation_history":
+                out.append((len(value), len(value[-1]["content"]) if value else 0))
+            elif field == "tasks_completed":
+                out.append((len(value), len(value[-1]["task"]) if value else 0))
+            elif field == "errors":
+                out.append(tuple((task, len(errors)) for task, errors in value.items()))
+            elif value is None or isinstance(value, (str, int, float, bool)):
+                out.append(value)
+            else:
+                out.append(repr(value))
+        return tuple(out)
+
+    def windowed_conversation_history(self) -> list[dict]:
+        """
+        The conversation history as shown to the LLM.
+        If `settings.CONVERSATION_HISTORY_WINDOW` is set, only the most recent messages are included verbatim,
+        preceded by a summary of the earlier conversation (`conversation_summary`).
+        Messages that have not been summarised yet are always included, so nothing is left out while a summary is being made.
+
+        Returns:
+            (list[dict]): The conversation history, in the same format as `conversation_history`.
+        """
+        window = self.settings.CONVERSATION_HISTORY_WINDOW
+        if window is None:
+            return self.conversation_history
+
+        start = min(
+            max(len(self.conversation_history) - window, 0),
+            self.num_summarised_messages,
+        )
+        messages = self.conversation_history[start:]
+        if start > 0 and self.conversation_summary != "":
+            messages = [
+                {
+                    "role": "assistant",
+                    "content": f"[Summary of the earlier conversation] {self.conversation_summary}",
+                }
+            ] + messages
+        return messages
+
+    def messages_to_summarise(self) -> tuple[int, int]:
+        """
+        The range of messages in the conversation history which are outside the window but not yet part of the summary.
+
+        Returns:
+            (tuple[int, int]): The start and end index of the messages to add to the summary.
+                These are equal if there is nothing to summarise.
+        """
+        window = self.settings.CONVERSATION_HISTORY_WINDOW
+        if window is None:
+            return self.num_summarised_messages, self.num_summarised_messages
+
+        end = max(len(self.conversation_history) - window, 0)
+        return self.num_summarised_messages, max(end, self.num_summarised_messages)
+
     def tasks_completed_string(self):
         """
         Output a nicely formatted string of the tasks completed so far, designed to be used in the LLM prompt.
         This is where the outputs of the `llm_message` fields are displayed.
         You can use this if you are interfacing with LLMs in tools, to help it understand the context of the tasks completed so far.
 
+        The string is cached, and only the prompts whose tasks have changed (via `update_tasks_completed`) are re-rendered.
+
         Returns:
             (str): A separated and formatted string of the tasks completed so far in an LLM-parseable format.
         """
-        out = ""
-        for j, task_prompt in enumerate(self.tasks_completed):
-            out += f"<prompt_{j+1}>\n"
-            out += f"Prompt: {task_prompt['prompt']}\n"
+        self._check_tasks_completed_index()
 
-            for i, task in enumerate(task_prompt["task"]):
-                out += f"<task_{i+1}>\n"
+        rendered = self._rendered_tasks_completed
+        if rendered["string"] is None:
+            for j, task_prompt in enumerate(self.tasks_completed):
+                if rendered["prompts"][j] is None:
+                    rendered["prompts"][j] = self._render_task_prompt(j, task_prompt)
+            rendered["string"] = "".join(rendered["prompts"])
 
-                if "action" in task and task["action"]:
-                    out += f"Chosen action: {task['task']} (this does not mean it has been completed, only that it was chosen) "
-                    out += "(Use the environment to judge if a task is completed)"
-                else:
-                    out += f"Chosen subcategory: {task['task']} (this action has not been completed, this is only a subcategory)"
+        return rendered["string"]
 
-                if "error" in task and task["error"]:
-                    out += f" (There was an error during this tool call)\n"
-                else:
-                    out += f" (Successfully completed)\n"
+    def _render_task_prompt(self, j: int, task_prompt: dict) -> str:
+        out = f"<prompt_{j+1}>\n"
+        out += f"Prompt: {task_prompt['prompt']}\n"
 
-                for key in task:
-                    if key != "task" and key != "action":
-                        out += f"{key.capitalize()}: {task[key]}\n"
+        for i, task in enumerate(task_prompt["task"]):
+            out += f"<task_{i+1}>\n"
 
-                out += f"</task_{i+1}>\n"
-            out += f"</prompt_{j+1}>\n"
+            if "action" in task and task["action"]:
+                out += f"Chosen action: {task['task']} (this does not mean it has been completed, only that it was chosen) "
+                out += "(Use the environment to judge if a task is completed)"
+            else:
+                out += f"Chosen subcategory: {task['task']} (this action has not been completed, this is only a subcategory)"
+
+            if "error" in task and task["error"]:
+                out += f" (There was an error during this tool call)\n"
+            else:
+                out += f" (Successfully completed)\n"
+
+            for key in task:
+                if key != "task" and key != "action":
+                    out += f"{key.capitalize()}: {task[key]}\n"
+
+            out += f"</task_{i+1}>\n"
+        out += f"</prompt_{j+1}>\n"
 
         return out
 
@@ -920,6 +1460,7 @@ class TreeData:
             k: v
             for k, v in self.__dict__.items()
             if k not in ["collection_data", "atlas", "environment", "settings"]
+            and not k.startswith("_")
         }
         out["collection_data"] = self.collection_data.to_json()
         out["atlas"] = self.atlas.model_dump()
@@ -945,3 +1486,211 @@ class TreeData:
             if item not in ["collection_data", "atlas", "environment", "settings"]:
                 tree_data.set_property(item, json_data[item])
         return tree_data
+
+
+class TreeHistory:
+    """
+    Append-only store of what the tree did for each user prompt (query), used for saving feedback.
+
+    Rather than storing a full copy of the tree data for every query, each record only stores what changed since the previous record:
+    - the tasks completed and conversation history from the first entry that changed (usually only new entries),
+    - the results added to (or removed from) the environment.
+    The other (small) fields of the tree data, e.g. the errors, hidden environment and settings, are copied for each record.
+
+    Environment results are not modified by the tree once they are added, so they are shared with the tree's environment rather than copied.
+    A snapshot of the tree data for a query is reconstructed from these changes when the record is accessed, e.g. `history[query_id]["tree_data"]`.
+    """
+
+    _fields_recorded_separately = [
+        "user_prompt",
+        "conversation_history",
+        "tasks_completed",
+        "environment",
+        "settings",
+        "collection_data",
+        "atlas",
+    ]
+
+    def __init__(self):
+        self.records: list[dict] = []
+        self.query_ids: dict[str, int] = {}
+        self._tree_data: TreeData | None = None
+        self._clear_latest()
+
+    def _clear_latest(self):
+        # the state of the tree data at the latest record, used to find what has changed
+        self._conversation_history: list[tuple[str, str]] = []
+        self._tasks_completed: list[dict] = []
+        self._environment: dict[tuple[str, str], list[dict]] = {}
+
+    @staticmethod
+    def _first_change(old: list, new: list, same: Callable[[Any, Any], bool]) -> int:
+        i = 0
+        while i < min(len(old), len(new)) and same(old[i], new[i]):
+            i += 1
+        return i
+
+    def record(self, query_id: str, tree_data: "TreeData", **kwargs):
+        """
+        Record the current state of the tree data for this query, as the changes since the previous record.
+
+        Args:
+            query_id (str): The id of the query.
+            tree_data (TreeData): The tree data at the end of the query.
+            **kwargs: Any other information about the query to store with the record (e.g. the decision history).
+                These are stored as-is, and not copied.
+        """
+        conversation_history = [
+            (message["role"], message["content"])
+            for message in tree_data.conversation_history
+        ]
+        i = self._first_change(
+            self._conversation_history, conversation_history, lambda a, b: a == b
+        )
+        conversation_change = (i, conversation_history[i:])
+        self._conversation_history = conversation_history
+
+        i = self._first_change(
+            self._tasks_completed, tree_data.tasks_completed, lambda a, b: a == b
+        )
+        tasks_completed_change = (i, deepcopy(tree_data.tasks_completed[i:]))
+        self._tasks_completed = self._tasks_completed[:i] + tasks_completed_change[1]
+
+        environment = tree_data.environment
+        environment_changes = {}
+        current_keys = set()
+        for tool_name, tool_results in environment.environment.items():
+            for name, results in tool_results.items():
+                key = (tool_name, name)
+                current_keys.add(key)
+                previous_results = self._environment.get(key, [])
+                i = self._first_change(previous_results, results, lambda a, b: a is b)
+                if i < len(previous_results) or i < len(results):
+                    environment_changes[key] = (
+                        i,
+                        results[i:],
+                        list(environment._result_info.get(key, [])),
+                    )
+                    self._environment[key] = list(results)
+
+        for key in list(self._environment.keys()):
+            if key not in current_keys:
+                environment_changes[key] = (0, [], [])
+                del self._environment[key]
+
+        # settings rarely change between queries, so an unchanged copy is shared with the previous record
+        settings = deepcopy(tree_data.settings.to_json())
+        if len(self.records) > 0 and self.records[-1]["settings"] == settings:
+            settings = self.records[-1]["settings"]
+
+        self.query_ids[query_id] = len(self.records)
+        self.records.append(
+            {
+                "query_id": query_id,
+                "user_prompt": tree_data.user_prompt,
+                "conversation_history": conversation_change,
+                "tasks_completed": tasks_completed_change,
+                "environment": environment_changes,
+                "environment_version": environment.version,
+                "hidden_environment": copy(environment.hidden_environment),
+                "self_info": environment.self_info,
+                "settings": settings,
+                # the other fields of the tree data, e.g. the errors and number of trees completed
+                "fields": self._copy_fields(
+                    {
+                        key: value
+                        for key, value in tree_data.__dict__.items()
+                        if not key.startswith("_")
+                        and key not in self._fields_recorded_separately
+                    }
+                ),
+                "info": kwargs,
+            }
+        )
+        self._tree_data = tree_data
+
+    @staticmethod
+    def _copy_fields(fields: dict) -> dict:
+        copied = {
+            key: copy(value) if isinstance(value, (list, dict)) else value
+            for key, value in fields.items()
+        }
+        copied["errors"] = {
+            task: list(errors) for task, errors in fields["errors"].items()
+        }
+        return copied
+
+    def _reconstruct(self, index: int) -> "TreeData":
+        conversation_history = []
+        tasks_completed = []
+        environment: dict[tuple[str, str], list[dict]] = {}
+        result_info: dict[tuple[str, str], list[tuple[int, str | None]]] = {}
+
+        for record in self.records[: index + 1]:
+            i, messages = record["conversation_history"]
+            conversation_history = conversation_history[:i] + messages
+
+            i, tasks = record["tasks_completed"]
+            tasks_completed = tasks_completed[:i] + tasks
+
+            for key, (i, results, info) in record["environment"].items():
+                environment[key] = environment.get(key, [])[:i] + results
+                result_info[key] = info
+
+        record = self.records[index]
+
+        environment_dict: dict[str, dict[str, list[dict]]] = {}
+        for (tool_name, name), results in environment.items():
+            if tool_name not in environment_dict:
+                environment_dict[tool_name] = {}
+            environment_dict[tool_name][name] = results
+
+        # the environment indexes the results when it is created
+        snapshot_environment = Environment(
+            environment=environment_dict,
+            self_info=record["self_info"],
+            hidden_environment=copy(record["hidden_environment"]),
+        )
+        snapshot_environment._version = record["environment_version"]
+        snapshot_environment._result_info = {
+            key: list(info) for key, info in result_info.items()
+        }
+
+        snapshot = TreeData(
+            collection_data=self._tree_data.collection_data,  # type: ignore
+            atlas=self._tree_data.atlas,  # type: ignore
+            user_prompt=record["user_prompt"],
+            conversation_history=[
+                {"role": role, "content": content}
+                for role, content in conversation_history
+            ],
+            environment=snapshot_environment,
+            tasks_completed=deepcopy(tasks_completed),
+            settings=Settings.from_json(deepcopy(record["settings"])),
+        )
+        for key, value in self._copy_fields(record["fields"]).items():
+            snapshot.set_property(key, value)
+
+        return snapshot
+
+    def __getitem__(self, query_id: str) -> dict:
+        index = self.query_ids[query_id]
+        return {
+            **self.records[index]["info"],
+            "tree_data": self._reconstruct(index),
+        }
+
+    def __contains__(self, query_id: str) -> bool:
+        return query_id in self.query_ids
+
+    def __len__(self) -> int:
+        return len(self.query_ids)
+
+    def keys(self):
+        return self.query_ids.keys()
+
+    def clear(self):
+        self.records = []
+        self.query_ids = {}
+        self._tree_data = None
+        self._clear_latest()
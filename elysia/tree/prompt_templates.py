@@ -263,3 +263,30 @@ class TitleCreatorPrompt(dspy.Signature):
         Remember, this is a title, an extremely succinct summary of the whole conversation.
         """.strip()
     )
+
+
+class ConversationSummaryPrompt(dspy.Signature):
+    """
+    You are an expert at summarising conversations between a user and an assistant.
+    You are given a summary of the conversation so far (which may be empty), and the messages that followed it.
+    Update the summary to include the new messages.
+    The summary will be used in place of these messages in future prompts, so keep any details that may be needed later,
+    such as what the user asked for, what data was retrieved and the answers that were given.
+    """
+
+    previous_summary: str = dspy.InputField(
+        description="The summary of the earlier conversation. Empty if there is no summary yet."
+    )
+    conversation: list[dict] = dspy.InputField(
+        description="""
+        The messages that followed the previous summary.
+        This is a list of dictionaries, with each dictionary containing a `role` and `content` key.
+        The `role` key can be either `user` or `assistant`.
+        """.strip(),
+    )
+    summary: str = dspy.OutputField(
+        description="""
+        The updated summary of the whole conversation, including both the previous summary and the new messages.
+        Be concise, no more than 200 words.
+        """.strip()
+    )
@@ -1,9 +1,12 @@
+import asyncio
+import hashlib
 import inspect
 import json
 import time
 import textwrap
 from copy import deepcopy
-from typing import AsyncGenerator, Literal
+from functools import partial
+from typing import AsyncGenerator, Callable, Coroutine, Literal
 
 import dspy
 from pympler import asizeof
@@ -26,6 +29,7 @@ from elysia.tree.util import (
     Decision,
     get_follow_up_suggestions,
     create_conversation_title,
+    summarise_conversation_history,
 )
 from elysia.objects import (
     Completed,
@@ -47,15 +51,25 @@ from elysia.tools.text.text import (
 )
 from elysia.tree.util import ForcedTextResponse
 from elysia.util.async_util import asyncio_run
-from elysia.tree.objects import CollectionData, TreeData, Atlas, Environment
+from elysia.tree.objects import (
+    CollectionData,
+    TreeData,
+    TreeHistory,
+    Atlas,
+    Environment,
+)
 from elysia.util.client import ClientManager
 from elysia.config import (
     check_base_lm_settings,
     check_complex_lm_settings,
     load_base_lm,
     load_complex_lm,
+    borrow_base_lm,
+    borrow_complex_lm,
+    load_answer_cache,
 )
 from elysia.util.objects import Tracker, TrainingUpdate, TreeUpdate
+from elysia.lm.lm_governor import lm_priority
 from elysia.util.parsing import remove_whitespace
 from elysia.util.collection import retrieve_all_collection_names
 
@@ -93,7 +107,8 @@ class Tree:
             conversation_id (str): The id of the conversation, e.g. "123-456",
                 unneeded outside of conversation management/hosting Elysia app
             low_memory (bool): Whether to run the tree in low memory mode.
-                If True, the tree will not load the (dspy) models within the tree.
+                If True, the tree will not load the (dspy) models within the tree,
+                and instead borrows them from a pool shared by all low memory trees in the process.
                 Set to False for normal operation.
             use_elysia_collections (bool): Whether to use weaviate collections as processed by Elysia.
                 If False, the tree will not use the processed collections.
@@ -135,7 +150,14 @@ class Tree:
         self.low_memory = low_memory
         self._base_lm = None
         self._complex_lm = None
+        self._base_lm_settings = None
+        self._complex_lm_settings = None
         self._config_modified = False
+        self._conversation_summary_task: asyncio.Task | None = None
+
+        # start the title and follow-up suggestions in the background when the final response starts
+        self.prefetch_title_and_suggestions = False
+        self._post_answer_tasks: dict[tuple, asyncio.Task] = {}
         self.root = None
 
         # Define the inputs to prompts
@@ -159,6 +181,10 @@ class Tree:
             logger=self.settings.logger,
         )
 
+        # Structures derived from the tree topology, rebuilt only when tools/branches change
+        self._topology_cache = {}
+        self._tool_availability_cache = {}
+
         # Set the initialisations
         self.tools = {}
         self.set_branch_initialisation(branch_initialisation)
@@ -170,13 +196,11 @@ class Tree:
 
         # some variables for storing feedback
         self.action_information = []
-        self.history = {}
+        self.history = TreeHistory()
         self.training_updates = []
 
         # -- Get the root node and construct the tree
-        self._get_root()
-        self.tree = {}
-        self._construct_tree(self.root, self.tree)
+        self._rebuild_tree()
 
         # initialise the returner (for frontend)
         self.returner = TreeReturner(
@@ -193,22 +217,42 @@ class Tree:
                 f"  - [magenta]{decision_node.id}[/magenta]: {list(decision_node.options.keys())}"
             )
 
+    def _lm_settings(self, provider: str | None, model: str | None) -> tuple:
+        # the API keys are passed to the LM when it is loaded, so a change to them needs a new LM
+        return (
+            provider,
+            model,
+            self.settings.MODEL_API_BASE,
+            tuple(self.settings.API_KEYS.items()),
+            self.settings.BASE_HEDGE_PERCENTILE,
+            self.settings.HEDGE_PROVIDER,
+            self.settings.HEDGE_MODEL,
+        )
+
     @property
     def base_lm(self) -> dspy.LM:
         if self.low_memory:
-            return load_base_lm(self.settings)
+            return borrow_base_lm(self.settings)
         else:
-            if self._base_lm is None:
+            lm_settings = self._lm_settings(
+                self.settings.BASE_PROVIDER, self.settings.BASE_MODEL
+            )
+            if self._base_lm is None or self._base_lm_settings != lm_settings:
                 self._base_lm = load_base_lm(self.settings)
+                self._base_lm_settings = lm_settings
             return self._base_lm
 
     @property
     def complex_lm(self) -> dspy.LM:
         if self.low_memory:
-            return load_complex_lm(self.settings)
+            return borrow_complex_lm(self.settings)
         else:
-            if self._complex_lm is None:
+            lm_settings = self._lm_settings(
+                self.settings.COMPLEX_PROVIDER, self.settings.COMPLEX_MODEL
+            )
+            if self._complex_lm is None or self._complex_lm_settings != lm_settings:
                 self._complex_lm = load_complex_lm(self.settings)
+                self._complex_lm_settings = lm_settings
             return self._complex_lm
 
     def multi_branch_init(self) -> None:
@@ -280,6 +324,7 @@ class Tree:
     def clear_tree(self) -> None:
         self.decision_nodes = {}
         self.root = None
+        self._clear_topology_cache()
 
     def set_branch_initialisation(self, initialisation: str | None) -> None:
         self.clear_tree()
@@ -345,6 +390,19 @@ class Tree:
         if self.root is None:
             raise ValueError("No root decision node found")
 
+    def _clear_topology_cache(self) -> None:
+        self._topology_cache = {}
+
+    def _rebuild_tree(self) -> None:
+        """
+        Reconstruct the tree (and clear anything derived from it) after its topology has changed,
+        i.e. a tool or branch has been added or removed.
+        """
+        self._get_root()
+        self.tree = {}
+        self._construct_tree(self.root, self.tree)
+        self._clear_topology_cache()
+
     def _construct_tree(
         self, node_id: str | None, tree: dict, branch: bool = True
     ) -> dict:
@@ -456,6 +514,9 @@ class Tree:
                 )
                 del self.decision_nodes[empty_branch]
 
+        if len(empty_branches) > 0:
+            self._rebuild_tree()
+
         return empty_branches
 
     def _get_function_inputs(self, tool_name: str, inputs: dict) -> dict:
@@ -519,7 +580,7 @@ class Tree:
         # conversation history is not reset
         # environment is not reset
         if self.low_memory:
-            self.history = {}
+            self.history.clear()
 
         self.recursion_counter = 0
         self.tree_data.num_trees_completed = 0
@@ -531,30 +592,87 @@ class Tree:
         self.retrieved_objects = []
         self.returner.set_tree_index(self.tree_index)
 
+        # titles and suggestions from the last prompt are not reused for this one
+        self._cancel_post_answer_tasks()
+
     def save_history(self, query_id: str, time_taken_seconds: float) -> None:
         """
         What the tree did, results for saving feedback.
         """
-        training_update = deepcopy(
-            [update.to_json() for update in self.training_updates]
-        )
-
-        self.history[query_id] = {
-            "num_trees_completed": self.tree_data.num_trees_completed,
-            "tree_data": deepcopy(self.tree_data),
-            "action_information": deepcopy(self.action_information),
-            "decision_history": [
-                item for sublist in deepcopy(self.decision_history) for item in sublist
+        self.history.record(
+            query_id,
+            self.tree_data,
+            num_trees_completed=self.tree_data.num_trees_completed,
+            # action information and decision history are new objects for each query, so are not copied
+            action_information=self.action_information,
+            decision_history=[
+                item for sublist in self.decision_history for item in sublist
             ],
-            "base_lm_used": self.settings.BASE_MODEL,
-            "complex_lm_used": self.settings.COMPLEX_MODEL,
-            "time_taken_seconds": time_taken_seconds,
-            "training_updates": training_update,
-            "initialisation": f"{self.branch_initialisation}",
-        }
+            base_lm_used=self.settings.BASE_MODEL,
+            complex_lm_used=self.settings.COMPLEX_MODEL,
+            time_taken_seconds=time_taken_seconds,
+            # serialised only when read (e.g. when creating feedback)
+            training_updates=self.training_updates,
+            initialisation=f"{self.branch_initialisation}",
+        )
         # can reset training updates now
         self.training_updates = []
 
+    def _store_cached_answer(
+        self, user_prompt: str, fingerprint: str, query_id: str
+    ) -> None:
+        payloads = [
+            payload
+            for payload in self.returner.store
+            if payload is not None
+            and payload["query_id"] == query_id
+            and payload["type"] != "user_prompt"
+        ]
+
+        # answers that needed error recovery are not replayed
+        if any(payload["type"] == "self_healing_error" for payload in payloads):
+            return
+
+        load_answer_cache(self.settings).set(  # type: ignore
+            user_prompt,
+            fingerprint,
+            payloads=payloads,
+            conversation=self.tree_data.conversation_history[1:],
+            environment=self.tree_data.environment.to_json(),
+        )
+
+    def _answer_cache_fingerprint(self) -> str:
+        """
+        A hash of everything (other than the prompt) that an answer depends on:
+        the Weaviate cluster, the models, the atlas, the tree structure,
+        and the collections in use with their (preprocessed) metadata.
+        """
+        collection_names = sorted(self.tree_data.collection_names)
+        fingerprint = json.dumps(
+            {
+                "wcd_url": self.settings.WCD_URL,
+                "base_lm": f"{self.settings.BASE_PROVIDER}/{self.settings.BASE_MODEL}",
+                "complex_lm": f"{self.settings.COMPLEX_PROVIDER}/{self.settings.COMPLEX_MODEL}",
+                "atlas": self.tree_data.atlas.model_dump(
+                    exclude={"datetime_reference"}
+                ),
+                "tree": {
+                    branch_id: sorted(decision_node.options)
+                    for branch_id, decision_node in self.decision_nodes.items()
+                },
+                "collection_names": collection_names,
+                "metadata": {
+                    collection_name: self.tree_data.collection_data.metadata.get(
+                        collection_name
+                    )
+                    for collection_name in collection_names
+                },
+            },
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(fingerprint.encode()).hexdigest()
+
     def set_start_time(self) -> None:
         self.start_time = time.time()
 
@@ -729,9 +847,7 @@ class Tree:
         self.tracker.add_tracker(tool_instance.name)
 
         # reconstruct tree
-        self._get_root()
-        self.tree = {}
-        self._construct_tree(self.root, self.tree)
+        self._rebuild_tree()
 
     def remove_tool(
         self,
@@ -844,9 +960,7 @@ class Tree:
         self.tracker.remove_tracker(tool_name)
 
         # reconstruct tree
-        self._get_root()
-        self.tree = {}
-        self._construct_tree(self.root, self.tree)
+        self._rebuild_tree()
 
     def add_branch(
         self,
@@ -978,9 +1092,7 @@ class Tree:
             self.remove_branch(old_root)
 
         # reconstruct tree
-        self._get_root()
-        self.tree = {}
-        self._construct_tree(self.root, self.tree)
+        self._rebuild_tree()
 
     def remove_branch(self, branch_id: str) -> None:
         """
@@ -1018,9 +1130,7 @@ class Tree:
             del self.decision_nodes[branch_id]
 
         # reconstruct tree
-        self._get_root()
-        self.tree = {}
-        self._construct_tree(self.root, self.tree)
+        self._rebuild_tree()
 
     def view(
         self,
@@ -1107,11 +1217,18 @@ class Tree:
         """
         Create a title for the tree (async) using the base LM.
         Also assigns the `conversation_title` attribute to the tree.
+        If a title is already being created for the current prompt (e.g. started in the background
+        when the final response started, see `prefetch_title_and_suggestions`), that title is returned instead.
 
         Returns:
             (str): The title for the tree.
         """
-        with ElysiaKeyManager(self.settings):
+        return await self._await_post_answer_task(
+            ("title",), self._create_conversation_title
+        )
+
+    async def _create_conversation_title(self) -> str:
+        with ElysiaKeyManager(self.settings), lm_priority("background"):
             self.conversation_title = await create_conversation_title(
                 self.tree_data.conversation_history, self.base_lm
             )
@@ -1127,11 +1244,61 @@ class Tree:
         """
         return asyncio_run(self.create_conversation_title_async())
 
+    def _summarise_conversation_history_in_background(self) -> None:
+        """
+        Start folding the messages outside the conversation history window (`settings.CONVERSATION_HISTORY_WINDOW`)
+        into the rolling conversation summary, using the base LM.
+        This runs as a background task so that it does not delay the tree's response.
+        If a summary is already being made, any remaining messages are summarised after the next prompt.
+        """
+        if (
+            self._conversation_summary_task is not None
+            and not self._conversation_summary_task.done()
+            and self._conversation_summary_task.get_loop() is asyncio.get_running_loop()
+        ):
+            return
+
+        start, end = self.tree_data.messages_to_summarise()
+        if start == end:
+            return
+
+        self._conversation_summary_task = asyncio.create_task(
+            self._summarise_conversation_history(self.tree_data, start, end)
+        )
+
+    async def _summarise_conversation_history(
+        self, tree_data: TreeData, start: int, end: int
+    ) -> None:
+        try:
+            with ElysiaKeyManager(self.settings), lm_priority("background"):
+                summary = await summarise_conversation_history(
+                    tree_data.conversation_summary,
+                    tree_data.conversation_history[start:end],
+                    self.base_lm,
+                )
+        except Exception as e:
+            self.settings.logger.warning(
+                f"Could not summarise the conversation history: {str(e)}"
+            )
+            return
+
+        tree_data.conversation_summary = summary
+        tree_data.num_summarised_messages = end
+
+    async def _wait_for_conversation_summary(self) -> None:
+        if (
+            self._conversation_summary_task is not None
+            and self._conversation_summary_task.get_loop() is asyncio.get_running_loop()
+        ):
+            await self._conversation_summary_task
+
     async def get_follow_up_suggestions_async(
         self, context: str | None = None, num_suggestions: int = 2
     ) -> list[str]:
         """
         Get follow-up suggestions for the current user prompt via a base model LLM call.
+        If suggestions with the same arguments are already being made for the current prompt (e.g. started in the background
+        when the final response started, see `prefetch_title_and_suggestions`), those suggestions are returned instead.
 
         E.g., if the user asks "What was the most recent Github Issue?",
             and the results show a message from 'Jane Doe',
@@ -1144,7 +1311,15 @@ class Tree:
         Returns:
             (list[str]): A list of follow-up suggestions
         """
-        with ElysiaKeyManager(self.settings):
+        return await self._await_post_answer_task(
+            ("suggestions", context, num_suggestions),
+            partial(self._get_follow_up_suggestions, context, num_suggestions),
+        )
+
+    async def _get_follow_up_suggestions(
+        self, context: str | None, num_suggestions: int
+    ) -> list[str]:
+        with ElysiaKeyManager(self.settings), lm_priority("background"):
             suggestions = await get_follow_up_suggestions(
                 self.tree_data,
                 self.suggestions,
@@ -1160,6 +1335,75 @@ class Tree:
         self.suggestions.extend(suggestions)
         return suggestions
 
+    def _post_answer_task(
+        self, key: tuple, create: Callable[[], Coroutine], prefetch: bool = False
+    ) -> asyncio.Task:
+        """
+        Returns the task creating the title or suggestions (`key`) for the current prompt, starting it if there is none,
+        so that concurrent requests for the same result share a single LM call.
+        Tasks started when the final response starts (`prefetch`) are kept until the next prompt, so later requests reuse their result.
+        Other tasks are only shared while they are running.
+        """
+        task = self._post_answer_tasks.get(key)
+        if (
+            task is not None
+            and task.get_loop() is asyncio.get_running_loop()
+            and not (task.done() and (task.cancelled() or task.exception() is not None))
+        ):
+            return task
+
+        task = asyncio.create_task(create())
+        self._post_answer_tasks[key] = task
+        task.add_done_callback(partial(self._post_answer_task_done, key, prefetch))
+        return task
+
+    async def _await_post_answer_task(
+        self, key: tuple, create: Callable[[], Coroutine]
+    ):
+        while True:
+            task = self._post_answer_task(key, create)
+            try:
+                # cancelling one request does not cancel the task shared with other requests
+                return await asyncio.shield(task)
+            except asyncio.CancelledError:
+                # but if the task itself was cancelled (see `_cancel_post_answer_tasks`), start again
+                if not task.cancelled():
+                    raise
+
+    def _post_answer_task_done(self, key: tuple, prefetch: bool, task: asyncio.Task):
+        if task.cancelled():
+            return
+        if task.exception() is not None and prefetch:
+            self.settings.logger.warning(
+                f"Could not create {key[0]} in the background: {str(task.exception())}"
+            )
+        if not prefetch and self._post_answer_tasks.get(key) is task:
+            del self._post_answer_tasks[key]
+
+    def _start_post_answer_tasks(self) -> None:
+        """
+        Start creating the conversation title (for the first prompt) and follow-up suggestions in the background,
+        once the final response to the prompt starts, if `prefetch_title_and_suggestions` is set.
+        """
+        if not self.prefetch_title_and_suggestions:
+            return
+
+        if self.tree_index == 0:
+            self._post_answer_task(
+                ("title",), self._create_conversation_title, prefetch=True
+            )
+        self._post_answer_task(
+            ("suggestions", None, 2),
+            partial(self._get_follow_up_suggestions, None, 2),
+            prefetch=True,
+        )
+
+    def _cancel_post_answer_tasks(self) -> None:
+        # the results would be out of date (the response did not end the prompt after all, or a new prompt started)
+        for task in self._post_answer_tasks.values():
+            task.cancel()
+        self._post_answer_tasks = {}
+
     def get_follow_up_suggestions(
         self,
         context: str | None = None,
@@ -1348,22 +1592,111 @@ class Tree:
             error,
         )
 
+    async def _collect_action_results(
+        self,
+        action_fn: Tool,
+        decision: Decision,
+        client_manager: ClientManager,
+        **kwargs,
+    ) -> list[Result | TreeUpdate | Error | TrainingUpdate | Text | Update]:
+        """
+        Run a single action to completion and collect everything it yields, without evaluating it.
+        Used when several independent actions are run concurrently, so their outputs can be added to the
+        environment afterwards in the order they were decided (and not the order they finished in).
+        Each action has its own task context (current task and prompt reductions) and timer, so the actions
+        running at the same time do not use each other's errors or have their tracking mixed up.
+        """
+        start_time = self.tracker.start_tracking(decision.function_name)
+
+        outputs = []
+        with self.tree_data.task_context(decision.function_name) as prompt_reductions:
+            async for result in action_fn(
+                tree_data=self.tree_data,
+                inputs=decision.function_inputs,
+                base_lm=self.base_lm,
+                complex_lm=self.complex_lm,
+                client_manager=client_manager,
+                **kwargs,
+            ):
+                outputs.append(result)
+
+        self.tracker.end_tracking(
+            decision.function_name,
+            decision.function_name,
+            self.base_lm if not self.low_memory else None,
+            self.complex_lm if not self.low_memory else None,
+            list(prompt_reductions),
+            start_time=start_time,
+        )
+        return outputs
+
+    async def _is_tool_available(
+        self,
+        tool_name: str,
+        client_manager: ClientManager,
+        base_lm: dspy.LM,
+        complex_lm: dspy.LM,
+    ) -> bool:
+        tool = self.tools[tool_name]
+        depends_on = getattr(tool, "availability_depends_on", None)
+
+        # tools that declare what they depend on are only re-evaluated when that changes
+        if depends_on is not None:
+            cache_key = (
+                id(tool),
+                client_manager.is_client,
+                self.tree_data.fingerprint(depends_on),
+            )
+            if (
+                tool_name in self._tool_availability_cache
+                and self._tool_availability_cache[tool_name][0] == cache_key
+            ):
+                return self._tool_availability_cache[tool_name][1]
+
+        is_available = await tool.is_tool_available(
+            tree_data=self.tree_data,
+            base_lm=base_lm,
+            complex_lm=complex_lm,
+            client_manager=client_manager,
+        )
+
+        if depends_on is not None:
+            self._tool_availability_cache[tool_name] = (cache_key, is_available)
+
+        return is_available
+
     async def _get_available_tools(
         self, current_decision_node: DecisionNode, client_manager: ClientManager
     ) -> tuple[list[str], list[tuple[str, str]]]:
+        tool_names = [
+            tool
+            for tool in current_decision_node.options.keys()
+            if current_decision_node.options[tool]["action"] is not None
+        ]
+
+        # evaluate all availability checks for this node concurrently
+        base_lm = self.base_lm
+        complex_lm = self.complex_lm
+        tool_availability = dict(
+            zip(
+                tool_names,
+                await asyncio.gather(
+                    *[
+                        self._is_tool_available(
+                            tool, client_manager, base_lm, complex_lm
+                        )
+                        for tool in tool_names
+                    ]
+                ),
+            )
+        )
+
         available_tools = []
         unavailable_tools = []
         for tool in current_decision_node.options.keys():
             if current_decision_node.options[tool]["action"] is None:
                 available_tools.append(tool)
-            elif "is_tool_available" in dir(self.tools[tool]) and await self.tools[
-                tool
-            ].is_tool_available(
-                tree_data=self.tree_data,
-                base_lm=self.base_lm,
-                complex_lm=self.complex_lm,
-                client_manager=client_manager,
-            ):
+            elif tool_availability[tool]:
                 available_tools.append(tool)
             else:
                 is_tool_available_doc = (
@@ -1386,6 +1719,17 @@ class Tree:
                 )
         return successive_actions
 
+    def _get_cached_successive_actions(self) -> dict:
+        """
+        The successive actions only depend on the tree topology, so are computed once per topology version.
+        """
+        if "successive_actions" not in self._topology_cache:
+            self._topology_cache["successive_actions"] = self._get_successive_actions(
+                successive_actions={},
+                current_options=self.tree["options"],
+            )
+        return self._topology_cache["successive_actions"]
+
     def log_token_usage(self) -> None:
         if not self.low_memory:
             avg_input_base = self.tracker.get_average_input_tokens("base_lm")
@@ -1428,6 +1772,25 @@ class Tree:
                     f"Complex Model Usage: [magenta]0[/magenta] calls"
                 )
 
+            cache_hits = sum(
+                self.tracker.get_cache_hits(model)
+                for model in ["base_lm", "complex_lm"]
+            )
+            cache_misses = sum(
+                self.tracker.get_cache_misses(model)
+                for model in ["base_lm", "complex_lm"]
+            )
+            if cache_hits + cache_misses > 0:
+                self.settings.logger.debug(
+                    f"LM Response Cache: [magenta]{cache_hits}[/magenta] hits, [magenta]{cache_misses}[/magenta] misses"
+                )
+
+            prompt_reductions = self.tracker.get_prompt_reductions()
+            if len(prompt_reductions) > 0:
+                self.settings.logger.debug(
+                    f"Prompts shrunk to fit the prompt token budget: [magenta]{len(prompt_reductions)}[/magenta]"
+                )
+
     async def async_run(
         self,
         user_prompt: str,
@@ -1436,7 +1799,6 @@ class Tree:
         training_route: str = "",
         query_id: str | None = None,
         close_clients_after_completion: bool = True,
-        _first_run: bool = True,
         **kwargs,
     ) -> AsyncGenerator[dict | None, None]:
         """
@@ -1453,372 +1815,493 @@ class Tree:
                 **self.settings.API_KEYS,
             )
 
-        # If training route is provided, split it into a list
-        if training_route != "":
-            route_list = training_route.split("/")
-        else:
-            route_list = []
+        # Initial steps for a new user prompt
+        self.settings.logger.debug(f"Style: {self.tree_data.atlas.style}")
+        self.settings.logger.debug(
+            f"Agent description: {self.tree_data.atlas.agent_description}"
+        )
+        self.settings.logger.debug(f"End goal: {self.tree_data.atlas.end_goal}")
 
-        # Some initial steps if this is the first run (no recursion yet)
-        if _first_run:
+        if query_id is None:
+            query_id = str(uuid.uuid4())
 
-            self.settings.logger.debug(f"Style: {self.tree_data.atlas.style}")
-            self.settings.logger.debug(
-                f"Agent description: {self.tree_data.atlas.agent_description}"
-            )
-            self.settings.logger.debug(f"End goal: {self.tree_data.atlas.end_goal}")
+        self.returner.add_prompt(user_prompt, query_id)
 
-            if query_id is None:
-                query_id = str(uuid.uuid4())
+        # Reset the tree (clear temporary data specific to the last user prompt)
+        self.soft_reset()
 
-            self.returner.add_prompt(user_prompt, query_id)
+        check_base_lm_settings(self.settings)
+        check_complex_lm_settings(self.settings)
 
-            # Reset the tree (clear temporary data specific to the last user prompt)
-            self.soft_reset()
+        # Initialise some objects
+        self.set_start_time()
+        self.query_id_to_prompt[query_id] = user_prompt
+        self.prompt_to_query_id[user_prompt] = query_id
+        self.tree_data.set_property("user_prompt", user_prompt)
+        self._update_conversation_history("user", user_prompt)
+        self.user_prompt = user_prompt
 
-            check_base_lm_settings(self.settings)
-            check_complex_lm_settings(self.settings)
+        # check and start clients if not already started
+        if client_manager.is_client:
+            await client_manager.start_clients()
 
-            # Initialise some objects
-            self.set_start_time()
-            self.query_id_to_prompt[query_id] = user_prompt
-            self.prompt_to_query_id[user_prompt] = query_id
-            self.tree_data.set_property("user_prompt", user_prompt)
-            self._update_conversation_history("user", user_prompt)
-            self.user_prompt = user_prompt
+            # Initialise the collections
+            if self.use_elysia_collections:
+                if collection_names == []:
+                    async with client_manager.connect_to_async_client() as client:
+                        collection_names = await retrieve_all_collection_names(client)
+                await self.set_collection_names(
+                    collection_names,
+                    client_manager,
+                )
 
-            # check and start clients if not already started
-            if client_manager.is_client:
-                await client_manager.start_clients()
+        # If there are any empty branches, remove them (no tools attached to them)
+        self._remove_empty_branches()
 
-                # Initialise the collections
-                if self.use_elysia_collections:
-                    if collection_names == []:
-                        async with client_manager.connect_to_async_client() as client:
-                            collection_names = await retrieve_all_collection_names(
-                                client
-                            )
-                    await self.set_collection_names(
-                        collection_names,
-                        client_manager,
-                    )
+        if self.settings.LOGGING_LEVEL_INT <= 20:
+            print(
+                Panel.fit(
+                    user_prompt,
+                    title="User prompt",
+                    border_style="yellow",
+                    padding=(1, 1),
+                )
+            )
 
-            # If there are any empty branches, remove them (no tools attached to them)
-            self._remove_empty_branches()
+        # Only the first prompt of a conversation is answered from (or stored in) the answer cache,
+        # as the answers to later prompts depend on the rest of the conversation (and environment)
+        answer_cache = load_answer_cache(self.settings)
+        use_answer_cache = (
+            answer_cache is not None
+            and training_route == ""
+            and len(self.tree_data.conversation_history) == 1
+            and self.tree_data.environment.is_empty()
+        )
+        if use_answer_cache:
+            answer_fingerprint = self._answer_cache_fingerprint()
+            cached_answer = answer_cache.get(  # type: ignore
+                user_prompt, answer_fingerprint
+            )
+            if cached_answer is not None:
+                self.settings.logger.debug(
+                    f"Replaying cached answer to: [italic]{cached_answer.prompt}[/italic]"
+                )
+                for payload in self.returner.replay(cached_answer.payloads, query_id):
+                    yield payload
 
-            if self.settings.LOGGING_LEVEL_INT <= 20:
-                print(
-                    Panel.fit(
-                        user_prompt,
-                        title="User prompt",
-                        border_style="yellow",
-                        padding=(1, 1),
+                for message in cached_answer.conversation:
+                    self._update_conversation_history(
+                        message["role"], message["content"]
                     )
+                self.tree_data.environment = Environment.from_json(
+                    deepcopy(cached_answer.environment)
                 )
 
-        # Start the tree at the root node
-        if self.root is not None:
-            current_decision_node: DecisionNode = self.decision_nodes[self.root]
-        else:
-            raise ValueError("No root node found!")
+                self.save_history(
+                    query_id=query_id,
+                    time_taken_seconds=time.time() - self.start_time,
+                )
+                yield await self.returner(Completed(), query_id=query_id)
+
+                if close_clients_after_completion and client_manager.is_client:
+                    await client_manager.close_clients()
+                return
 
-        # Loop through the tree until the end is reached
+        # Restart the tree from the root until the overall goal is completed
         while True:
 
-            available_tools, unavailable_tools = await self._get_available_tools(
-                current_decision_node, client_manager
-            )
+            # If training route is provided, split it into a list
+            if training_route != "":
+                route_list = training_route.split("/")
+            else:
+                route_list = []
 
-            if len(available_tools) == 0:
-                self.settings.logger.error("No tools available to use!")
-                raise ValueError(
-                    "No tools available to use! "
-                    "Check the tool definitions and the `is_tool_available` methods."
+            # Start the tree at the root node
+            if self.root is not None:
+                current_decision_node: DecisionNode = self.decision_nodes[self.root]
+            else:
+                raise ValueError("No root node found!")
+
+            # Loop through the tree until the end of a branch is reached
+            while True:
+
+                available_tools, unavailable_tools = await self._get_available_tools(
+                    current_decision_node, client_manager
                 )
 
-            init_options = deepcopy(self.tree["options"])
-            successive_actions = self._get_successive_actions(
-                successive_actions={},
-                current_options=init_options,
-            )
+                if len(available_tools) == 0:
+                    self.settings.logger.error("No tools available to use!")
+                    raise ValueError(
+                        "No tools available to use! "
+                        "Check the tool definitions and the `is_tool_available` methods."
+                    )
 
-            # Evaluate any tools which have hardcoded rules that have been met
-            nodes_with_rules_met, rule_tool_inputs = await self._check_rules(
-                current_decision_node.id, client_manager
-            )
+                successive_actions = self._get_cached_successive_actions()
 
-            if len(nodes_with_rules_met) > 0:
-                for rule in nodes_with_rules_met:
-                    rule_decision = Decision(rule, {}, "", False, False)
+                # Evaluate any tools which have hardcoded rules that have been met
+                nodes_with_rules_met, rule_tool_inputs = await self._check_rules(
+                    current_decision_node.id, client_manager
+                )
+
+                if len(nodes_with_rules_met) > 0:
+                    for rule in nodes_with_rules_met:
+                        rule_decision = Decision(rule, {}, "", False, False)
+                        with ElysiaKeyManager(self.settings):
+                            async for result in self.tools[rule](
+                                tree_data=self.tree_data,
+                                inputs=rule_tool_inputs[rule],
+                                base_lm=self.base_lm,
+                                complex_lm=self.complex_lm,
+                                client_manager=client_manager,
+                            ):
+                                action_result, _ = await self._evaluate_result(
+                                    result, rule_decision
+                                )
+                                if action_result is not None:
+                                    yield action_result
+
+                # If training route is provided, decide from the training route
+                if len(route_list) > 0:
+                    self.settings.logger.debug(f"Route that will be used: {route_list}")
+
+                    (
+                        self.current_decision,
+                        training_route,
+                    ) = current_decision_node.decide_from_route(route_list)
+
+                    force_text_response = (
+                        self.current_decision.function_name == "text_response"
+                    )
+
+                # Under normal circumstances decide from the decision node
+                else:
+                    self.tracker.start_tracking("decision_node")
+                    self.tree_data.set_current_task("elysia_decision_node")
                     with ElysiaKeyManager(self.settings):
-                        async for result in self.tools[rule](
+                        self.current_decision, results = await current_decision_node(
                             tree_data=self.tree_data,
-                            inputs=rule_tool_inputs[rule],
                             base_lm=self.base_lm,
                             complex_lm=self.complex_lm,
+                            available_tools=available_tools,
+                            unavailable_tools=unavailable_tools,
+                            successive_actions=successive_actions,
                             client_manager=client_manager,
-                        ):
-                            action_result, _ = await self._evaluate_result(
-                                result, rule_decision
-                            )
-                            if action_result is not None:
-                                yield action_result
-
-            # If training route is provided, decide from the training route
-            if len(route_list) > 0:
-                self.settings.logger.debug(f"Route that will be used: {route_list}")
-
-                (
-                    self.current_decision,
-                    training_route,
-                ) = current_decision_node.decide_from_route(route_list)
+                        )
 
-                force_text_response = (
-                    self.current_decision.function_name == "text_response"
-                )
+                    for result in results:
+                        action_result, _ = await self._evaluate_result(
+                            result, self.current_decision
+                        )
+                        if action_result is not None:
+                            yield action_result
 
-            # Under normal circumstances decide from the decision node
-            else:
-                self.tracker.start_tracking("decision_node")
-                self.tree_data.set_current_task("elysia_decision_node")
-                with ElysiaKeyManager(self.settings):
-                    self.current_decision, results = await current_decision_node(
-                        tree_data=self.tree_data,
-                        base_lm=self.base_lm,
-                        complex_lm=self.complex_lm,
-                        available_tools=available_tools,
-                        unavailable_tools=unavailable_tools,
-                        successive_actions=successive_actions,
-                        client_manager=client_manager,
+                    self.tracker.end_tracking(
+                        "decision_node",
+                        "Decision Node",
+                        self.base_lm if not self.low_memory else None,
+                        self.complex_lm if not self.low_memory else None,
+                        self.tree_data.pop_prompt_reductions(),
                     )
 
-                for result in results:
-                    action_result, _ = await self._evaluate_result(
-                        result, self.current_decision
+                    # Force text response (later) if model chooses end actions
+                    # but no response will be generated from the node, set flag now
+                    force_text_response = (
+                        not current_decision_node.options[
+                            self.current_decision.function_name
+                        ]["end"]
+                        and self.current_decision.end_actions
                     )
-                    if action_result is not None:
-                        yield action_result
 
-                self.tracker.end_tracking(
-                    "decision_node",
-                    "Decision Node",
-                    self.base_lm if not self.low_memory else None,
-                    self.complex_lm if not self.low_memory else None,
+                # Set default values for the function inputs for current call
+                self.current_decision.function_inputs = self._get_function_inputs(
+                    self.current_decision.function_name,
+                    self.current_decision.function_inputs,
                 )
 
-                # Force text response (later) if model chooses end actions
-                # but no response will be generated from the node, set flag now
-                force_text_response = (
-                    not current_decision_node.options[
-                        self.current_decision.function_name
-                    ]["end"]
-                    and self.current_decision.end_actions
+                # end criteria, task picked is "text_response" or model chooses to end conversation
+                completed = (
+                    self.current_decision.function_name == "text_response"
+                    or self.current_decision.end_actions
+                    or self.current_decision.impossible
+                    or self.tree_data.num_trees_completed
+                    > self.tree_data.recursion_limit
                 )
 
-            # Set default values for the function inputs for current call
-            self.current_decision.function_inputs = self._get_function_inputs(
-                self.current_decision.function_name,
-                self.current_decision.function_inputs,
-            )
+                # assign action function
+                action_fn: Tool | None = current_decision_node.options[
+                    self.current_decision.function_name
+                ][
+                    "action"
+                ]  # type: ignore
 
-            # end criteria, task picked is "text_response" or model chooses to end conversation
-            completed = (
-                self.current_decision.function_name == "text_response"
-                or self.current_decision.end_actions
-                or self.current_decision.impossible
-                or self.tree_data.num_trees_completed > self.tree_data.recursion_limit
-            )
+                # any independent actions chosen to run alongside the current decision
+                parallel_decisions = self.current_decision.parallel_decisions
+                for parallel_decision in parallel_decisions:
+                    parallel_decision.function_inputs = self._get_function_inputs(
+                        parallel_decision.function_name,
+                        parallel_decision.function_inputs,
+                    )
 
-            # assign action function
-            action_fn: Tool | None = current_decision_node.options[
-                self.current_decision.function_name
-            ][
-                "action"
-            ]  # type: ignore
+                for decision in [self.current_decision] + parallel_decisions:
+
+                    # update the decision history
+                    self.decision_history[-1].append(decision.function_name)
+
+                    # print the current node information
+                    if self.settings.LOGGING_LEVEL_INT <= 20:
+                        print(
+                            Panel.fit(
+                                f"[bold]Node:[/bold] [magenta]{current_decision_node.id}[/magenta]\n"
+                                f"[bold]Decision:[/bold] [green]{decision.function_name}[/green]\n"
+                                f"[bold]Reasoning:[/bold] {decision.reasoning}\n",
+                                title="Current Decision",
+                                border_style="magenta",
+                                padding=(1, 1),
+                            )
+                        )
 
-            # update the decision history
-            self.decision_history[-1].append(self.current_decision.function_name)
+                    self.tree_data.update_tasks_completed(
+                        prompt=self.user_prompt,
+                        task=decision.function_name,
+                        num_trees_completed=self.tree_data.num_trees_completed,
+                        reasoning=decision.reasoning,
+                        action=action_fn is not None,
+                    )
 
-            # print the current node information
-            if self.settings.LOGGING_LEVEL_INT <= 20:
-                print(
-                    Panel.fit(
-                        f"[bold]Node:[/bold] [magenta]{current_decision_node.id}[/magenta]\n"
-                        f"[bold]Decision:[/bold] [green]{self.current_decision.function_name}[/green]\n"
-                        f"[bold]Reasoning:[/bold] {self.current_decision.reasoning}\n",
-                        title="Current Decision",
-                        border_style="magenta",
-                        padding=(1, 1),
+                # this action gives the final response, so the title and suggestions can be made alongside it
+                final_response = (
+                    completed
+                    and action_fn is not None
+                    and bool(
+                        current_decision_node.options[
+                            self.current_decision.function_name
+                        ]["end"]
                     )
                 )
+                if final_response:
+                    self._start_post_answer_tasks()
 
-            self.tree_data.update_tasks_completed(
-                prompt=self.user_prompt,
-                task=self.current_decision.function_name,
-                num_trees_completed=self.tree_data.num_trees_completed,
-                reasoning=self.current_decision.reasoning,
-                action=action_fn is not None,
-            )
-
-            # evaluate the action if this is not a branch
-            if action_fn is not None:
-                self.tracker.start_tracking(self.current_decision.function_name)
-                self.tree_data.set_current_task(self.current_decision.function_name)
-                successful_action = True
-                with ElysiaKeyManager(self.settings):
-                    async for result in action_fn(
-                        tree_data=self.tree_data,
-                        inputs=self.current_decision.function_inputs,
-                        base_lm=self.base_lm,
-                        complex_lm=self.complex_lm,
-                        client_manager=client_manager,
-                        **kwargs,
-                    ):
-                        action_result, error = await self._evaluate_result(
-                            result, self.current_decision
+                # run independent actions concurrently, then evaluate their results in decision order
+                if action_fn is not None and len(parallel_decisions) > 0:
+                    action_decisions = [self.current_decision] + parallel_decisions
+                    with ElysiaKeyManager(self.settings):
+                        action_outputs = await asyncio.gather(
+                            *[
+                                self._collect_action_results(
+                                    current_decision_node.options[
+                                        decision.function_name
+                                    ][
+                                        "action"
+                                    ],  # type: ignore
+                                    decision,
+                                    client_manager,
+                                    **kwargs,
+                                )
+                                for decision in action_decisions
+                            ]
                         )
 
-                        if action_result is not None:
-                            yield action_result
+                    successful_actions = True
+                    for decision, outputs in zip(action_decisions, action_outputs):
+                        successful_action = True
+                        for result in outputs:
+                            action_result, error = await self._evaluate_result(
+                                result, decision
+                            )
 
-                        successful_action = not error and successful_action
+                            if action_result is not None:
+                                yield action_result
 
-                if not successful_action:
-                    completed = (
-                        False
-                        or self.tree_data.num_trees_completed
-                        > self.tree_data.recursion_limit
-                    )
+                            successful_action = not error and successful_action
 
-                if successful_action:
-                    self.tree_data.clear_error(self.current_decision.function_name)
+                        if successful_action:
+                            self.tree_data.clear_error(decision.function_name)
 
-                self.tracker.end_tracking(
-                    self.current_decision.function_name,
-                    self.current_decision.function_name,
-                    self.base_lm if not self.low_memory else None,
-                    self.complex_lm if not self.low_memory else None,
-                )
+                        successful_actions = successful_action and successful_actions
 
-            yield (
-                await self._evaluate_result(
-                    TreeUpdate(
-                        from_node=current_decision_node.id,
-                        to_node=self.current_decision.function_name,
-                        reasoning=(
-                            self.current_decision.reasoning
-                            if self.settings.BASE_USE_REASONING
-                            else ""
-                        ),
-                        reset_tree=current_decision_node.options[
-                            self.current_decision.function_name
-                        ]["next"]
-                        is None
-                        and (not completed),
-                    ),
-                    self.current_decision,
-                )
-            )[0]
+                    if not successful_actions:
+                        completed = (
+                            False
+                            or self.tree_data.num_trees_completed
+                            > self.tree_data.recursion_limit
+                        )
 
-            # check if the current node is the end of the tree
-            if (
-                current_decision_node.options[self.current_decision.function_name][
-                    "next"
-                ]
-                is None
-                or completed
-            ):
-                break
-            else:
-                current_decision_node = current_decision_node.options[
-                    self.current_decision.function_name
-                ][
-                    "next"
-                ]  # type: ignore
+                # evaluate the action if this is not a branch
+                elif action_fn is not None:
+                    self.tracker.start_tracking(self.current_decision.function_name)
+                    self.tree_data.set_current_task(self.current_decision.function_name)
+                    successful_action = True
+                    with ElysiaKeyManager(self.settings):
+                        async for result in action_fn(
+                            tree_data=self.tree_data,
+                            inputs=self.current_decision.function_inputs,
+                            base_lm=self.base_lm,
+                            complex_lm=self.complex_lm,
+                            client_manager=client_manager,
+                            **kwargs,
+                        ):
+                            action_result, error = await self._evaluate_result(
+                                result, self.current_decision
+                            )
 
-        self.tree_data.num_trees_completed += 1
+                            if action_result is not None:
+                                yield action_result
 
-        # end of all trees
-        if completed:
+                            successful_action = not error and successful_action
 
-            # firstly, if we reached the end of a tree at a node that shouldn't be the end, call text response tool here to respond
-            if (
-                not current_decision_node.options[self.current_decision.function_name][
-                    "end"
-                ]
-                or force_text_response
-            ):
-                with ElysiaKeyManager(self.settings):
-                    async for result in self.tools["forced_text_response"](
-                        tree_data=self.tree_data,
-                        inputs={},
-                        base_lm=self.base_lm,
-                        complex_lm=self.complex_lm,
-                    ):
-                        action_result, _ = await self._evaluate_result(
-                            result, self.current_decision
+                    if not successful_action:
+                        completed = (
+                            False
+                            or self.tree_data.num_trees_completed
+                            > self.tree_data.recursion_limit
                         )
-                        if action_result is not None:
-                            yield action_result
-
-            self.save_history(
-                query_id=self.prompt_to_query_id[user_prompt],
-                time_taken_seconds=time.time() - self.start_time,
-            )
 
-            yield await self.returner(
-                Completed(), query_id=self.prompt_to_query_id[user_prompt]
-            )
+                    if successful_action:
+                        self.tree_data.clear_error(self.current_decision.function_name)
 
-            self.settings.logger.debug(
-                f"[bold green]Model identified overall goal as completed![/bold green]"
-            )
-            self.settings.logger.debug(
-                f"Total time taken for decision tree: {time.time() - self.start_time:.2f} seconds"
-            )
-            self.settings.logger.debug(
-                f"Decision Node Avg. Time: {self.tracker.get_average_time('decision_node'):.2f} seconds"
-            )
-            self.log_token_usage()
+                    self.tracker.end_tracking(
+                        self.current_decision.function_name,
+                        self.current_decision.function_name,
+                        self.base_lm if not self.low_memory else None,
+                        self.complex_lm if not self.low_memory else None,
+                        self.tree_data.pop_prompt_reductions(),
+                    )
 
-            avg_times = []
-            for i, iteration in enumerate(self.decision_history):
-                if iteration != []:
-                    avg_times = [
-                        (
-                            f"  - {task} ([magenta]Avg. {self.tracker.get_average_time(task):.2f} seconds[/magenta])\n"
-                            if task in self.tracker.trackers
-                            else ""
+                if final_response and not completed:
+                    self._cancel_post_answer_tasks()
+
+                for parallel_decision in parallel_decisions:
+                    yield (
+                        await self._evaluate_result(
+                            TreeUpdate(
+                                from_node=current_decision_node.id,
+                                to_node=parallel_decision.function_name,
+                                reasoning=(
+                                    parallel_decision.reasoning
+                                    if self.settings.BASE_USE_REASONING
+                                    else ""
+                                ),
+                                reset_tree=False,
+                            ),
+                            parallel_decision,
                         )
-                        for task in iteration
-                    ]
-                    self.settings.logger.debug(
-                        f"Tasks completed (iteration {i+1}):\n" + "".join(avg_times)
+                    )[0]
+
+                yield (
+                    await self._evaluate_result(
+                        TreeUpdate(
+                            from_node=current_decision_node.id,
+                            to_node=self.current_decision.function_name,
+                            reasoning=(
+                                self.current_decision.reasoning
+                                if self.settings.BASE_USE_REASONING
+                                else ""
+                            ),
+                            reset_tree=current_decision_node.options[
+                                self.current_decision.function_name
+                            ]["next"]
+                            is None
+                            and (not completed),
+                        ),
+                        self.current_decision,
                     )
+                )[0]
+
+                # check if the current node is the end of the tree
+                if (
+                    current_decision_node.options[self.current_decision.function_name][
+                        "next"
+                    ]
+                    is None
+                    or completed
+                ):
+                    break
+                else:
+                    current_decision_node = current_decision_node.options[
+                        self.current_decision.function_name
+                    ][
+                        "next"
+                    ]  # type: ignore
 
-            if close_clients_after_completion and client_manager.is_client:
-                await client_manager.close_clients()
+            self.tree_data.num_trees_completed += 1
 
-        # otherwise, end of the tree for this iteration, and recursively call process() to restart the tree
-        else:
+            if completed:
+                break
+
+            # otherwise, end of the tree for this iteration, restart the tree from the root
             self.settings.logger.debug(
                 f"Model did [bold red]not[/bold red] yet complete overall goal! "
             )
             self.settings.logger.debug(
-                f"Restarting tree (Recursion: {self.tree_data.num_trees_completed+1}/{self.tree_data.recursion_limit})..."
+                f"Restarting tree (Iteration: {self.tree_data.num_trees_completed+1}/{self.tree_data.recursion_limit})..."
             )
-
-            # recursive call to restart the tree since the goal was not completed
             self.decision_history.append([])
-            async for result in self.async_run(
-                user_prompt,
-                collection_names,
-                client_manager,
-                training_route=training_route,
-                query_id=query_id,
-                _first_run=False,
-            ):
-                yield result
+
+        # end of all trees
+        # firstly, if we reached the end of a tree at a node that shouldn't be the end, call text response tool here to respond
+        if (
+            not current_decision_node.options[self.current_decision.function_name][
+                "end"
+            ]
+            or force_text_response
+        ):
+            self._start_post_answer_tasks()
+            with ElysiaKeyManager(self.settings):
+                async for result in self.tools["forced_text_response"](
+                    tree_data=self.tree_data,
+                    inputs={},
+                    base_lm=self.base_lm,
+                    complex_lm=self.complex_lm,
+                ):
+                    action_result, _ = await self._evaluate_result(
+                        result, self.current_decision
+                    )
+                    if action_result is not None:
+                        yield action_result
+
+        self.save_history(
+            query_id=self.prompt_to_query_id[user_prompt],
+            time_taken_seconds=time.time() - self.start_time,
+        )
+
+        if use_answer_cache:
+            self._store_cached_answer(user_prompt, answer_fingerprint, query_id)
+
+        if self.settings.CONVERSATION_HISTORY_WINDOW is not None:
+            self._summarise_conversation_history_in_background()
+
+        yield await self.returner(
+            Completed(), query_id=self.prompt_to_query_id[user_prompt]
+        )
+
+        self.settings.logger.debug(
+            f"[bold green]Model identified overall goal as completed![/bold green]"
+        )
+        self.settings.logger.debug(
+            f"Total time taken for decision tree: {time.time() - self.start_time:.2f} seconds"
+        )
+        self.settings.logger.debug(
+            f"Decision Node Avg. Time: {self.tracker.get_average_time('decision_node'):.2f} seconds"
+        )
+        self.log_token_usage()
+
+        avg_times = []
+        for i, iteration in enumerate(self.decision_history):
+            if iteration != []:
+                avg_times = [
+                    (
+                        f"  - {task} ([magenta]Avg. {self.tracker.get_average_time(task):.2f} seconds[/magenta])\n"
+                        if task in self.tracker.trackers
+                        else ""
+                    )
+                    for task in iteration
+                ]
+                self.settings.logger.debug(
+                    f"Tasks completed (iteration {i+1}):\n" + "".join(avg_times)
+                )
+
+        if close_clients_after_completion and client_manager.is_client:
+            await client_manager.close_clients()
 
     def run(
         self,
@@ -1865,6 +2348,9 @@ class Tree:
                 close_clients_after_completion,
             ):
                 pass
+
+            # the event loop does not keep running after this, so finish any background summary now
+            await self._wait_for_conversation_summary()
             return self.retrieved_objects
 
         async def run_with_live():
@@ -1889,6 +2375,7 @@ class Tree:
                         payload: dict = result["payload"]  # type: ignore
                         status.update(f"[bold indigo]{payload['text']}")
 
+            await self._wait_for_conversation_summary()
             return self.retrieved_objects
 
         if self.settings.LOGGING_LEVEL_INT <= 20:
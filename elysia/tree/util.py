@@ -1,4 +1,5 @@
 import uuid
+from copy import deepcopy
 
 # dspy requires a 'base' LM but this should not be used
 import dspy
@@ -15,6 +16,7 @@ from elysia.objects import (
     Result,
     Error,
     Text,
+    TextDelta,
     Tool,
     Update,
     Status,
@@ -26,6 +28,7 @@ from elysia.util.elysia_chain_of_thought import ElysiaChainOfThought
 from elysia.util.parsing import format_datetime
 from elysia.util.client import ClientManager
 from elysia.tree.prompt_templates import (
+    ConversationSummaryPrompt,
     FollowUpSuggestionsPrompt,
     TitleCreatorPrompt,
     DecisionPrompt,
@@ -34,6 +37,22 @@ from elysia.tools.text.prompt_templates import TextResponsePrompt
 from elysia.util.retrieve_feedback import retrieve_feedback
 
 
+# The decision prompt with an extra output for the actions to run alongside the chosen one (`settings.PARALLEL_TOOL_CALLS`),
+# built once so that a new signature is not created for every decision
+_parallel_decision_prompt = DecisionPrompt.append(
+    name="parallel_actions",
+    field=dspy.OutputField(description="""
+        Other actions from `available_actions` to run at the same time as `function_name`, if any.
+        A list of dictionaries, each with the keys `function_name` and `function_inputs` (in the same format as above).
+        Only include actions that are completely independent of `function_name` and of each other,
+        i.e. they do not need the output of another action to run (for example, retrieving from two different data sources).
+        Do not include `function_name` itself, any action that ends the conversation, or any action with sub-actions.
+        Return an empty list ([]) if there are no independent actions to run alongside `function_name`.
+        """.strip()),
+    type_=list[dict],
+)
+
+
 class ForcedTextResponse(Tool):
     """
     A tool that creates a new text response via a new LLM call.
@@ -67,9 +86,17 @@ class ForcedTextResponse(Tool):
             message_update=False,
         )
 
-        output = await text_response.aforward(
-            lm=base_lm,
-        )
+        if tree_data.settings.STREAM_TEXT_RESPONSES:
+            stream_id = str(uuid.uuid4())
+            async for chunk in text_response.aforward_streaming("response", lm=base_lm):
+                if isinstance(chunk, str):
+                    yield TextDelta(chunk, stream_id)
+                else:
+                    output = chunk
+        else:
+            output = await text_response.aforward(
+                lm=base_lm,
+            )
 
         yield Response(text=output.response)
 
@@ -228,6 +255,7 @@ class Decision:
         impossible: bool,
         end_actions: bool,
         last_in_tree: bool = False,
+        parallel_decisions: list["Decision"] | None = None,
     ):
         self.function_name = function_name
         self.function_inputs = function_inputs
@@ -236,6 +264,11 @@ class Decision:
         self.end_actions = end_actions
         self.last_in_tree = last_in_tree
 
+        # independent actions to run at the same time as this one
+        self.parallel_decisions = (
+            parallel_decisions if parallel_decisions is not None else []
+        )
+
 
 class DecisionNode:
     """
@@ -261,6 +294,9 @@ class DecisionNode:
         self.logger = logger
         self.use_elysia_collections = use_elysia_collections
 
+        # compiled options payloads shown to the LLM, keyed by the set of available tools
+        self._options_json_cache: dict[frozenset[str], dict] = {}
+
     def _get_options(self):
         return self.options
 
@@ -285,16 +321,39 @@ class DecisionNode:
             "status": status,  # type: str
             "next": next,  # type: DecisionNode | None
         }
+        self._options_json_cache = {}
 
     def remove_option(self, id: str):
         if id in self.options:
             del self.options[id]
+            self._options_json_cache = {}
+
+    def _input_to_json(self, input_dict: dict) -> dict:
+        """
+        Copy of a tool input for the LLM, with any pydantic model type replaced by a description of its schema.
+        """
+        input_json = dict(input_dict)
+        if hasattr(input_dict["type"], "model_json_schema"):
+            schema = input_dict["type"].model_json_schema()
+            type_overwrite = (
+                f"A JSON object of the following properties: {schema['properties']}"
+            )
+            if "$defs" in schema:
+                type_overwrite += f"\nWhere the values are: {schema['$defs']}"
+            input_json["type"] = type_overwrite
+        return input_json
 
     def _options_to_json(self, available_tools: list[str]):
         """
         Options that get shown to the LLM.
         Remove any that are empty branches.
+        These are compiled once per set of available tools, and rebuilt only when the options of this node change.
+        The returned dictionary is shared between calls and should not be modified.
         """
+        cache_key = frozenset(available_tools)
+        if cache_key in self._options_json_cache:
+            return self._options_json_cache[cache_key]
+
         out = {}
         for node in self.options:
             if node not in available_tools:  # empty branch
@@ -306,17 +365,14 @@ class DecisionNode:
             }
 
             if self.options[node]["inputs"] != {}:
-                out[node]["inputs"] = self.options[node]["inputs"]
-
-                for input_dict in out[node]["inputs"].values():
-                    if hasattr(input_dict["type"], "model_json_schema"):
-                        type_overwrite = f"A JSON object of the following properties: {input_dict['type'].model_json_schema()['properties']}"
-                        if "$defs" in input_dict["type"].model_json_schema():
-                            type_overwrite += f"\nWhere the values are: {input_dict['type'].model_json_schema()['$defs']}"
-                        input_dict["type"] = type_overwrite
+                out[node]["inputs"] = {
+                    input_name: self._input_to_json(input_dict)
+                    for input_name, input_dict in self.options[node]["inputs"].items()
+                }
             else:
                 out[node]["inputs"] = "No inputs are needed for this function."
 
+        self._options_json_cache[cache_key] = out
         return out
 
     def _unavailable_options_to_json(self, unavailable_tools: list[tuple[str, str]]):
@@ -374,6 +430,58 @@ class DecisionNode:
         compiled_executor = optimizer.compile(decision_executor, trainset=examples)
         return compiled_executor
 
+    def _can_run_in_parallel(self, function_name: str, available_tools: list[str]):
+        """
+        Only tools that sit at the end of a branch and do not end the tree can be run alongside other tools.
+        """
+        return (
+            function_name in available_tools
+            and self.options[function_name]["action"] is not None
+            and self.options[function_name]["next"] is None
+            and not self.options[function_name]["end"]
+        )
+
+    def _parallel_decisions(
+        self,
+        parallel_actions: list[dict],
+        decision: Decision,
+        available_tools: list[str],
+    ) -> list[Decision]:
+        """
+        Convert the extra actions chosen by the model into Decisions, keeping only those that can safely run
+        at the same time as the main decision (distinct, available tools at the end of a branch).
+        """
+        if not self._can_run_in_parallel(decision.function_name, available_tools):
+            return []
+
+        chosen = [decision.function_name]
+        parallel_decisions = []
+        for action in parallel_actions:
+            if not isinstance(action, dict) or "function_name" not in action:
+                continue
+
+            function_name = str(action["function_name"]).strip("'\"`")
+            if function_name in chosen or not self._can_run_in_parallel(
+                function_name, available_tools
+            ):
+                continue
+
+            function_inputs = action.get("function_inputs", {})
+            parallel_decisions.append(
+                Decision(
+                    function_name=function_name,
+                    function_inputs=(
+                        function_inputs if isinstance(function_inputs, dict) else {}
+                    ),
+                    reasoning=decision.reasoning,
+                    impossible=False,
+                    end_actions=False,
+                )
+            )
+            chosen.append(function_name)
+
+        return parallel_decisions
+
     def _tool_assertion(self, kwargs, pred):
         return (
             pred.function_name in self.options,
@@ -414,8 +522,13 @@ class DecisionNode:
         )
 
         if not one_choice:
+            if tree_data.settings.PARALLEL_TOOL_CALLS:
+                signature = _parallel_decision_prompt
+            else:
+                signature = DecisionPrompt
+
             decision_module = ElysiaChainOfThought(
-                DecisionPrompt,
+                signature,
                 tree_data=tree_data,
                 environment=True,
                 collection_schemas=self.use_elysia_collections,
@@ -487,14 +600,24 @@ class DecisionNode:
                 output.end_actions and bool(self.options[output.function_name]["end"]),
             )
 
+            if tree_data.settings.PARALLEL_TOOL_CALLS:
+                decision.parallel_decisions = self._parallel_decisions(
+                    output.parallel_actions, decision, available_tools
+                )
+
             results = [
                 TrainingUpdate(
                     module_name="decision",
-                    inputs=tree_data.to_json(),
+                    inputs={},
                     outputs={k: v for k, v in output.__dict__["_store"].items()},
+                    tree_data=tree_data,
                 ),
                 Status(str(self.options[output.function_name]["status"])),
             ]
+            for parallel_decision in decision.parallel_decisions:
+                results.append(
+                    Status(str(self.options[parallel_decision.function_name]["status"]))
+                )
 
             if output.function_name != "text_response":
                 results.append(Response(output.message_update))
@@ -606,6 +729,26 @@ class TreeReturner:
             }
         )
 
+    def replay(self, payloads: list[dict], query_id: str) -> list[dict]:
+        """
+        Re-issue payloads stored for an earlier query (e.g. from the answer cache) under a new query.
+        The payloads are copied with new ids, the current user, conversation and tree index.
+        """
+        replayed = []
+        for payload in payloads:
+            payload = deepcopy(payload)
+            payload["user_id"] = self.user_id
+            payload["conversation_id"] = self.conversation_id
+            payload["query_id"] = query_id
+            if payload["type"] == "tree_update":
+                payload["id"] = str(uuid.uuid4())
+                payload["payload"]["tree_index"] = self.tree_index
+            else:
+                payload["id"] = payload["type"][:3] + "-" + str(uuid.uuid4())
+            self.store.append(payload)
+            replayed.append(payload)
+        return replayed
+
     async def __call__(
         self,
         result: Result | TreeUpdate | Update | Text | Error,
@@ -616,7 +759,9 @@ class TreeReturner:
             payload = await result.to_frontend(
                 self.user_id, self.conversation_id, query_id
             )
-            self.store.append(payload)
+            # deltas are replaced by the complete text that follows them, so are not kept
+            if not isinstance(result, TextDelta):
+                self.store.append(payload)
             return payload
 
         if isinstance(result, TreeUpdate):
@@ -639,6 +784,18 @@ async def create_conversation_title(conversation: list[dict], lm: dspy.LM):
     return title.title
 
 
+async def summarise_conversation_history(
+    previous_summary: str, conversation: list[dict], lm: dspy.LM
+):
+    summariser = dspy.Predict(ConversationSummaryPrompt)
+    summary = await summariser.aforward(
+        previous_summary=previous_summary,
+        conversation=conversation,
+        lm=lm,
+    )
+    return summary.summary
+
+
 async def get_follow_up_suggestions(
     tree_data: TreeData,
     current_suggestions: list[str],
@@ -665,8 +822,11 @@ async def get_follow_up_suggestions(
     prediction = await follow_up_suggestor.aforward(
         user_prompt=tree_data.user_prompt,
         reference=tree_data.atlas.datetime_reference,
-        conversation_history=tree_data.conversation_history,
-        environment=tree_data.environment.environment,
+        conversation_history=tree_data.windowed_conversation_history(),
+        environment=tree_data.environment.render(
+            token_budget=tree_data.settings.ENVIRONMENT_TOKEN_BUDGET,
+            user_prompt=tree_data.user_prompt,
+        ),
         data_information=tree_data.output_collection_metadata(with_mappings=False),
         old_suggestions=current_suggestions,
         context=context,
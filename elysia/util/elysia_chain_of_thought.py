@@ -1,12 +1,23 @@
-from typing import Type
+import json
+from collections import OrderedDict
+from typing import AsyncGenerator, Type
 from copy import copy
+import random
 
 import dspy
 from dspy.primitives.module import Module
+from litellm import ModelResponseStream
 from dspy.signatures.signature import Signature, ensure_signature
 from elysia.tree.objects import TreeData, Atlas
-from elysia.util.retrieve_feedback import retrieve_feedback
+from elysia.util.retrieve_feedback import retrieve_feedback_cached
 from elysia.util.client import ClientManager
+from elysia.util.prompt_budget import (
+    count_tokens,
+    estimate_prompt_tokens,
+    prompt_token_budget,
+    reduce_collection_schemas,
+)
+from elysia.util.streaming import FieldStream
 
 
 elysia_meta_prompt = """
@@ -21,6 +32,233 @@ Complete this task only, remember that other agents will complete other parts of
 """
 
 
+# Extended signatures built by `_build_extended_signature`, shared across modules.
+# The least recently used are dropped, so signatures built dynamically (e.g. by tools) are not kept forever
+EXTENDED_SIGNATURES_CACHE_SIZE = 256
+_extended_signatures: OrderedDict[tuple, Type[Signature]] = OrderedDict()
+
+
+def _build_extended_signature(
+    signature: Type[Signature] | str,
+    reasoning: bool,
+    impossible: bool,
+    message_update: bool,
+    environment: bool,
+    collection_schemas: bool,
+    tasks_completed: bool,
+) -> Type[Signature]:
+    """
+    Build the signature used by `ElysiaChainOfThought`, adding the tree data inputs and optional outputs to `signature`.
+    Every `prepend`/`append` creates a new signature class, so the result is cached on the arguments
+    and shared by every module built with the same signature and flags.
+    The returned class must not be modified in place.
+    """
+    key = (
+        signature,
+        reasoning,
+        impossible,
+        message_update,
+        environment,
+        collection_schemas,
+        tasks_completed,
+    )
+    if key in _extended_signatures:
+        _extended_signatures.move_to_end(key)
+        return _extended_signatures[key]
+
+    extended_signature = ensure_signature(signature)  # type: ignore
+
+    # == Inputs ==
+
+    # -- User Prompt --
+    user_prompt_desc = (
+        "The user's original question/prompt that needs to be answered. "
+        "This, possibly combined with the conversation history, will be used to determine your current action."
+    )
+    user_prompt_prefix = "${user_prompt}"
+    user_prompt_field: str = dspy.InputField(
+        prefix=user_prompt_prefix, desc=user_prompt_desc
+    )
+
+    # -- Conversation History --
+    conversation_history_desc = (
+        "Previous messages between user and assistant in chronological order: "
+        "[{'role': 'user'|'assistant', 'content': str}] "
+        "Use this to maintain conversation context and avoid repetition."
+    )
+    conversation_history_prefix = "${conversation_history}"
+    conversation_history_field: list[dict] = dspy.InputField(
+        prefix=conversation_history_prefix, desc=conversation_history_desc
+    )
+
+    # -- Atlas --
+    atlas_desc = (
+        "Your guide to how you should proceed as an agent in this task. "
+        "This is pre-defined by the user."
+    )
+    atlas_prefix = "${atlas}"
+    atlas_field: Atlas = dspy.InputField(prefix=atlas_prefix, desc=atlas_desc)
+
+    # -- Errors --
+    errors_desc = (
+        "Any errors that have occurred during the previous attempt at this action. "
+        "This is a list of dictionaries, containing details of the error. "
+        "Make an attempt at providing different output to avoid this error now. "
+        "If this error is repeated, or you judge it to be unsolvable, you can set `impossible` to True"
+    )
+    errors_prefix = "${previous_errors}"
+    errors_field: list[dict] = dspy.InputField(prefix=errors_prefix, desc=errors_desc)
+
+    # -- Add to Signature --
+    extended_signature = extended_signature.prepend(
+        name="user_prompt", field=user_prompt_field, type_=str
+    )
+    extended_signature = extended_signature.append(
+        name="conversation_history",
+        field=conversation_history_field,
+        type_=list[dict],
+    )
+    extended_signature = extended_signature.append(
+        name="atlas", field=atlas_field, type_=Atlas
+    )
+    extended_signature = extended_signature.append(
+        name="previous_errors", field=errors_field, type_=list[dict]
+    )
+
+    # == Optional Inputs / Outputs ==
+
+    # -- Environment Input --
+    if environment:
+        environment_desc = (
+            "Information gathered from completed tasks. "
+            "Empty if no data has been retrieved yet. "
+            "Use to determine if more information is needed. "
+            "Additionally, use this as a reference to determine if you have already completed a task/what items are already available, to avoid repeating actions. "
+            "All items here are already shown to the user, so do not repeat information from these fields unless summarising, providing extra information or otherwise. "
+            "E.g., do not list out anything from here, only provide new content to the user."
+        )
+        environment_prefix = "${environment}"
+        environment_field: dict = dspy.InputField(
+            prefix=environment_prefix, desc=environment_desc
+        )
+        extended_signature = extended_signature.append(
+            name="environment", field=environment_field, type_=dict
+        )
+
+    # -- Collection Schema Input --
+    if collection_schemas:
+        collection_schemas_desc = (
+            "Metadata about available collections and their schemas: "
+            "This is a dictionary with the following fields: "
+            "{\n"
+            "    name: collection name,\n"
+            "    length: number of objects in the collection,\n"
+            "    summary: summary of the collection,\n"
+            "    fields: [\n"
+            "        {\n"
+            "            name: field_name,\n"
+            "            groups: a dict with the value and count of each group.\n"
+            "                a comprehensive list of all unique values that exist in the field.\n"
+            "                if this is None, then no relevant groups were found.\n"
+            "                these values are string, but the actual values in the collection are the 'type' of the field.\n"
+            "            mean: mean of the field. if the field is text, this refers to the means length (in tokens) of the texts in this field. if the type is a list, this refers to the mean length of the lists,\n"
+            "            range: minimum and maximum values of the length,\n"
+            "            type: the data type of the field.\n"
+            "        },\n"
+            "        ...\n"
+            "    ]\n"
+            "}\n"
+        )
+        collection_schemas_prefix = "${collection_schemas}"
+        collection_schemas_field: dict = dspy.InputField(
+            prefix=collection_schemas_prefix, desc=collection_schemas_desc
+        )
+        extended_signature = extended_signature.append(
+            name="collection_schemas", field=collection_schemas_field, type_=dict
+        )
+
+    # -- Tasks Completed Input --
+    if tasks_completed:
+        tasks_completed_desc = (
+            "Which tasks have been completed in order. "
+            "These are numbered so that higher numbers are more recent. "
+            "Separated by prompts (so you should identify the prompt you are currently working on to see what tasks have been completed so far) "
+            "Also includes reasoning for each task, to continue a decision logic across tasks. "
+            "Use this to determine whether future searches, for this prompt are necessary, and what task(s) to choose. "
+            "It is IMPORTANT that you separate what actions have been completed for which prompt, so you do not think you have failed an attempt for a different prompt."
+        )
+        tasks_completed_prefix = "${tasks_completed}"
+        tasks_completed_field: str = dspy.InputField(
+            prefix=tasks_completed_prefix, desc=tasks_completed_desc
+        )
+        extended_signature = extended_signature.append(
+            name="tasks_completed", field=tasks_completed_field, type_=str
+        )
+
+    # -- Impossible Field --
+    if impossible:
+        impossible_desc = (
+            "Given the actions you have available, and the environment/information. "
+            "Is the task impossible to complete? "
+            "I.e., do you wish that you had a different task to perform/choose from and hence should return to the base of the decision tree?"
+            "Do not base this judgement on the entire prompt, as it is possible that other agents can perform other aspects of the request."
+            "Do not judge impossibility based on if tasks have been completed, only on the current action and environment."
+        )
+        impossible_prefix = "${impossible}"
+        impossible_field: bool = dspy.OutputField(
+            prefix=impossible_prefix, desc=impossible_desc
+        )
+        extended_signature = extended_signature.prepend(
+            name="impossible", field=impossible_field, type_=bool
+        )
+
+    # -- Message Update Output --
+    if message_update:
+        message_update_desc = (
+            "Continue your current message to the user "
+            "(latest assistant field in conversation history) with ONE concise sentence that: "
+            "- Describes NEW technical details about your latest action "
+            "- Highlights specific parameters or logic you just applied "
+            "- Avoids repeating anything from conversation history "
+            "- Speaks directly to them (no 'the user'), gender neutral message "
+            "Just provide the new sentence update, not the full message from the conversation history. "
+            "Your response should be based on only the part of the user's request that you can work on. "
+            "It is possible other agents can perform other aspects of the request, so do not respond as if you cannot complete the entire request."
+        )
+
+        message_update_prefix = "${message_update}"
+        message_update_field: str = dspy.OutputField(
+            prefix=message_update_prefix, desc=message_update_desc
+        )
+        extended_signature = extended_signature.prepend(
+            name="message_update", field=message_update_field, type_=str
+        )
+
+    # -- Reasoning Field --
+    if reasoning:
+        reasoning_desc = (
+            "Reasoning: Repeat relevant parts of the any context within your environment, "
+            "Evaluate all relevant information from the inputs, including any previous errors if applicable, "
+            "use this to think step by step in order to answer the query."
+            "Limit your reasoning to maximum 150 words. Only exceed this if the task is very complex."
+        )
+        reasoning_prefix = "${reasoning}"
+        reasoning_field: str = dspy.OutputField(
+            prefix=reasoning_prefix, desc=reasoning_desc
+        )
+        extended_signature = extended_signature.prepend(
+            name="reasoning", field=reasoning_field, type_=str
+        )
+
+    extended_signature = extended_signature.with_instructions(
+        extended_signature.instructions + elysia_meta_prompt
+    )
+    _extended_signatures[key] = extended_signature
+    if len(_extended_signatures) > EXTENDED_SIGNATURES_CACHE_SIZE:
+        _extended_signatures.popitem(last=False)
+    return extended_signature
+
+
 class ElysiaChainOfThought(Module):
     """
     A custom reasoning DSPy module that reasons step by step in order to predict the output of a task.
@@ -111,8 +349,6 @@ class ElysiaChainOfThought(Module):
 
         super().__init__()
 
-        signature = ensure_signature(signature)  # type: ignore
-
         # Create a shallow copy of the tree_data
         self.tree_data = copy(tree_data)
 
@@ -125,205 +361,32 @@ class ElysiaChainOfThought(Module):
         self.reasoning = reasoning
         self.impossible = impossible
 
-        # == Inputs ==
-
-        # -- User Prompt --
-        user_prompt_desc = (
-            "The user's original question/prompt that needs to be answered. "
-            "This, possibly combined with the conversation history, will be used to determine your current action."
-        )
-        user_prompt_prefix = "${user_prompt}"
-        user_prompt_field: str = dspy.InputField(
-            prefix=user_prompt_prefix, desc=user_prompt_desc
-        )
-
-        # -- Conversation History --
-        conversation_history_desc = (
-            "Previous messages between user and assistant in chronological order: "
-            "[{'role': 'user'|'assistant', 'content': str}] "
-            "Use this to maintain conversation context and avoid repetition."
-        )
-        conversation_history_prefix = "${conversation_history}"
-        conversation_history_field: list[dict] = dspy.InputField(
-            prefix=conversation_history_prefix, desc=conversation_history_desc
-        )
-
-        # -- Atlas --
-        atlas_desc = (
-            "Your guide to how you should proceed as an agent in this task. "
-            "This is pre-defined by the user."
-        )
-        atlas_prefix = "${atlas}"
-        atlas_field: Atlas = dspy.InputField(prefix=atlas_prefix, desc=atlas_desc)
-
-        # -- Errors --
-        errors_desc = (
-            "Any errors that have occurred during the previous attempt at this action. "
-            "This is a list of dictionaries, containing details of the error. "
-            "Make an attempt at providing different output to avoid this error now. "
-            "If this error is repeated, or you judge it to be unsolvable, you can set `impossible` to True"
-        )
-        errors_prefix = "${previous_errors}"
-        errors_field: list[dict] = dspy.InputField(
-            prefix=errors_prefix, desc=errors_desc
-        )
-
-        # -- Add to Signature --
-        extended_signature = signature.prepend(
-            name="user_prompt", field=user_prompt_field, type_=str
-        )
-        extended_signature = extended_signature.append(
-            name="conversation_history",
-            field=conversation_history_field,
-            type_=list[dict],
-        )
-        extended_signature = extended_signature.append(
-            name="atlas", field=atlas_field, type_=Atlas
-        )
-        extended_signature = extended_signature.append(
-            name="previous_errors", field=errors_field, type_=list[dict]
-        )
-
-        # == Optional Inputs / Outputs ==
-
-        # -- Environment Input --
-        if environment:
-            environment_desc = (
-                "Information gathered from completed tasks. "
-                "Empty if no data has been retrieved yet. "
-                "Use to determine if more information is needed. "
-                "Additionally, use this as a reference to determine if you have already completed a task/what items are already available, to avoid repeating actions. "
-                "All items here are already shown to the user, so do not repeat information from these fields unless summarising, providing extra information or otherwise. "
-                "E.g., do not list out anything from here, only provide new content to the user."
-            )
-            environment_prefix = "${environment}"
-            environment_field: dict = dspy.InputField(
-                prefix=environment_prefix, desc=environment_desc
-            )
-            extended_signature = extended_signature.append(
-                name="environment", field=environment_field, type_=dict
-            )
-
-        # -- Collection Schema Input --
-        if collection_schemas:
-            collection_schemas_desc = (
-                "Metadata about available collections and their schemas: "
-                "This is a dictionary with the following fields: "
-                "{\n"
-                "    name: collection name,\n"
-                "    length: number of objects in the collection,\n"
-                "    summary: summary of the collection,\n"
-                "    fields: [\n"
-                "        {\n"
-                "            name: field_name,\n"
-                "            groups: a dict with the value and count of each group.\n"
-                "                a comprehensive list of all unique values that exist in the field.\n"
-                "                if this is None, then no relevant groups were found.\n"
-                "                these values are string, but the actual values in the collection are the 'type' of the field.\n"
-                "            mean: mean of the field. if the field is text, this refers to the means length (in tokens) of the texts in this field. if the type is a list, this refers to the mean length of the lists,\n"
-                "            range: minimum and maximum values of the length,\n"
-                "            type: the data type of the field.\n"
-                "        },\n"
-                "        ...\n"
-                "    ]\n"
-                "}\n"
-            )
-            collection_schemas_prefix = "${collection_schemas}"
-            collection_schemas_field: dict = dspy.InputField(
-                prefix=collection_schemas_prefix, desc=collection_schemas_desc
-            )
-            extended_signature = extended_signature.append(
-                name="collection_schemas", field=collection_schemas_field, type_=dict
-            )
-
-        # -- Tasks Completed Input --
-        if tasks_completed:
-            tasks_completed_desc = (
-                "Which tasks have been completed in order. "
-                "These are numbered so that higher numbers are more recent. "
-                "Separated by prompts (so you should identify the prompt you are currently working on to see what tasks have been completed so far) "
-                "Also includes reasoning for each task, to continue a decision logic across tasks. "
-                "Use this to determine whether future searches, for this prompt are necessary, and what task(s) to choose. "
-                "It is IMPORTANT that you separate what actions have been completed for which prompt, so you do not think you have failed an attempt for a different prompt."
-            )
-            tasks_completed_prefix = "${tasks_completed}"
-            tasks_completed_field: str = dspy.InputField(
-                prefix=tasks_completed_prefix, desc=tasks_completed_desc
-            )
-            extended_signature = extended_signature.append(
-                name="tasks_completed", field=tasks_completed_field, type_=str
-            )
-
-        # -- Impossible Field --
-        if impossible:
-            impossible_desc = (
-                "Given the actions you have available, and the environment/information. "
-                "Is the task impossible to complete? "
-                "I.e., do you wish that you had a different task to perform/choose from and hence should return to the base of the decision tree?"
-                "Do not base this judgement on the entire prompt, as it is possible that other agents can perform other aspects of the request."
-                "Do not judge impossibility based on if tasks have been completed, only on the current action and environment."
-            )
-            impossible_prefix = "${impossible}"
-            impossible_field: bool = dspy.OutputField(
-                prefix=impossible_prefix, desc=impossible_desc
-            )
-            extended_signature = extended_signature.prepend(
-                name="impossible", field=impossible_field, type_=bool
-            )
-
-        # -- Message Update Output --
-        if message_update:
-            message_update_desc = (
-                "Continue your current message to the user "
-                "(latest assistant field in conversation history) with ONE concise sentence that: "
-                "- Describes NEW technical details about your latest action "
-                "- Highlights specific parameters or logic you just applied "
-                "- Avoids repeating anything from conversation history "
-                "- Speaks directly to them (no 'the user'), gender neutral message "
-                "Just provide the new sentence update, not the full message from the conversation history. "
-                "Your response should be based on only the part of the user's request that you can work on. "
-                "It is possible other agents can perform other aspects of the request, so do not respond as if you cannot complete the entire request."
-            )
-
-            message_update_prefix = "${message_update}"
-            message_update_field: str = dspy.OutputField(
-                prefix=message_update_prefix, desc=message_update_desc
-            )
-            extended_signature = extended_signature.prepend(
-                name="message_update", field=message_update_field, type_=str
-            )
-
-        # -- Reasoning Field --
-        if reasoning:
-            reasoning_desc = (
-                "Reasoning: Repeat relevant parts of the any context within your environment, "
-                "Evaluate all relevant information from the inputs, including any previous errors if applicable, "
-                "use this to think step by step in order to answer the query."
-                "Limit your reasoning to maximum 150 words. Only exceed this if the task is very complex."
-            )
-            reasoning_prefix = "${reasoning}"
-            reasoning_field: str = dspy.OutputField(
-                prefix=reasoning_prefix, desc=reasoning_desc
-            )
-            extended_signature = extended_signature.prepend(
-                name="reasoning", field=reasoning_field, type_=str
-            )
-
         # -- Predict --
+        extended_signature = _build_extended_signature(
+            signature,
+            reasoning=reasoning,
+            impossible=impossible,
+            message_update=message_update,
+            environment=environment,
+            collection_schemas=collection_schemas,
+            tasks_completed=tasks_completed,
+        )
         self.predict = dspy.Predict(extended_signature, **config)
-        self.predict.signature.instructions += elysia_meta_prompt  # type: ignore
 
     def _add_tree_data_inputs(self, kwargs: dict):
 
         # Add the tree data inputs to the kwargs
         kwargs["user_prompt"] = self.tree_data.user_prompt
-        kwargs["conversation_history"] = self.tree_data.conversation_history
+        kwargs["conversation_history"] = self.tree_data.windowed_conversation_history()
         kwargs["atlas"] = self.tree_data.atlas
         kwargs["previous_errors"] = self.tree_data.get_errors()
 
         # Add the optional inputs to the kwargs
         if self.environment:
-            kwargs["environment"] = self.tree_data.environment.environment
+            kwargs["environment"] = self.tree_data.environment.render(
+                token_budget=self.tree_data.settings.ENVIRONMENT_TOKEN_BUDGET,
+                user_prompt=self.tree_data.user_prompt,
+            )
 
         if self.collection_schemas:
             if self.collection_names != []:
@@ -342,14 +405,139 @@ class ElysiaChainOfThought(Module):
 
         return kwargs
 
+    def _prompt_reductions(self, kwargs: dict):
+        """
+        The ways to shrink the prompt, lowest priority input first.
+        For each input, yields (input name, description, reduced value) in order of increasing reduction.
+        """
+        if "environment" in kwargs:
+            environment_tokens = count_tokens(
+                json.dumps(kwargs["environment"], default=str)
+            )
+            token_budget = environment_tokens // 2
+            while token_budget > 0:
+                environment = self.tree_data.environment.render(
+                    token_budget=token_budget, user_prompt=self.tree_data.user_prompt
+                )
+                description = f"environment rendered within {token_budget} tokens"
+                yield "environment", description, environment
+                token_budget //= 2
+
+            environment = self.tree_data.environment.render(token_budget=0)
+            yield "environment", "environment results removed", environment
+
+        if "collection_schemas" in kwargs:
+            schemas = kwargs["collection_schemas"]
+            yield (
+                "collection_schemas",
+                "field statistics removed from collection schemas",
+                reduce_collection_schemas(schemas, level=1),
+            )
+            yield (
+                "collection_schemas",
+                "collection schemas reduced to field names and types",
+                reduce_collection_schemas(schemas, level=2),
+            )
+
+        if "conversation_history" in kwargs:
+            conversation_history = kwargs["conversation_history"]
+            num_messages = len(conversation_history) // 2
+            while num_messages > 0:
+                description = (
+                    f"conversation history reduced to the last {num_messages} messages"
+                )
+                yield "conversation_history", description, conversation_history[
+                    -num_messages:
+                ]
+                num_messages //= 2
+
+    def _fit_prompt_to_budget(self, kwargs: dict) -> dict:
+        """
+        Estimate the number of tokens in the prompt before it is sent, and if it is over the prompt token budget
+        (`settings.PROMPT_TOKEN_BUDGET`, or most of the model's context window), shrink the lowest priority inputs until it fits:
+        the environment, then the collection schemas, then the conversation history.
+        The reductions are deterministic, and recorded in the tree data so the tree can report them through the `Tracker`.
+        """
+        lm = kwargs.get("lm") or dspy.settings.lm
+        if lm is None:
+            return kwargs
+
+        budget = prompt_token_budget(
+            lm.model, self.tree_data.settings.PROMPT_TOKEN_BUDGET
+        )
+        if budget is None:
+            return kwargs
+
+        tokens = estimate_prompt_tokens(self.predict, kwargs, budget)
+        if tokens <= budget:
+            return kwargs
+
+        tokens_before = tokens
+        reductions: dict[str, str] = {}
+        for name, description, value in self._prompt_reductions(kwargs):
+            kwargs[name] = value
+            reductions[name] = description
+            tokens = estimate_prompt_tokens(self.predict, kwargs, budget)
+            if tokens <= budget:
+                break
+
+        self.tree_data.add_prompt_reduction(
+            {
+                "task": self.tree_data.current_task,
+                "signature": self.predict.signature.__name__,
+                "model": lm.model,
+                "budget": budget,
+                "tokens_before": tokens_before,
+                "tokens_after": tokens,
+                "reductions": list(reductions.values()),
+            }
+        )
+        return kwargs
+
     def forward(self, **kwargs):
         kwargs = self._add_tree_data_inputs(kwargs)
+        kwargs = self._fit_prompt_to_budget(kwargs)
         return self.predict(**kwargs)
 
     async def aforward(self, **kwargs):
         kwargs = self._add_tree_data_inputs(kwargs)
+        kwargs = self._fit_prompt_to_budget(kwargs)
         return await self.predict.acall(**kwargs)
 
+    async def aforward_streaming(
+        self, field_name: str | list[str], **kwargs
+    ) -> AsyncGenerator[str | tuple[str, str] | dspy.Prediction, None]:
+        """
+        Use the forward pass of the module, streaming the completion from the LM.
+        Yields the text of the output field `field_name` in pieces as it is generated, followed by the final prediction.
+        The prediction is the same as from `aforward`, and should be used as the complete output.
+
+        No pieces are yielded if the response is not streamed (e.g. it is served from a cache),
+        or if the completion is not in the `dspy.ChatAdapter` format.
+
+        Args:
+            field_name (str | list[str]): The name of the output field to stream.
+                If a list of names is given, the pieces of every field are yielded as `(field_name, text)` tuples.
+            **kwargs (Any): The keyword arguments to pass to the forward pass (as in `aforward`).
+        """
+        kwargs = self._add_tree_data_inputs(kwargs)
+        kwargs = self._fit_prompt_to_budget(kwargs)
+
+        field_names = [field_name] if isinstance(field_name, str) else field_name
+        fields = [FieldStream(name) for name in field_names]
+        stream = dspy.streamify(self.predict, is_async_program=True)
+        async for value in stream(**kwargs):
+            if isinstance(value, dspy.Prediction):
+                yield value
+            elif isinstance(value, ModelResponseStream):
+                content = value.choices[0].delta.content
+                if content:
+                    for name, field in zip(field_names, fields):
+                        text = field.feed(content)
+                        if text == "":
+                            continue
+                        yield text if isinstance(field_name, str) else (name, text)
+
     async def aforward_with_feedback_examples(
         self,
         feedback_model: str,
@@ -387,13 +575,10 @@ class ElysiaChainOfThought(Module):
             (dspy.Prediction): The prediction from the forward pass.
         """
 
-        examples, uuids = await retrieve_feedback(
+        examples, uuids = await retrieve_feedback_cached(
             client_manager, self.tree_data.user_prompt, feedback_model, n=10
         )
-        if len(examples) > 0:
-            optimizer = dspy.LabeledFewShot(k=10)
-            optimized_module = optimizer.compile(self, trainset=examples)
-        else:
+        if len(examples) == 0:
             if return_example_uuids:
                 return (
                     await self.aforward(lm=complex_lm, **kwargs),
@@ -403,19 +588,14 @@ class ElysiaChainOfThought(Module):
                 return await self.aforward(lm=complex_lm, **kwargs)
 
         # Select the LM to use based on the number of examples
-        if len(examples) < num_base_lm_examples:
-            if return_example_uuids:
-                return (
-                    await optimized_module.aforward(lm=complex_lm, **kwargs),
-                    uuids,
-                )
-            else:
-                return await optimized_module.aforward(lm=complex_lm, **kwargs)
+        lm = complex_lm if len(examples) < num_base_lm_examples else base_lm
+
+        # Equivalent to compiling with dspy.LabeledFewShot(k=10) (including its seed),
+        # but the demos are given to this call only, without copying the module (and the tree data within it)
+        demos = random.Random(0).sample(examples, min(10, len(examples)))
+        prediction = await self.aforward(lm=lm, demos=demos, **kwargs)
+
+        if return_example_uuids:
+            return prediction, uuids
         else:
-            if return_example_uuids:
-                return (
-                    await optimized_module.aforward(lm=base_lm, **kwargs),
-                    uuids,
-                )
-            else:
-                return await optimized_module.aforward(lm=base_lm, **kwargs)
+            return prediction
@@ -3,10 +3,15 @@ import uuid
 from copy import deepcopy
 import dspy
 from pydantic import BaseModel
-from typing import Any
+from typing import Any, TYPE_CHECKING
 from elysia.util.parsing import format_dict_to_serialisable
 from logging import Logger
 from elysia.objects import Update
+from elysia.lm.elysia_lm import ElysiaLM
+from elysia.lm.lm_history import LMHistory
+
+if TYPE_CHECKING:
+    from elysia.tree.objects import TreeData
 
 
 class Tracker:
@@ -15,6 +20,8 @@ class Tracker:
     - the average time taken for an LLM call
     - number of calls made
     - number of input/output tokens used
+    - number of LM response cache hits/misses
+    - prompts shrunk to fit the prompt token budget
     """
 
     def __init__(self, tracker_names: list[str], logger: Logger):
@@ -41,6 +48,8 @@ class Tracker:
                     "output_tokens": None,
                     "avg_input_tokens": None,
                     "avg_output_tokens": None,
+                    "cache_hits": 0,
+                    "cache_misses": 0,
                 },
                 "complex_lm": {
                     "calls": 0,
@@ -50,18 +59,54 @@ class Tracker:
                     "output_tokens": None,
                     "avg_input_tokens": None,
                     "avg_output_tokens": None,
+                    "cache_hits": 0,
+                    "cache_misses": 0,
                 },
             },
         }
+        self.prompt_reductions: list[dict] = []
         self.logger = logger
 
-    def start_tracking(self, tracker_name: str):
-        self.trackers[tracker_name]["timer"]["start_time"] = time.perf_counter()
+    def start_tracking(self, tracker_name: str) -> float:
+        start_time = time.perf_counter()
+        self.trackers[tracker_name]["timer"]["start_time"] = start_time
+        return start_time
 
     def update_lm_costs(self, lm: dspy.LM | None = None, model_type: str = "base_lm"):
 
         if lm is not None:
 
+            # responses served by the LM response cache (not included in the history)
+            if isinstance(lm, ElysiaLM) and lm.response_cache is not None:
+                self.trackers["models"][model_type]["cache_hits"] = lm.cache_hits
+                self.trackers["models"][model_type]["cache_misses"] = lm.cache_misses
+
+            # usage accumulated by the LM as calls are made (the history only keeps the most recent calls)
+            if isinstance(lm.history, LMHistory):
+                histories = [lm.history]
+
+                # hedged and failed over calls answered by the hedge LM are recorded in its own history
+                hedge_lm = getattr(lm, "hedge_lm", None)
+                if hedge_lm is not None and isinstance(hedge_lm.history, LMHistory):
+                    histories.append(hedge_lm.history)
+
+                if sum(history.calls for history in histories) == 0:
+                    return
+
+                self.trackers["models"][model_type]["calls"] = sum(
+                    history.calls for history in histories
+                )
+                self.trackers["models"][model_type]["input_tokens"] = sum(
+                    history.input_tokens for history in histories
+                )
+                self.trackers["models"][model_type]["output_tokens"] = sum(
+                    history.output_tokens for history in histories
+                )
+                self.trackers["models"][model_type]["cost"] = sum(
+                    history.cost for history in histories
+                )
+                return
+
             # check how many calls have been made
             prev_calls = self.trackers["models"][model_type]["calls"]
             total_calls = len(lm.history)
@@ -109,16 +154,23 @@ class Tracker:
         call_name: str = "",
         base_lm: dspy.LM | None = None,
         complex_lm: dspy.LM | None = None,
+        prompt_reductions: list[dict] | None = None,
+        start_time: float | None = None,
     ):
-        if self.trackers[tracker_name]["timer"]["start_time"] is None:
+        # start_time is given when the same tracker may be running more than once at a time (e.g. concurrent actions)
+        if prompt_reductions is not None:
+            self.add_prompt_reductions(prompt_reductions)
+
+        if start_time is None:
+            start_time = self.trackers[tracker_name]["timer"]["start_time"]
+
+        if start_time is None:
             self.logger.warning(f"Tracker {tracker_name} has not been started yet!")
             return
 
         self.trackers[tracker_name]["timer"]["calls"] += 1
 
-        time_taken = (
-            time.perf_counter() - self.trackers[tracker_name]["timer"]["start_time"]
-        )
+        time_taken = time.perf_counter() - start_time
         self.update_avg_time(tracker_name, time_taken)
         self.update_lm_costs(base_lm, "base_lm")
         self.update_lm_costs(complex_lm, "complex_lm")
@@ -132,6 +184,24 @@ class Tracker:
                 f"Time taken for {tracker_name}: {time_taken: .2f} seconds"
             )
 
+    def add_prompt_reductions(self, prompt_reductions: list[dict]):
+        for reduction in prompt_reductions:
+            self.prompt_reductions.append(reduction)
+            self.logger.debug(
+                f"Prompt for {reduction['signature']} ({reduction['task']}) shrunk from "
+                f"{reduction['tokens_before']} to {reduction['tokens_after']} tokens "
+                f"(budget {reduction['budget']}): {', '.join(reduction['reductions'])}"
+            )
+
+    def get_prompt_reductions(self, tracker_name: str | None = None):
+        if tracker_name is None:
+            return self.prompt_reductions
+        return [
+            reduction
+            for reduction in self.prompt_reductions
+            if reduction["task"] == tracker_name
+        ]
+
     def update_avg_time(self, tracker_name: str, time_taken: float):
         self.trackers[tracker_name]["timer"]["total_time"] += time_taken
         self.trackers[tracker_name]["timer"]["avg_time"] = (
@@ -156,6 +226,12 @@ class Tracker:
     def get_num_calls(self, model_type: str):
         return self.trackers["models"][model_type]["calls"]
 
+    def get_cache_hits(self, model_type: str):
+        return self.trackers["models"][model_type]["cache_hits"]
+
+    def get_cache_misses(self, model_type: str):
+        return self.trackers["models"][model_type]["cache_misses"]
+
     def get_average_time(self, tracker_name: str):
         return self.trackers[tracker_name]["timer"]["avg_time"]
 
@@ -273,6 +349,9 @@ class TrainingUpdate:
     """
     Record a training example for a module.
     Keep track of the inputs and outputs of the module, and the module name.
+
+    The inputs and outputs are only serialised when they are first accessed (e.g. via `to_json`),
+    as most training updates are never read.
     """
 
     def __init__(
@@ -281,9 +360,33 @@ class TrainingUpdate:
         inputs: dict,
         outputs: dict,
         extra_inputs: dict = {},
+        tree_data: "TreeData | None" = None,
     ):
+        """
+        Args:
+            module_name (str): The name of the module the training example is for.
+            inputs (dict): The inputs to the module.
+            outputs (dict): The outputs of the module.
+            extra_inputs (dict): Optional. Any additional inputs to add to the inputs.
+            tree_data (TreeData | None): Optional. The tree data at the time the module was called, which is added to the inputs.
+                Only a cheap snapshot of the tree data is taken here, which is serialised when the inputs are first accessed.
+        """
         self.module_name = module_name
 
+        self._raw_inputs = inputs
+        self._raw_outputs = outputs
+        self._extra_inputs = extra_inputs
+        self._tree_data = tree_data.snapshot() if tree_data is not None else None
+
+        self._inputs: dict | None = None
+        self._outputs: dict | None = None
+
+    def _serialise(self):
+        inputs = dict(self._raw_inputs)
+        if self._tree_data is not None:
+            inputs.update(self._tree_data.to_json())
+        outputs = self._raw_outputs
+
         # Format datetime in inputs and outputs
         format_dict_to_serialisable(inputs)
         format_dict_to_serialisable(outputs)
@@ -299,8 +402,25 @@ class TrainingUpdate:
         for key, value in outputs_copy.items():
             outputs_copy[key] = self._convert_basemodel(value)
 
-        self.inputs = {**inputs_copy, **extra_inputs}
-        self.outputs = outputs_copy
+        self._inputs = {**inputs_copy, **self._extra_inputs}
+        self._outputs = outputs_copy
+
+        # the raw data is no longer needed
+        self._raw_inputs = {}
+        self._raw_outputs = {}
+        self._tree_data = None
+
+    @property
+    def inputs(self) -> dict:
+        if self._inputs is None:
+            self._serialise()
+        return self._inputs  # type: ignore
+
+    @property
+    def outputs(self) -> dict:
+        if self._outputs is None:
+            self._serialise()
+        return self._outputs  # type: ignore
 
     def _convert_basemodel(self, value: Any):
         if isinstance(value, BaseModel):
@@ -0,0 +1,131 @@
+from functools import lru_cache
+from typing import Any
+
+import dspy
+
+# keyword arguments to `dspy.Predict` which are not inputs to the prompt
+_predict_kwargs = ["lm", "config", "demos", "signature", "new_signature"]
+
+_encoding: Any = None
+
+
+def count_tokens(text: str) -> int:
+    """
+    A fast, local count of the number of tokens in `text`.
+    Uses the `cl100k_base` encoding (bundled with litellm) for every model, so it is an approximation for non-OpenAI models.
+    If the encoding is unavailable, falls back to around four characters per token.
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            from litellm.litellm_core_utils.default_encoding import encoding
+
+            _encoding = encoding
+        except Exception:
+            _encoding = False
+
+    if _encoding is False:
+        return len(text) // 4 + 1
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+@lru_cache(maxsize=None)
+def _max_input_tokens(model: str) -> int | None:
+    try:
+        import litellm
+
+        model_info = litellm.get_model_info(model)
+    except Exception:
+        return None
+    return model_info.get("max_input_tokens") or model_info.get("max_tokens")
+
+
+def prompt_token_budget(model: str, budget: int | None = None) -> int | None:
+    """
+    The maximum number of tokens a prompt to `model` should use.
+
+    Args:
+        model (str): The full model name (e.g. `"openai/gpt-4o"`).
+        budget (int | None): The configured budget (`settings.PROMPT_TOKEN_BUDGET`), returned as is if set.
+
+    Returns:
+        (int | None): The budget, or 90% of the model's context window if no budget is configured.
+            None if there is no budget and the context window of the model is unknown.
+    """
+    if budget is not None:
+        return budget
+
+    max_input_tokens = _max_input_tokens(model)
+    if max_input_tokens is None:
+        return None
+    return int(max_input_tokens * 0.9)
+
+
+def estimate_prompt_tokens(
+    predict: dspy.Predict, inputs: dict, budget: int | None = None
+) -> int:
+    """
+    Estimate the number of tokens in the prompt `predict` would send for `inputs`,
+    by formatting the messages with the configured adapter (including any demos, given in `inputs` or set on `predict`)
+    and counting their tokens.
+
+    Every token is at least one byte, so if `budget` is given and the prompt has no more bytes than the budget,
+    the number of bytes is returned without tokenising the prompt.
+    Returns 0 if the prompt could not be formatted (the call itself will then report the problem).
+    """
+    adapter = dspy.settings.adapter or dspy.ChatAdapter()
+    try:
+        messages = adapter.format(
+            predict.signature,
+            inputs.get("demos", predict.demos),
+            {k: v for k, v in inputs.items() if k not in _predict_kwargs},
+        )
+    except Exception:
+        return 0
+
+    text = "\n".join(str(message["content"]) for message in messages)
+    num_bytes = len(text.encode())
+    if budget is not None and num_bytes <= budget:
+        return num_bytes
+    return count_tokens(text)
+
+
+def reduce_collection_schemas(schemas: dict, level: int) -> dict:
+    """
+    A smaller copy of the collection schemas (from `TreeData.output_collection_metadata`).
+
+    Args:
+        schemas (dict): The collection schemas, keyed by collection name.
+        level (int): How far to reduce the schemas.
+            1 removes the field statistics (groups, ranges, means etc.), keeping the name, type and description of each field.
+            2 also removes the field descriptions and shortens the collection summaries.
+
+    Returns:
+        (dict): The reduced schemas.
+    """
+    field_keys = ["name", "type", "description"] if level == 1 else ["name", "type"]
+
+    reduced = {}
+    for collection_name, schema in schemas.items():
+        reduced[collection_name] = {
+            **schema,
+            "fields": [
+                {k: v for k, v in field.items() if k in field_keys}
+                for field in schema.get("fields", [])
+            ],
+        }
+        summary = schema.get("summary")
+        if level >= 2 and isinstance(summary, str) and len(summary) > 300:
+            reduced[collection_name]["summary"] = summary[:300] + "... [truncated]"
+    return reduced
+
+
+class PromptReductions(list):
+    """
+    A record of the prompts that were shrunk to fit the prompt token budget (see `ElysiaChainOfThought`),
+    collected by the tree and reported through the `Tracker`.
+    Copies of modules (and the tree data within them) made for retries keep reporting to the same record.
+    """
+
+    def __deepcopy__(self, memo: dict) -> "PromptReductions":
+        return self
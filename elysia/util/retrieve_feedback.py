@@ -1,7 +1,12 @@
 from elysia.util.client import ClientManager
+from elysia.lm.answer_cache import prompt_ngrams, ngram_similarity
 import json
+import time
 import dspy
 import random
+import asyncio
+import threading
+from collections import OrderedDict
 from weaviate.classes.query import Filter, MetadataQuery
 
 
@@ -90,3 +95,156 @@ async def retrieve_feedback(
         )
 
     return examples, relevant_uuids
+
+
+class FeedbackExamples:
+    """
+    The few-shot examples (and the UUIDs of the feedback objects they came from)
+    retrieved for a prompt, for one feedback model.
+    """
+
+    def __init__(self, prompt: str, examples: list[dspy.Example], uuids: list[str]):
+        self.prompt = prompt
+        self.ngrams = prompt_ngrams(prompt)
+        self.examples = examples
+        self.uuids = uuids
+        self.created = time.time()
+        self.stale = False
+        self.refreshing = False
+
+
+class FeedbackExampleCache:
+    """
+    An in-memory cache of feedback examples, keyed on the Weaviate cluster, the feedback model
+    and the prompt (prompts with a character trigram similarity of at least `similarity_threshold` share examples).
+
+    Entries older than `ttl` seconds, or for a feedback model that has new feedback (see `mark_stale`),
+    are still returned, but are refreshed in the background by `retrieve_feedback_cached`.
+    The least recently used entries are evicted when there are more than `max_entries`.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl: float = 600,
+        similarity_threshold: float = 0.9,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self._entries: OrderedDict[tuple[str, str, str], FeedbackExamples] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, cluster: str, model: str, prompt: str) -> FeedbackExamples | None:
+        with self._lock:
+            key = (cluster, model, prompt)
+            if key not in self._entries:
+                ngrams = prompt_ngrams(prompt)
+                best_similarity = self.similarity_threshold
+                key = None
+                for entry_key, entry in self._entries.items():
+                    if entry_key[:2] != (cluster, model):
+                        continue
+                    similarity = ngram_similarity(ngrams, entry.ngrams)
+                    if similarity >= best_similarity:
+                        key, best_similarity = entry_key, similarity
+
+                if key is None:
+                    return None
+
+            self._entries.move_to_end(key)
+            entry = self._entries[key]
+            if time.time() - entry.created > self.ttl:
+                entry.stale = True
+            return entry
+
+    def set(
+        self,
+        cluster: str,
+        model: str,
+        prompt: str,
+        examples: list[dspy.Example],
+        uuids: list[str],
+    ) -> FeedbackExamples:
+        entry = FeedbackExamples(prompt, examples, uuids)
+        with self._lock:
+            self._entries[(cluster, model, prompt)] = entry
+            self._entries.move_to_end((cluster, model, prompt))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def mark_stale(self, models: list[str] | None = None) -> None:
+        """
+        Mark the entries for the given feedback models (or all entries, if None) to be refreshed when they are next used.
+        Called when new feedback is created.
+        """
+        with self._lock:
+            for (_, model, _), entry in self._entries.items():
+                if models is None or model in models:
+                    entry.stale = True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# one feedback example cache per process, shared across every tree
+feedback_example_cache = FeedbackExampleCache()
+
+# background refreshes in progress (referenced so they are not garbage collected)
+_refresh_tasks: set[asyncio.Task] = set()
+
+
+async def _refresh_feedback_examples(
+    client_manager: ClientManager,
+    entry: FeedbackExamples,
+    model: str,
+    n: int,
+):
+    try:
+        examples, uuids = await retrieve_feedback(
+            client_manager, entry.prompt, model, n=n
+        )
+    except Exception:
+        # keep the stale examples, and try again on the next use
+        entry.refreshing = False
+        return
+
+    feedback_example_cache.set(
+        client_manager.wcd_url, model, entry.prompt, examples, uuids
+    )
+
+
+async def retrieve_feedback_cached(
+    client_manager: ClientManager, user_prompt: str, model: str, n: int = 6
+) -> tuple[list[dspy.Example], list[str]]:
+    """
+    Retrieve similar examples from the database (see `retrieve_feedback`), via the `feedback_example_cache`.
+    Only the first prompt similar to `user_prompt` waits for the database,
+    stale examples are returned straight away and refreshed in the background.
+    """
+    entry = feedback_example_cache.get(client_manager.wcd_url, model, user_prompt)
+
+    if entry is None:
+        examples, uuids = await retrieve_feedback(
+            client_manager, user_prompt, model, n=n
+        )
+        entry = feedback_example_cache.set(
+            client_manager.wcd_url, model, user_prompt, examples, uuids
+        )
+
+    elif entry.stale and not entry.refreshing:
+        entry.refreshing = True
+        task = asyncio.create_task(
+            _refresh_feedback_examples(client_manager, entry, model, n)
+        )
+        _refresh_tasks.add(task)
+        task.add_done_callback(_refresh_tasks.discard)
+
+    return entry.examples, entry.uuids
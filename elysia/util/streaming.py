@@ -0,0 +1,134 @@
+import json
+from typing import Any
+
+# the start of a field header in the `dspy.ChatAdapter` output format, e.g. `[[ ## response ## ]]`
+_header_start = "[[ ##"
+
+
+class FieldStream:
+    """
+    Extracts the text of one output field from the chunks of a streamed completion in the `dspy.ChatAdapter` format,
+    where each output field follows a `[[ ## field_name ## ]]` header.
+
+    Text is returned as soon as it cannot be part of the next header, with the whitespace around the field removed.
+    Completions in any other format (e.g. JSON) return no text.
+    """
+
+    def __init__(self, field_name: str):
+        self.header = f"[[ ## {field_name} ## ]]"
+        self.finished = False
+
+        self._buffer = ""
+        self._start: int | None = None
+        self._emitted = 0
+
+    def feed(self, chunk: str) -> str:
+        """
+        Add a chunk of the completion.
+
+        Returns:
+            (str): Any new text of the field (possibly empty).
+        """
+        if self.finished:
+            return ""
+
+        self._buffer += chunk
+        if self._start is None:
+            index = self._buffer.find(self.header)
+            if index == -1:
+                return ""
+            self._start = index + len(self.header)
+            self._emitted = self._start
+
+        end = self._buffer.find(
+            _header_start, max(self._emitted - len(_header_start), self._start)
+        )
+        if end != -1:
+            self.finished = True
+            text = self._buffer[self._emitted : end].rstrip()
+        else:
+            # hold back anything which could be the start of the next header, or trailing whitespace
+            limit = len(self._buffer)
+            for i in range(len(_header_start) - 1, 0, -1):
+                if self._buffer.endswith(_header_start[:i]):
+                    limit -= i
+                    break
+            text = self._buffer[self._emitted : limit].rstrip()
+
+        if self._emitted == self._start:
+            text = text.lstrip()
+            if text == "":
+                return ""
+            self._emitted = self._buffer.index(text[0], self._emitted)
+
+        self._emitted += len(text)
+        return text
+
+
+class JSONListStream:
+    """
+    Parses the items of a JSON list from its text as it is streamed, returning each item as soon as it is complete.
+    Items which are not valid JSON are skipped.
+    """
+
+    def __init__(self):
+        self.finished = False
+
+        self._buffer = ""
+        self._position = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._item_start: int | None = None
+
+    def feed(self, text: str) -> list[Any]:
+        """
+        Add more text of the list.
+
+        Returns:
+            (list[Any]): The items completed by this text, in order.
+        """
+        self._buffer += text
+        items = []
+
+        while self._position < len(self._buffer) and not self.finished:
+            char = self._buffer[self._position]
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+
+            elif self._depth == 0:
+                if char == "[":
+                    self._depth = 1
+
+            elif self._depth == 1 and char in ",]":
+                if self._item_start is not None:
+                    try:
+                        items.append(
+                            json.loads(self._buffer[self._item_start : self._position])
+                        )
+                    except json.JSONDecodeError:
+                        pass
+                    self._item_start = None
+                if char == "]":
+                    self._depth = 0
+                    self.finished = True
+
+            else:
+                if self._depth == 1 and self._item_start is None and not char.isspace():
+                    self._item_start = self._position
+                if char == '"':
+                    self._in_string = True
+                elif char in "[{":
+                    self._depth += 1
+                elif char in "]}":
+                    self._depth -= 1
+
+            self._position += 1
+
+        return items
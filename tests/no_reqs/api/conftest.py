@@ -1,5 +1,7 @@
 import asyncio
+import os
 import pytest
+from pathlib import Path
 from elysia.util.dummy_adapter import DummyAdapter
 from dspy import configure, ChatAdapter, LM
 import dspy
@@ -25,3 +27,24 @@ def use_dummy_adapter():
     yield
 
     configure(adapter=ChatAdapter())
+
+
+def get_frontend_config_file_paths() -> list[str]:
+    elysia_package_dir = Path(__file__).parent.parent.parent.parent  # Gets to elysia/
+    config_dir = elysia_package_dir / "elysia" / "api" / "user_configs"
+    config_files = os.listdir(config_dir)
+    return [
+        f"{config_dir}/{c}"
+        for c in config_files
+        if c.startswith("frontend_config_test_")
+    ]
+
+
+@pytest.fixture(scope="session", autouse=True)
+def cleanup_frontend_configs(request):
+    yield
+
+    # saving a user config also saves the frontend config locally
+    for config_file in get_frontend_config_file_paths():
+        if os.path.exists(config_file):
+            os.remove(config_file)
@@ -0,0 +1,99 @@
+from elysia.lm.answer_cache import AnswerCache, prompt_similarity
+
+
+def _set(cache: AnswerCache, prompt: str, fingerprint: str = "fingerprint"):
+    cache.set(
+        prompt,
+        fingerprint,
+        payloads=[{"type": "text", "payload": {"prompt": prompt}}],
+        conversation=[{"role": "assistant", "content": "answer"}],
+        environment={},
+    )
+
+
+def test_prompt_similarity():
+    assert prompt_similarity("How many products?", "how many  products") == 1.0
+    assert (
+        prompt_similarity("How many products are there?", "How many products are there")
+        > 0.95
+    )
+    assert (
+        prompt_similarity("How many products are there?", "What is the weather?") < 0.5
+    )
+
+
+def test_answer_cache_near_identical_prompt():
+    cache = AnswerCache(similarity_threshold=0.9)
+    _set(cache, "What are the most expensive products in the store?")
+
+    prompts = [
+        "what are the most expensive products in the store",
+        "What are the most expensive products in this store?",
+    ]
+    for prompt in prompts:
+        assert cache.get(prompt, "fingerprint") is not None
+    assert cache.get("What are the cheapest products?", "fingerprint") is None
+    assert (
+        cache.get("What are the most expensive products in the shop?", "fingerprint")
+        is None
+    )
+
+
+def test_answer_cache_numbers_and_names_must_match():
+    cache = AnswerCache()
+    _set(cache, "Show me products that cost more than 50 dollars in the store")
+    _set(cache, "How many orders were placed in 2023?")
+    _set(cache, "What did Alice order last week?")
+
+    assert (
+        cache.get(
+            "Show me products that cost more than 90 dollars in the store",
+            "fingerprint",
+        )
+        is None
+    )
+    assert cache.get("How many orders were placed in 2024?", "fingerprint") is None
+    assert cache.get("What did Alicia order last week?", "fingerprint") is None
+
+    # but prompts that only differ in common words still match
+    assert cache.get("How many orders were placed in 2023", "fingerprint") is not None
+    assert (
+        cache.get(
+            "Show me the products that cost more than 50 dollars in the store",
+            "fingerprint",
+        )
+        is not None
+    )
+
+
+def test_answer_cache_fingerprint_must_match():
+    cache = AnswerCache()
+    _set(cache, "How many products are there?", fingerprint="a")
+
+    assert cache.get("How many products are there?", "a") is not None
+    assert cache.get("How many products are there?", "b") is None
+
+
+def test_answer_cache_lru_eviction():
+    cache = AnswerCache(max_entries=2)
+    _set(cache, "first prompt")
+    _set(cache, "second prompt")
+
+    # access the first prompt so the second is the least recently used
+    assert cache.get("first prompt", "fingerprint") is not None
+    _set(cache, "third prompt")
+
+    assert len(cache) == 2
+    assert cache.get("first prompt", "fingerprint") is not None
+    assert cache.get("second prompt", "fingerprint") is None
+    assert cache.get("third prompt", "fingerprint") is not None
+
+
+def test_answer_cache_byte_bound():
+    cache = AnswerCache(max_bytes=300)
+    _set(cache, "first prompt")
+    _set(cache, "second prompt")
+    _set(cache, "third prompt")
+
+    assert cache._size <= 300
+    assert cache.get("third prompt", "fingerprint") is not None
@@ -0,0 +1,62 @@
+import asyncio
+
+from elysia.lm.elysia_lm import ElysiaLM
+from elysia.lm.lm_governor import lm_priority
+
+
+def _fake_lm(responses: list[tuple[float, str | Exception]], **kwargs) -> ElysiaLM:
+    """
+    An ElysiaLM whose provider calls return (or raise) the given responses in order, after the given delays.
+    """
+    lm = ElysiaLM(model="openai/fake-model", **kwargs)
+    calls = iter(responses)
+
+    async def provider_acall(prompt, messages, kwargs):
+        delay, response = next(calls)
+        await asyncio.sleep(delay)
+        if isinstance(response, Exception):
+            raise response
+        return [response]
+
+    lm._provider_acall = provider_acall  # type: ignore
+    return lm
+
+
+def test_hedged_request_uses_first_response():
+    lm = _fake_lm([(1.0, "slow"), (0.01, "fast")], hedge_percentile=90)
+    lm.latencies.extend([0.05] * lm.min_hedge_samples)
+
+    outputs = asyncio.run(lm.acall("hello"))
+    assert outputs == ["fast"]
+    assert lm.hedged_calls == 1
+
+
+def test_no_hedge_without_enough_samples():
+    lm = _fake_lm([(0.1, "primary"), (0.01, "duplicate")], hedge_percentile=90)
+
+    outputs = asyncio.run(lm.acall("hello"))
+    assert outputs == ["primary"]
+    assert lm.hedged_calls == 0
+
+
+def test_background_calls_are_not_hedged():
+    lm = _fake_lm([(0.1, "primary"), (0.01, "duplicate")], hedge_percentile=90)
+    lm.latencies.extend([0.01] * lm.min_hedge_samples)
+
+    async def run():
+        with lm_priority("background"):
+            return await lm.acall("hello")
+
+    assert asyncio.run(run()) == ["primary"]
+    assert lm.hedged_calls == 0
+
+
+def test_failover_to_hedge_lm():
+    hedge_lm = _fake_lm([(0.01, "secondary")])
+    lm = _fake_lm(
+        [(0.01, ValueError("provider error"))], hedge_percentile=90, hedge_lm=hedge_lm
+    )
+
+    outputs = asyncio.run(lm.acall("hello"))
+    assert outputs == ["secondary"]
+    assert lm.failovers == 1
@@ -0,0 +1,100 @@
+import os
+import time
+
+from elysia.lm.lm_cache import LMResponseCache, get_response_cache
+
+
+def test_response_cache_key_normalisation():
+    key_a = LMResponseCache.make_key(
+        "openai/gpt-4o-mini",
+        None,
+        [{"role": "user", "content": "  hello  "}],
+        {"temperature": 0.0},
+    )
+    key_b = LMResponseCache.make_key(
+        "openai/gpt-4o-mini",
+        None,
+        [{"role": "user", "content": "hello"}],
+        {"temperature": 0.0},
+    )
+    key_c = LMResponseCache.make_key(
+        "openai/gpt-4o-mini",
+        None,
+        [{"role": "user", "content": "hello"}],
+        {"temperature": 1.0},
+    )
+    assert key_a == key_b
+    assert key_a != key_c
+
+
+def test_response_cache_get_set(tmp_path):
+    cache = LMResponseCache(os.path.join(tmp_path, "lm_cache.db"))
+    assert cache.get("key") is None
+
+    cache.set("key", ["response"])
+    assert cache.get("key") == ["response"]
+    assert len(cache) == 1
+
+    cache.clear()
+    assert cache.get("key") is None
+    assert len(cache) == 0
+
+
+def test_response_cache_ttl(tmp_path):
+    cache = LMResponseCache(os.path.join(tmp_path, "lm_cache.db"), ttl=0.01)
+    cache.set("key", ["response"])
+    time.sleep(0.05)
+    assert cache.get("key") is None
+    assert len(cache) == 0
+
+
+def test_response_cache_lru_eviction(tmp_path):
+    cache = LMResponseCache(os.path.join(tmp_path, "lm_cache.db"), max_bytes=100)
+    cache.set("a", ["x" * 30])
+    time.sleep(0.01)
+    cache.set("b", ["x" * 30])
+    time.sleep(0.01)
+
+    # access "a" so "b" is the least recently used
+    assert cache.get("a") is not None
+    time.sleep(0.01)
+    cache.set("c", ["x" * 30])
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+
+
+def test_get_response_cache_is_shared(tmp_path):
+    path = os.path.join(tmp_path, "lm_cache.db")
+    cache_a = get_response_cache(path)
+    cache_b = get_response_cache(path, ttl=None)
+    assert cache_a is cache_b
+    assert cache_a.ttl is None
+
+
+def test_feedback_example_cache():
+    from elysia.util.retrieve_feedback import FeedbackExampleCache
+
+    cache = FeedbackExampleCache(max_entries=2, similarity_threshold=0.9)
+    cache.set("cluster", "decision", "What are the newest products?", [], ["uuid"])
+
+    # similar prompts share examples, for the same cluster and feedback model only
+    entry = cache.get("cluster", "decision", "what are the newest products")
+    assert entry is not None and entry.uuids == ["uuid"]
+    assert cache.get("cluster", "query", "What are the newest products?") is None
+    assert (
+        cache.get("other_cluster", "decision", "What are the newest products?") is None
+    )
+    assert cache.get("cluster", "decision", "Show me all the tickets") is None
+
+    # new feedback for the model marks the examples to be refreshed
+    assert not entry.stale
+    cache.mark_stale(["query"])
+    assert not entry.stale
+    cache.mark_stale(["decision"])
+    assert entry.stale
+
+    cache.set("cluster", "decision", "second prompt", [], [])
+    cache.set("cluster", "decision", "third prompt", [], [])
+    assert len(cache) == 2
@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+from elysia.lm.lm_governor import LMGovernor, lm_priority
+
+
+class FakeLM:
+    """
+    Records the order of calls and the maximum number of calls in progress at once.
+    """
+
+    def __init__(self, governor: LMGovernor, model: str = "openai/fake-model"):
+        self.governor = governor
+        self.model = model
+        self.in_progress = 0
+        self.max_in_progress = 0
+        self.calls = []
+
+    async def acall(self, name: str, duration: float = 0.01):
+        async with self.governor.slot(self.model):
+            self.in_progress += 1
+            self.max_in_progress = max(self.max_in_progress, self.in_progress)
+            self.calls.append(name)
+            await asyncio.sleep(duration)
+            self.in_progress -= 1
+
+
+def test_max_in_flight():
+    governor = LMGovernor(max_in_flight=2)
+    lm = FakeLM(governor)
+
+    async def run():
+        await asyncio.gather(*[lm.acall(f"call_{i}") for i in range(6)])
+
+    asyncio.run(run())
+    assert lm.max_in_progress == 2
+    assert len(lm.calls) == 6
+    assert governor.in_flight == 0
+    assert governor.get_metrics()["interactive"]["requests"] == 6
+
+
+def test_priority_lanes():
+    governor = LMGovernor(max_in_flight=1)
+    lm = FakeLM(governor)
+
+    async def background(name: str):
+        with lm_priority("background"):
+            await lm.acall(name)
+
+    async def run():
+        # the first call holds the only slot while the others queue
+        first = asyncio.create_task(lm.acall("first", duration=0.05))
+        await asyncio.sleep(0.01)
+        await asyncio.gather(
+            background("title"),
+            background("suggestions"),
+            lm.acall("decision"),
+        )
+        await first
+
+    asyncio.run(run())
+    assert lm.calls == ["first", "decision", "title", "suggestions"]
+    assert governor.get_metrics()["background"]["max_wait"] > 0
+
+
+def test_cancelled_waiter_releases_slot():
+    governor = LMGovernor(max_in_flight=1)
+    lm = FakeLM(governor)
+
+    async def run():
+        first = asyncio.create_task(lm.acall("first", duration=0.05))
+        await asyncio.sleep(0.01)
+        waiting = asyncio.create_task(lm.acall("cancelled"))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        await first
+        await lm.acall("after")
+
+    asyncio.run(run())
+    assert lm.calls == ["first", "after"]
+    assert governor.in_flight == 0
+
+
+def test_requests_per_minute():
+    # 600 requests per minute is 10 per second, with a burst of 10
+    governor = LMGovernor(requests_per_minute={"openai": 600})
+    lm = FakeLM(governor)
+    other_lm = FakeLM(governor, model="anthropic/fake-model")
+
+    async def run():
+        await asyncio.gather(*[lm.acall(f"call_{i}", duration=0) for i in range(12)])
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    assert time.perf_counter() - start >= 0.15
+
+    # other providers are not limited
+    start = time.perf_counter()
+    asyncio.run(other_lm.acall("other", duration=0))
+    assert time.perf_counter() - start < 0.1
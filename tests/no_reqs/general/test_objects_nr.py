@@ -1,10 +1,14 @@
 import asyncio
+import json
+from copy import copy, deepcopy
 import os
 import pytest
 from typing import Any
 from weaviate.classes.query import Filter, QueryReference
 
 from elysia.tree.objects import Environment
+from elysia.tree.tree import Tree
+from elysia.util.objects import TrainingUpdate
 from elysia.objects import (
     Completed,
     Response,
@@ -216,6 +220,172 @@ def test_environment():
     assert len(environment.environment["test_tool2"]["test_result2"]) == 1
 
 
+def test_environment_duplicates():
+    environment = Environment()
+
+    environment.add_objects("test_tool", "test_result", [{"a": 1}, {"a": 2}])
+    original_ref_id = environment.find("test_tool", "test_result", 0)["objects"][0][
+        "_REF_ID"
+    ]
+
+    # duplicates are detected by content, regardless of any _REF_ID on the new object
+    environment.add_objects(
+        "test_tool",
+        "test_result",
+        [{"_REF_ID": "some_other_id", "a": 1}, {"a": 3}, {"a": 3}],
+    )
+    second = environment.find("test_tool", "test_result", 1)["objects"]
+    assert second[0] == {"object_info": "[repeat]", "_REF_ID": original_ref_id}
+    assert second[1]["a"] == 3
+    assert second[2] == {"object_info": "[repeat]", "_REF_ID": second[1]["_REF_ID"]}
+
+    # duplicates are only checked within the same tool and name
+    environment.add_objects("test_tool", "other_result", [{"a": 1}])
+    assert environment.find("test_tool", "other_result", 0)["objects"][0]["a"] == 1
+
+    environment.add_objects(
+        "test_tool", "test_result", [{"a": 1}], include_duplicates=True
+    )
+    included = environment.find("test_tool", "test_result", 2)["objects"][0]
+    assert included["a"] == 1
+    assert included["_REF_ID"] != original_ref_id
+
+    # removed objects are no longer treated as duplicates
+    environment.remove("test_tool", "test_result")
+    environment.add_objects("test_tool", "test_result", [{"a": 1}])
+    assert environment.find("test_tool", "test_result", 0)["objects"][0]["a"] == 1
+
+    # replaced objects are picked up by the index
+    environment.replace(
+        "test_tool", "test_result", [{"_REF_ID": "replaced_0", "b": 1}], index=0
+    )
+    environment.add_objects("test_tool", "test_result", [{"a": 1}, {"b": 1}])
+    added = environment.find("test_tool", "test_result", 1)["objects"]
+    assert added[0]["a"] == 1
+    assert added[1] == {"object_info": "[repeat]", "_REF_ID": "replaced_0"}
+
+    # the index is rebuilt when loading from json
+    loaded = Environment.from_json(environment.to_json())
+    loaded.add_objects("test_tool", "test_result", [{"b": 1}])
+    assert loaded.find("test_tool", "test_result", 2)["objects"][0] == {
+        "object_info": "[repeat]",
+        "_REF_ID": "replaced_0",
+    }
+
+    # snapshots keep their own index as the environment changes
+    snapshot = environment.snapshot()
+    environment.add_objects("test_tool", "test_result", [{"a": 4}])
+    assert '{"a": 4}' not in snapshot._duplicate_index[("test_tool", "test_result")]
+
+
+def test_environment_ref_ids():
+    environment = Environment()
+
+    environment.add_objects("test_tool", "test_result", [{"a": 1}, {"a": 2}])
+    environment.add_objects("test_tool", "test_result", [{"a": 3}, {"a": 1}])
+    environment.add_objects("other_tool", "other_result", [{"_REF_ID": "x", "b": 1}])
+
+    first = environment.find("test_tool", "test_result", 0)["objects"]
+    second = environment.find("test_tool", "test_result", 1)["objects"]
+
+    assert environment.locate_ref_id(first[1]["_REF_ID"]) == (
+        "test_tool",
+        "test_result",
+        0,
+        1,
+    )
+    assert environment.find_by_ref_id(second[0]["_REF_ID"]) == second[0]
+    assert environment.find_by_ref_id("x") == {"_REF_ID": "x", "b": 1}
+    assert environment.find_by_ref_id("missing") is None
+
+    # repeats resolve to the original object
+    assert environment.find_by_ref_id(second[1]["_REF_ID"]) is first[0]
+
+    found = environment.find_by_ref_ids([first[0]["_REF_ID"], "x", "missing"])
+    assert list(found.keys()) == [first[0]["_REF_ID"], "x"]
+
+    # positions are updated when results are removed
+    a3_ref_id = second[0]["_REF_ID"]
+    environment.remove("test_tool", "test_result", 0)
+    assert environment.find_by_ref_id(first[0]["_REF_ID"]) is None
+    assert environment.locate_ref_id(a3_ref_id) == ("test_tool", "test_result", 0, 0)
+
+    environment.replace("other_tool", "other_result", [{"_REF_ID": "y", "b": 2}])
+    assert environment.find_by_ref_id("x") is None
+    assert environment.find_by_ref_id("y") == {"_REF_ID": "y", "b": 2}
+
+    # and survive a json round trip
+    loaded = Environment.from_json(environment.to_json())
+    assert loaded.locate_ref_id(a3_ref_id) == ("test_tool", "test_result", 0, 0)
+    assert loaded.find_by_ref_id("y") == {"_REF_ID": "y", "b": 2}
+
+    # snapshots keep their own indices as the environment changes
+    snapshot = environment.snapshot()
+    environment.add_objects("test_tool", "test_result", [{"_REF_ID": "a4", "a": 4}])
+    assert "a4" not in snapshot._ref_index
+    assert snapshot.locate_ref_id("a4") is None
+
+
+def test_environment_render():
+    environment = Environment()
+
+    environment.add(
+        "query",
+        Result(
+            objects=[{"title": "old", "text": "a" * 5000}],
+            metadata={"collection_name": "Old"},
+            name="Old",
+            llm_message="Old collection summary",
+        ),
+    )
+    environment.add(
+        "query",
+        Result(
+            objects=[{"title": f"new {i}", "text": "b" * 100} for i in range(10)],
+            metadata={"collection_name": "New"},
+            name="New",
+        ),
+    )
+    environment.add_objects("query", "New", [{"title": "new 0", "text": "b" * 100}])
+
+    # no budget returns the environment as is
+    assert environment.render() is environment.environment
+
+    rendered = environment.render(token_budget=100000, max_text_length=100)
+    old_text = rendered["query"]["Old"][0]["objects"][0]["text"]
+    assert old_text == "a" * 100 + "... [truncated]"
+    assert len(rendered["query"]["New"][0]["objects"]) == 10
+    assert rendered["query"]["New"][1]["objects"] == [
+        {
+            "object_info": "[repeat] 1 objects already in the environment",
+            "_REF_IDs": [rendered["query"]["New"][0]["objects"][0]["_REF_ID"]],
+        }
+    ]
+    assert "SelfInfo" in rendered
+
+    # a small budget keeps the most recent results, and summarises older ones
+    self_info_tokens = len(json.dumps(environment.environment["SelfInfo"])) // 4
+    rendered = environment.render(
+        token_budget=self_info_tokens + 300, max_text_length=100
+    )
+    new_results = rendered["query"]["New"]
+    assert len(new_results[0]["objects"]) < 10
+    assert new_results[0]["objects"][-1].endswith("more objects not shown]")
+    assert "objects" in new_results[1]
+    assert rendered["query"]["Old"] == [{"summary": "Old collection summary"}]
+
+    # results relevant to the prompt are prioritised
+    rendered = environment.render(
+        token_budget=self_info_tokens + 300,
+        user_prompt="summarise the old collection",
+        max_text_length=100,
+    )
+    assert "objects" in rendered["query"]["Old"][0]
+
+    # the environment itself is unchanged
+    assert len(environment.environment["query"]["Old"][0]["objects"][0]["text"]) == 5000
+
+
 @pytest.mark.asyncio
 async def test_updates():
     types = [
@@ -236,3 +406,419 @@ async def test_updates():
         )
         assert frontend_result["type"] == object_name
         assert isinstance(frontend_result["payload"], dict)
+
+
+def test_lazy_training_update():
+    tree = Tree()
+    tree_data = tree.tree_data
+    tree_data.environment.add_objects("test_tool", "test_result", [{"a": 1}])
+    tree_data.update_list("conversation_history", {"role": "user", "content": "Hi"})
+
+    training_update = TrainingUpdate(
+        module_name="test_module",
+        inputs={"test_input": 1},
+        outputs={"test_output": 2},
+        tree_data=tree_data,
+    )
+
+    # nothing is serialised until it is needed
+    assert training_update._inputs is None
+
+    # later changes to the tree data do not affect the training update
+    tree_data.environment.add_objects("test_tool", "test_result", [{"b": 2}])
+    tree_data.conversation_history[-1]["content"] += " there"
+    tree_data.update_list(
+        "conversation_history", {"role": "assistant", "content": "Hello"}
+    )
+
+    training_update_json = training_update.to_json()
+    assert training_update_json["module_name"] == "test_module"
+    assert training_update_json["inputs"]["test_input"] == 1
+    assert training_update_json["outputs"] == {"test_output": 2}
+    assert training_update_json["inputs"]["conversation_history"] == [
+        {"role": "user", "content": "Hi"}
+    ]
+    environment = training_update_json["inputs"]["environment"]["environment"]
+    assert len(environment["test_tool"]["test_result"]) == 1
+    assert len(tree_data.environment.environment["test_tool"]["test_result"]) == 2
+
+
+def test_tasks_completed():
+    tree_data = Tree().tree_data
+
+    tree_data.update_tasks_completed(
+        prompt="first prompt", task="query", num_trees_completed=0, reasoning="a"
+    )
+    tree_data.update_tasks_completed(
+        prompt="first prompt", task="query", num_trees_completed=0, reasoning="b"
+    )
+    tree_data.update_tasks_completed(
+        prompt="first prompt", task="query", num_trees_completed=1, error=True
+    )
+    first_string = tree_data.tasks_completed_string()
+
+    tree_data.update_tasks_completed(
+        prompt="second prompt", task="aggregate", num_trees_completed=0, action=True
+    )
+
+    assert tree_data.tasks_completed == [
+        {
+            "prompt": "first prompt",
+            "task": [
+                {"task": "query", "iteration": 0, "reasoning": "a\nb"},
+                {"task": "query", "iteration": 1, "error": True},
+            ],
+        },
+        {
+            "prompt": "second prompt",
+            "task": [{"task": "aggregate", "iteration": 0, "action": True}],
+        },
+    ]
+
+    # only the new prompt is added to the cached string
+    second_string = tree_data.tasks_completed_string()
+    assert second_string.startswith(first_string)
+    assert "<prompt_2>" in second_string and "Chosen action: aggregate" in second_string
+    assert tree_data.tasks_completed_string() is second_string
+
+    # the cache is shared with shallow copies, and updated for changes to earlier tasks
+    tree_data_copy = copy(tree_data)
+    tree_data.update_tasks_completed(
+        prompt="second prompt", task="aggregate", num_trees_completed=0, parsed_info="x"
+    )
+    assert "Parsed_info: x" in tree_data_copy.tasks_completed_string()
+
+    # replacing tasks_completed (e.g. loading from json) re-indexes
+    tree_data.tasks_completed = deepcopy(tree_data.tasks_completed)
+    tree_data.update_tasks_completed(
+        prompt="first prompt", task="query", num_trees_completed=1, reasoning="c"
+    )
+    assert tree_data.tasks_completed[0]["task"][1]["reasoning"] == "c"
+    assert "Reasoning: c" in tree_data.tasks_completed_string()
+    assert not any(key.startswith("_") for key in tree_data.to_json())
+
+
+def test_tree_history():
+    tree = Tree()
+    tree_data = tree.tree_data
+
+    # first query
+    tree_data.user_prompt = "first prompt"
+    tree_data.update_list(
+        "conversation_history", {"role": "user", "content": "first prompt"}
+    )
+    tree_data.update_tasks_completed(
+        prompt="first prompt", task="query", num_trees_completed=0, action=True
+    )
+    tree_data.environment.add_objects("query", "collection", [{"a": 1}])
+    tree_data.environment.hidden_environment["cursor"] = 1
+    tree_data.errors["query"] = ["first error"]
+    tree.history.record("query_1", tree_data, decision_history=["query"])
+
+    # second query, which changes the last message and adds new data
+    tree_data.user_prompt = "second prompt"
+    tree_data.conversation_history[-1]["content"] += " and more"
+    tree_data.update_tasks_completed(
+        prompt="second prompt", task="aggregate", num_trees_completed=0, action=True
+    )
+    tree_data.environment.add_objects("query", "collection", [{"b": 2}])
+    tree_data.environment.hidden_environment["cursor"] = 2
+    tree_data.errors["query"].append("second error")
+    tree_data.settings.configure(logging_level="DEBUG")
+    tree.history.record("query_2", tree_data, decision_history=["aggregate"])
+    tree_data.errors["query"] = []
+    ref_id = tree_data.environment.environment["query"]["collection"][1]["objects"][0][
+        "_REF_ID"
+    ]
+    tree_data.environment.remove("query", "collection")
+
+    # only the changes are stored
+    assert tree.history.records[1]["conversation_history"][0] == 0
+    assert tree.history.records[1]["tasks_completed"][0] == 1
+    assert tree.history.records[1]["environment"][("query", "collection")][0] == 1
+
+    first = tree.history["query_1"]
+    assert first["decision_history"] == ["query"]
+    assert first["tree_data"].user_prompt == "first prompt"
+    assert first["tree_data"].conversation_history == [
+        {"role": "user", "content": "first prompt"}
+    ]
+    assert [t["prompt"] for t in first["tree_data"].tasks_completed] == ["first prompt"]
+    assert len(first["tree_data"].environment.environment["query"]["collection"]) == 1
+
+    # the other fields are those at the time of the query, not the current ones
+    assert first["tree_data"].errors == {"query": ["first error"]}
+    assert first["tree_data"].environment.hidden_environment == {"cursor": 1}
+    assert first["tree_data"].settings.LOGGING_LEVEL != "DEBUG"
+    assert first["tree_data"].environment.find_by_ref_id(ref_id) is None
+
+    second = tree.history["query_2"]
+    assert second["tree_data"].user_prompt == "second prompt"
+    assert second["tree_data"].conversation_history == [
+        {"role": "user", "content": "first prompt and more"}
+    ]
+    assert len(second["tree_data"].tasks_completed) == 2
+    assert len(second["tree_data"].environment.environment["query"]["collection"]) == 2
+    assert second["tree_data"].errors == {"query": ["first error", "second error"]}
+    assert second["tree_data"].environment.hidden_environment == {"cursor": 2}
+    assert second["tree_data"].settings.LOGGING_LEVEL == "DEBUG"
+    assert second["tree_data"].environment.find_by_ref_id(ref_id) is not None
+
+    # reconstructed data can be modified without affecting the history
+    first["tree_data"].tasks_completed[0]["task"][0]["action"] = "changed"
+    assert (
+        tree.history["query_1"]["tree_data"].tasks_completed[0]["task"][0]["action"]
+        is True
+    )
+
+    assert "query_1" in tree.history and len(tree.history) == 2
+    tree.history.clear()
+    assert "query_1" not in tree.history
+
+
+def test_elysia_chain_of_thought_signature_cache():
+    import dspy
+    from elysia.util.elysia_chain_of_thought import ElysiaChainOfThought
+
+    class ExamplePrompt(dspy.Signature):
+        """Answer the question."""
+
+        question: str = dspy.InputField()
+        answer: str = dspy.OutputField()
+
+    tree = Tree()
+    kwargs = {"environment": True, "tasks_completed": True}
+
+    first = ElysiaChainOfThought(ExamplePrompt, tree_data=tree.tree_data, **kwargs)
+    second = ElysiaChainOfThought(ExamplePrompt, tree_data=tree.tree_data, **kwargs)
+
+    # same signature and flags share the extended signature, but not the predictor
+    assert first.predict.signature is second.predict.signature
+    assert first.predict is not second.predict
+
+    # the meta prompt is only added once
+    instructions = first.predict.signature.instructions
+    assert instructions.count("You are part of an ensemble of agents") == 1
+
+    fields = first.predict.signature.fields
+    for field in [
+        "user_prompt",
+        "conversation_history",
+        "atlas",
+        "previous_errors",
+        "environment",
+        "tasks_completed",
+        "reasoning",
+        "message_update",
+        "impossible",
+        "question",
+        "answer",
+    ]:
+        assert field in fields
+    assert "collection_schemas" not in fields
+
+    # different flags build a different signature
+    third = ElysiaChainOfThought(
+        ExamplePrompt, tree_data=tree.tree_data, reasoning=False, **kwargs
+    )
+    assert third.predict.signature is not first.predict.signature
+    assert "reasoning" not in third.predict.signature.fields
+
+    # the cache is bounded, dropping the least recently used signatures
+    import elysia.util.elysia_chain_of_thought as elysia_chain_of_thought
+
+    size = elysia_chain_of_thought.EXTENDED_SIGNATURES_CACHE_SIZE
+    for i in range(size + 1):
+        ElysiaChainOfThought(
+            f"question_{i} -> answer", tree_data=tree.tree_data, **kwargs
+        )
+    assert len(elysia_chain_of_thought._extended_signatures) == size
+    assert (
+        ElysiaChainOfThought(
+            ExamplePrompt, tree_data=tree.tree_data, **kwargs
+        ).predict.signature
+        is not first.predict.signature
+    )
+
+
+@pytest.mark.asyncio
+async def test_elysia_chain_of_thought_feedback_demos(monkeypatch):
+    import dspy
+    import elysia.util.elysia_chain_of_thought as elysia_chain_of_thought
+    from elysia.util.elysia_chain_of_thought import ElysiaChainOfThought
+
+    class ExamplePrompt(dspy.Signature):
+        """Answer the question."""
+
+        question: str = dspy.InputField()
+        answer: str = dspy.OutputField()
+
+    examples = [dspy.Example(question=f"q{i}", answer=f"a{i}") for i in range(20)]
+
+    async def retrieve_feedback_cached(client_manager, user_prompt, model, n):
+        return examples, [f"uuid{i}" for i in range(len(examples))]
+
+    monkeypatch.setattr(
+        elysia_chain_of_thought, "retrieve_feedback_cached", retrieve_feedback_cached
+    )
+
+    tree = Tree()
+    module = ElysiaChainOfThought(ExamplePrompt, tree_data=tree.tree_data)
+
+    demos_used = []
+
+    async def acall(**kwargs):
+        demos_used.append(kwargs["demos"])
+        await asyncio.sleep(0.01)
+        assert module.predict.demos == []
+        return dspy.Prediction(answer="answer")
+
+    monkeypatch.setattr(module.predict, "acall", acall)
+
+    predictions = await asyncio.gather(
+        *[
+            module.aforward_with_feedback_examples(
+                feedback_model="example",
+                client_manager=None,
+                base_lm=None,
+                complex_lm=None,
+                question="question",
+            )
+            for _ in range(2)
+        ]
+    )
+
+    # the demos are given to each call, and the same for the same examples
+    assert all(prediction.answer == "answer" for prediction in predictions)
+    assert len(demos_used[0]) == 10
+    assert demos_used[0] == demos_used[1]
+    assert module.predict.demos == []
+
+
+def test_lm_history():
+    import logging
+    from elysia.lm.lm_history import LMHistory
+    from elysia.util.objects import Tracker
+
+    class FakeLM:
+        def __init__(self):
+            self.history = LMHistory(max_length=3)
+
+    lm = FakeLM()
+    for i in range(5):
+        lm.history.append(
+            {
+                "messages": [{"role": "user", "content": f"message {i}"}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 2},
+                "cost": 0.5,
+            }
+        )
+
+    # only the most recent calls are kept
+    assert len(lm.history) == 3
+    assert lm.history[0]["messages"][0]["content"] == "message 2"
+
+    # but usage is counted for every call
+    tracker = Tracker([], logging.getLogger("test"))
+    tracker.update_lm_costs(lm, "base_lm")  # type: ignore
+    assert tracker.get_num_calls("base_lm") == 5
+    assert tracker.trackers["models"]["base_lm"]["input_tokens"] == 50
+    assert tracker.trackers["models"]["base_lm"]["output_tokens"] == 10
+    assert tracker.trackers["models"]["base_lm"]["cost"] == 2.5
+
+    # including calls answered by the hedge LM
+    lm.hedge_lm = FakeLM()
+    lm.hedge_lm.history.append(
+        {"usage": {"prompt_tokens": 10, "completion_tokens": 2}, "cost": 0.5}
+    )
+    tracker.update_lm_costs(lm, "base_lm")  # type: ignore
+    assert tracker.get_num_calls("base_lm") == 6
+    assert tracker.trackers["models"]["base_lm"]["input_tokens"] == 60
+    assert tracker.trackers["models"]["base_lm"]["cost"] == 3.0
+
+
+def test_prompt_token_budget():
+    import dspy
+    import logging
+    from elysia.util.elysia_chain_of_thought import ElysiaChainOfThought
+    from elysia.util.objects import Tracker
+    from elysia.util.prompt_budget import (
+        estimate_prompt_tokens,
+        reduce_collection_schemas,
+    )
+
+    class ExamplePrompt(dspy.Signature):
+        """Answer the question."""
+
+        question: str = dspy.InputField()
+        answer: str = dspy.OutputField()
+
+    class FakeLM:
+        model = "openai/not-a-real-model"
+
+    tree = Tree()
+    for i in range(20):
+        tree.tree_data.environment.add_objects(
+            "query",
+            f"collection_{i}",
+            [{"text": f"object {i} {j} " * 50} for j in range(10)],
+        )
+    tree.tree_data.conversation_history = [
+        {"role": "user", "content": f"message {i}"} for i in range(8)
+    ]
+
+    module = ElysiaChainOfThought(
+        ExamplePrompt, tree_data=tree.tree_data, environment=True
+    )
+    kwargs = module._add_tree_data_inputs({"question": "What is in the data?"})
+    tokens = estimate_prompt_tokens(module.predict, kwargs)
+
+    # prompts within the budget are unchanged
+    tree.settings.configure(prompt_token_budget=tokens * 2)
+    fitted = module._fit_prompt_to_budget({**kwargs, "lm": FakeLM()})
+    assert fitted["environment"] is kwargs["environment"]
+    assert tree.tree_data.pop_prompt_reductions() == []
+
+    # otherwise the environment is shrunk first
+    tree.settings.configure(prompt_token_budget=tokens // 2)
+    fitted = module._fit_prompt_to_budget({**kwargs, "lm": FakeLM()})
+    assert estimate_prompt_tokens(module.predict, fitted) <= tokens // 2
+    assert fitted["conversation_history"] == kwargs["conversation_history"]
+
+    # and the same inputs are always reduced in the same way
+    again = module._fit_prompt_to_budget({**kwargs, "lm": FakeLM()})
+    assert again["environment"] == fitted["environment"]
+
+    reductions = tree.tree_data.pop_prompt_reductions()
+    assert len(reductions) == 2
+    assert reductions[0]["tokens_before"] == tokens
+    assert reductions[0]["reductions"][0].startswith("environment")
+
+    # reductions are reported through the tracker
+    tracker = Tracker(["query"], logging.getLogger("test"))
+    tracker.add_prompt_reductions(reductions)
+    assert len(tracker.get_prompt_reductions()) == 2
+
+    schemas = {
+        "collection": {
+            "name": "collection",
+            "summary": "a" * 1000,
+            "fields": [
+                {
+                    "name": "field",
+                    "type": "text",
+                    "description": "a field",
+                    "groups": {"a": 1},
+                    "range": [0, 1],
+                }
+            ],
+        }
+    }
+    reduced = reduce_collection_schemas(schemas, level=1)
+    assert reduced["collection"]["fields"] == [
+        {"name": "field", "type": "text", "description": "a field"}
+    ]
+    reduced = reduce_collection_schemas(schemas, level=2)
+    assert reduced["collection"]["fields"] == [{"name": "field", "type": "text"}]
+    assert len(reduced["collection"]["summary"]) < 1000
+    assert "groups" in schemas["collection"]["fields"][0]
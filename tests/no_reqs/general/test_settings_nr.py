@@ -166,3 +166,134 @@ def test_model_keys():
     response, objects = tree("hi elly. use text response only")
     tree.create_conversation_title()
     tree.get_follow_up_suggestions()
+
+
+def test_lm_credentials():
+    """
+    Test that API keys are passed to the LM per call, rather than through the environment
+    """
+    from elysia.config import get_lm_credentials
+
+    api_keys = {
+        "openai_api_key": "test_key_openai",
+        "openrouter_api_key": "test_key_openrouter",
+        "aws_access_key_id": "test_id",
+        "aws_secret_access_key": "test_secret",
+        "aws_region_name": "test_region",
+    }
+
+    assert get_lm_credentials("openai", api_keys) == {"api_key": "test_key_openai"}
+    assert get_lm_credentials("openrouter/google", api_keys) == {
+        "api_key": "test_key_openrouter"
+    }
+    assert get_lm_credentials("bedrock", api_keys) == {
+        "aws_access_key_id": "test_id",
+        "aws_secret_access_key": "test_secret",
+        "aws_region_name": "test_region",
+    }
+    assert get_lm_credentials("anthropic", api_keys) == {}
+
+
+def test_lm_pool():
+    """
+    Test that settings with the same models and keys share pooled LMs
+    """
+    from elysia.config import borrow_base_lm, borrow_complex_lm
+
+    settings_1 = Settings()
+    settings_1.configure(
+        base_model="gpt-4o-mini",
+        base_provider="openai",
+        complex_model="gpt-4o",
+        complex_provider="openai",
+        openai_api_key="test_key_1",
+    )
+    settings_2 = Settings()
+    settings_2.configure(
+        base_model="gpt-4o-mini",
+        base_provider="openai",
+        complex_model="gpt-4o",
+        complex_provider="openai",
+        openai_api_key="test_key_1",
+    )
+    settings_3 = Settings()
+    settings_3.configure(
+        base_model="gpt-4o-mini",
+        base_provider="openai",
+        complex_model="gpt-4o",
+        complex_provider="openai",
+        openai_api_key="test_key_2",
+    )
+
+    assert borrow_base_lm(settings_1) is borrow_base_lm(settings_2)
+    assert borrow_complex_lm(settings_1) is borrow_complex_lm(settings_2)
+    assert borrow_base_lm(settings_1) is not borrow_complex_lm(settings_1)
+    assert borrow_base_lm(settings_1) is not borrow_base_lm(settings_3)
+
+    # the same model used as both the base and complex LM is not shared between the two
+    settings_4 = Settings()
+    settings_4.configure(
+        base_model="gpt-4o",
+        base_provider="openai",
+        complex_model="gpt-4o",
+        complex_provider="openai",
+        openai_api_key="test_key_1",
+    )
+    assert borrow_base_lm(settings_4) is not borrow_complex_lm(settings_4)
+
+    # base LMs which hedge with different credentials are not shared
+    hedged_settings = []
+    for anthropic_api_key in ["test_key_1", "test_key_2"]:
+        hedged = Settings()
+        hedged.configure(
+            base_model="gpt-4o-mini",
+            base_provider="openai",
+            complex_model="gpt-4o",
+            complex_provider="openai",
+            openai_api_key="test_key_1",
+            anthropic_api_key=anthropic_api_key,
+            base_hedge_percentile=95,
+            hedge_provider="anthropic",
+            hedge_model="claude-3-5-haiku-latest",
+        )
+        hedged_settings.append(hedged)
+    assert borrow_base_lm(hedged_settings[0]) is not borrow_base_lm(hedged_settings[1])
+    assert borrow_complex_lm(hedged_settings[0]) is borrow_complex_lm(
+        hedged_settings[1]
+    )
+
+
+def test_lm_missing_api_keys(monkeypatch):
+    """
+    Test that LMs refuse calls without their API keys, rather than using keys from the environment
+    """
+    from litellm import AuthenticationError
+    from elysia.config import get_missing_lm_credentials, load_base_lm, load_lm
+
+    monkeypatch.setenv("OPENAI_API_KEY", "env_key")
+    lm = load_lm("openai", "gpt-4o-mini", api_keys={})
+    with pytest.raises(AuthenticationError):
+        lm("hi")
+
+    # partial sets of keys and providers without a listed key are also missing
+    assert get_missing_lm_credentials(
+        "bedrock", {"aws_access_key_id": "test_id", "aws_region_name": "test_region"}
+    ) == ["aws_secret_access_key"]
+    assert get_missing_lm_credentials("mistral", {}) == ["mistral_api_key"]
+    assert get_missing_lm_credentials("ollama", {}) == []
+
+    # including the hedge LM
+    settings = Settings()
+    settings.configure(
+        base_model="gpt-4o-mini",
+        base_provider="openai",
+        complex_model="gpt-4o",
+        complex_provider="openai",
+        openai_api_key="test_key_openai",
+        base_hedge_percentile=95,
+        hedge_provider="anthropic",
+        hedge_model="claude-3-5-haiku-20241022",
+    )
+    base_lm = load_base_lm(settings)
+    assert base_lm.missing_api_keys == []
+    assert base_lm.hedge_lm.missing_api_keys == ["anthropic_api_key"]
@@ -0,0 +1,163 @@
+import asyncio
+
+import pytest
+
+from elysia.config import Settings
+from elysia.tree.tree import Tree
+from elysia.tools.text.text import TextResponse
+from elysia.tools.retrieval.query import Query
+from elysia.util.streaming import FieldStream, JSONListStream
+
+
+def test_field_stream():
+    completion = (
+        "[[ ## reasoning ## ]]\nSome reasoning\n\n"
+        "[[ ## response ## ]]\nHello there,\n\nthis is a [test].\n\n"
+        "[[ ## completed ## ]]"
+    )
+
+    # the same text is extracted however the completion is split
+    for chunk_size in [1, 2, 5, 100]:
+        field = FieldStream("response")
+        pieces = [
+            field.feed(completion[i : i + chunk_size])
+            for i in range(0, len(completion), chunk_size)
+        ]
+        assert "".join(pieces) == "Hello there,\n\nthis is a [test]."
+        assert field.finished
+
+    # other formats give no text
+    field = FieldStream("response")
+    assert field.feed('{"response": "Hello there"}') == ""
+
+
+def test_json_list_stream():
+    text = (
+        '[{"text": "a, [b] \\"c\\"", "ref_ids": ["x"]}, {"text": "d", "ref_ids": []}]'
+    )
+
+    for chunk_size in [1, 3, 100]:
+        stream = JSONListStream()
+        items = []
+        for i in range(0, len(text), chunk_size):
+            items.extend(stream.feed(text[i : i + chunk_size]))
+
+        assert items == [
+            {"text": 'a, [b] "c"', "ref_ids": ["x"]},
+            {"text": "d", "ref_ids": []},
+        ]
+        assert stream.finished
+
+    # items are returned as soon as they are complete, before the rest of the list
+    stream = JSONListStream()
+    assert stream.feed('[{"text": "a"}, {"te') == [{"text": "a"}]
+    assert stream.feed('xt": "b"}]') == [{"text": "b"}]
+
+
+@pytest.mark.asyncio
+async def test_streamed_text_response(monkeypatch):
+    settings = Settings()
+    settings.configure(
+        base_model="gpt-4o-mini",
+        base_provider="openai",
+        complex_model="gpt-4o",
+        complex_provider="openai",
+        stream_text_responses=True,
+    )
+    tree = Tree(branch_initialisation="empty", settings=settings)
+    tree.add_tool(TextResponse, root=True)
+
+    class FakePrediction:
+        response = "Hello there"
+
+    async def aforward_streaming(self, field_name, **kwargs):
+        assert field_name == "response"
+        for piece in ["Hello", " there"]:
+            yield piece
+        yield FakePrediction()
+
+    monkeypatch.setattr(
+        "elysia.util.elysia_chain_of_thought.ElysiaChainOfThought.aforward_streaming",
+        aforward_streaming,
+    )
+
+    payloads = [payload async for payload in tree.async_run("hi")]
+    deltas = [p for p in payloads if p is not None and p["type"] == "text_delta"]
+    assert [delta["payload"]["text"] for delta in deltas] == ["Hello", " there"]
+    assert len({delta["payload"]["stream_id"] for delta in deltas}) == 1
+
+    # the complete response follows, and only it is kept in the conversation history
+    responses = [p for p in payloads if p is not None and p["type"] == "text"]
+    assert responses[-1]["payload"]["objects"] == [{"text": "Hello there"}]
+    assert tree.tree_data.conversation_history[-1] == {
+        "role": "assistant",
+        "content": "Hello there",
+    }
+    assert all(p["type"] != "text_delta" for p in tree.returner.store)
+
+
+@pytest.mark.asyncio
+async def test_early_query_args():
+    query = Query()
+    schemas = {
+        "Products": {
+            "vectorizer": "text2vec-openai",
+            "named_vectors": None,
+            "fields": [{"name": "description", "type": "text", "mean": 50}],
+        },
+        "Docs": {
+            "vectorizer": "text2vec-openai",
+            "named_vectors": None,
+            "fields": [{"name": "content", "type": "text", "mean": 2000}],
+        },
+    }
+    item = {
+        "target_collections": ["products"],
+        "search_type": "hybrid",
+        "search_query": "red shoes",
+    }
+
+    # the collection names are corrected, and fields to search are reset without named vectors
+    query_output, fields_to_search = query._early_query_args(
+        item, True, {"products": ["description"]}, schemas, {}, list(schemas)
+    )
+    assert query_output.target_collections == ["Products"]
+    assert fields_to_search == {"Products": None}
+
+    # not executed early if the fields to search are unknown, the item is invalid, or it may need chunking
+    assert query._early_query_args(item, True, None, schemas, {}, list(schemas)) is None
+    assert (
+        query._early_query_args(
+            {**item, "search_type": "vector"}, False, {}, schemas, {}, list(schemas)
+        )
+        is None
+    )
+    assert (
+        query._early_query_args(
+            {**item, "target_collections": ["Docs"]},
+            True,
+            {},
+            schemas,
+            {},
+            list(schemas),
+        )
+        is None
+    )
+
+    # the results are only used if the final query output matches
+    async def execute():
+        return ["response"], ["code"]
+
+    early_queries = {
+        0: (query_output.model_dump(), fields_to_search, asyncio.create_task(execute()))
+    }
+    assert query._take_early_query(early_queries, 1, query_output, {}) is None
+    task = query._take_early_query(early_queries, 0, query_output, fields_to_search)
+    assert await task == (["response"], ["code"])
+
+    changed = query_output.model_copy(update={"limit": 10})
+    task = asyncio.create_task(execute())
+    early_queries = {0: (query_output.model_dump(), fields_to_search, task)}
+    assert query._take_early_query(early_queries, 0, changed, fields_to_search) is None
+    await asyncio.sleep(0)
+    assert task.cancelled() and early_queries == {}
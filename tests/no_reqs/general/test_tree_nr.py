@@ -1,6 +1,13 @@
+import time
+import asyncio
 import pytest
+from pydantic import BaseModel
+from elysia import Tool
+from elysia.objects import Result
 from elysia.config import Settings
 from elysia.tree.tree import Tree
+from elysia.tree.util import Decision, DecisionNode
+from elysia.tools.text.text import TextResponse
 from elysia.util.client import ClientManager
 
 
@@ -63,3 +70,445 @@ async def test_init_tree_with_no_client():
             ),
         )
     )
+
+
+class SlowRetrievalTool(Tool):
+    def __init__(self, name: str, sleep_time: float, **kwargs):
+        super().__init__(
+            name=name,
+            description="Retrieves some objects slowly.",
+        )
+        self.sleep_time = sleep_time
+
+    async def __call__(
+        self, tree_data, inputs, base_lm, complex_lm, client_manager, **kwargs
+    ):
+        await asyncio.sleep(self.sleep_time)
+        yield Result(objects=[{"retrieved_by": self.name}], name=self.name)
+
+
+def test_parallel_decisions_filtering():
+    tree = Tree(branch_initialisation="empty")
+    tree.add_tool(SlowRetrievalTool(name="slow_a", sleep_time=0.0), root=True)
+    tree.add_tool(SlowRetrievalTool(name="slow_b", sleep_time=0.0), root=True)
+    tree.add_tool(TextResponse, root=True)
+    decision_node = tree.decision_nodes[tree.root]
+
+    decision = Decision("slow_a", {}, "", False, False)
+    parallel_decisions = decision_node._parallel_decisions(
+        [
+            {"function_name": "slow_b", "function_inputs": {}},
+            {"function_name": "slow_b", "function_inputs": {}},  # duplicate
+            {"function_name": "slow_a", "function_inputs": {}},  # same as decision
+            {
+                "function_name": "final_text_response",
+                "function_inputs": {},
+            },  # ends tree
+            {"function_name": "not_a_tool", "function_inputs": {}},
+            "not a dict",
+        ],
+        decision,
+        available_tools=["slow_a", "slow_b", "final_text_response"],
+    )
+    assert [d.function_name for d in parallel_decisions] == ["slow_b"]
+
+    # unavailable tools are not run
+    assert (
+        decision_node._parallel_decisions(
+            [{"function_name": "slow_b", "function_inputs": {}}],
+            decision,
+            available_tools=["slow_a", "final_text_response"],
+        )
+        == []
+    )
+
+    # no parallel actions when the main decision ends the tree
+    assert (
+        decision_node._parallel_decisions(
+            [{"function_name": "slow_b", "function_inputs": {}}],
+            Decision("final_text_response", {}, "", False, True),
+            available_tools=["slow_a", "slow_b", "final_text_response"],
+        )
+        == []
+    )
+
+
+@pytest.mark.asyncio
+async def test_parallel_tool_calls(monkeypatch):
+    settings = Settings()
+    settings.configure(
+        base_model="gpt-4o-mini",
+        base_provider="openai",
+        complex_model="gpt-4o",
+        complex_provider="openai",
+        parallel_tool_calls=True,
+    )
+    tree = Tree(branch_initialisation="empty", settings=settings)
+    tree.add_tool(SlowRetrievalTool(name="slow_a", sleep_time=0.6), root=True)
+    tree.add_tool(SlowRetrievalTool(name="slow_b", sleep_time=0.3), root=True)
+    tree.add_tool(TextResponse, root=True)
+
+    async def decide_both(self, tree_data, available_tools, **kwargs):
+        decision = Decision("slow_a", {}, "", False, True)
+        decision.parallel_decisions = self._parallel_decisions(
+            [{"function_name": "slow_b", "function_inputs": {}}],
+            decision,
+            available_tools,
+        )
+        return decision, []
+
+    monkeypatch.setattr(DecisionNode, "__call__", decide_both)
+
+    start_time = time.time()
+    async for _ in tree.async_run("Retrieve from both"):
+        pass
+    time_taken = time.time() - start_time
+
+    # run concurrently, not one after the other
+    assert time_taken < 0.85
+
+    # merged in decision order, even though slow_b finished first
+    environment = tree.tree_data.environment.environment
+    assert [key for key in environment if key.startswith("slow")] == [
+        "slow_a",
+        "slow_b",
+    ]
+    assert tree.decision_history[0][:2] == ["slow_a", "slow_b"]
+
+
+class TaskRecordingTool(Tool):
+    def __init__(self, name: str, sleep_time: float, **kwargs):
+        super().__init__(
+            name=name,
+            description="Records the task it sees while running.",
+        )
+        self.sleep_time = sleep_time
+        self.tasks_seen = []
+
+    async def __call__(
+        self, tree_data, inputs, base_lm, complex_lm, client_manager, **kwargs
+    ):
+        self.tasks_seen.append(tree_data.current_task)
+        await asyncio.sleep(self.sleep_time)
+        self.tasks_seen.append(tree_data.current_task)
+        tree_data.add_prompt_reduction(
+            {
+                "task": tree_data.current_task,
+                "signature": "TaskRecording",
+                "model": "gpt-4o-mini",
+                "budget": 100,
+                "tokens_before": 200,
+                "tokens_after": 100,
+                "reductions": [],
+            }
+        )
+        yield Result(objects=[{"retrieved_by": self.name}], name=self.name)
+
+
+@pytest.mark.asyncio
+async def test_parallel_tool_calls_have_own_task(monkeypatch):
+    settings = Settings()
+    settings.configure(
+        base_model="gpt-4o-mini",
+        base_provider="openai",
+        complex_model="gpt-4o",
+        complex_provider="openai",
+        parallel_tool_calls=True,
+    )
+    tree = Tree(branch_initialisation="empty", settings=settings)
+    tool_a = TaskRecordingTool(name="slow_a", sleep_time=0.3)
+    tool_b = TaskRecordingTool(name="slow_b", sleep_time=0.1)
+    tree.add_tool(tool_a, root=True)
+    tree.add_tool(tool_b, root=True)
+    tree.add_tool(TextResponse, root=True)
+
+    async def decide_both(self, tree_data, available_tools, **kwargs):
+        decision = Decision("slow_a", {}, "", False, True)
+        decision.parallel_decisions = self._parallel_decisions(
+            [{"function_name": "slow_b", "function_inputs": {}}],
+            decision,
+            available_tools,
+        )
+        return decision, []
+
+    monkeypatch.setattr(DecisionNode, "__call__", decide_both)
+
+    async for _ in tree.async_run("Retrieve from both"):
+        pass
+
+    # each action keeps its own task, even while the other one is running
+    assert tool_a.tasks_seen == ["slow_a", "slow_a"]
+    assert tool_b.tasks_seen == ["slow_b", "slow_b"]
+
+    # and its prompt reductions are tracked under its own name
+    assert len(tree.tracker.get_prompt_reductions("slow_a")) == 1
+    assert len(tree.tracker.get_prompt_reductions("slow_b")) == 1
+    assert tree.tracker.trackers["slow_a"]["timer"]["calls"] == 1
+    assert tree.tracker.trackers["slow_b"]["timer"]["calls"] == 1
+
+
+@pytest.mark.asyncio
+async def test_tree_restarts_until_recursion_limit():
+    settings = Settings()
+    settings.configure(
+        base_model="gpt-4o-mini",
+        base_provider="openai",
+        complex_model="gpt-4o",
+        complex_provider="openai",
+    )
+    tree = Tree(branch_initialisation="empty", settings=settings)
+    tree.add_tool(SlowRetrievalTool(name="slow_a", sleep_time=0.0), root=True)
+    tree.tree_data.recursion_limit = 2
+
+    # the only tool never ends the tree, so it restarts until the recursion limit
+    async for _ in tree.async_run("Keep going"):
+        pass
+
+    assert len(tree.decision_history) == tree.tree_data.recursion_limit + 2
+    assert all(iteration == ["slow_a"] for iteration in tree.decision_history)
+    assert tree.tree_data.num_trees_completed == tree.tree_data.recursion_limit + 2
+
+
+@pytest.mark.asyncio
+async def test_conversation_history_window(monkeypatch):
+    settings = Settings()
+    settings.configure(
+        base_model="gpt-4o-mini",
+        base_provider="openai",
+        complex_model="gpt-4o",
+        complex_provider="openai",
+        conversation_history_window=2,
+    )
+    tree = Tree(branch_initialisation="empty", settings=settings)
+    tree.add_tool(TextResponse, root=True)
+
+    summarised = []
+
+    async def summarise(previous_summary, conversation, lm):
+        summarised.append([message["content"] for message in conversation])
+        new_messages = "".join(message["content"] for message in conversation)
+        return previous_summary + new_messages
+
+    monkeypatch.setattr("elysia.tree.tree.summarise_conversation_history", summarise)
+
+    for prompt in ["first", "second", "third"]:
+        async for _ in tree.async_run(prompt):
+            pass
+        await tree._wait_for_conversation_summary()
+        tree._update_conversation_history("assistant", f"answer to {prompt}")
+
+    # messages outside the window at the end of each run are summarised exactly once
+    history = tree.tree_data.conversation_history
+    assert [message["content"] for message in history][0::2] == [
+        "first",
+        "second",
+        "third",
+    ]
+    assert summarised == [["first"], ["answer to first", "second"]]
+    assert tree.tree_data.num_summarised_messages == 3
+    assert tree.tree_data.conversation_summary == "firstanswer to firstsecond"
+
+    # the window includes the message which has not been summarised yet
+    windowed = tree.tree_data.windowed_conversation_history()
+    assert windowed[1:] == history[3:]
+    assert tree.tree_data.conversation_summary in windowed[0]["content"]
+
+    # both the full history and the summary are saved
+    loaded_tree = Tree.import_from_json(tree.export_to_json())
+    assert loaded_tree.tree_data.conversation_history == history
+    assert (
+        loaded_tree.tree_data.conversation_summary
+        == tree.tree_data.conversation_summary
+    )
+    assert loaded_tree.tree_data.windowed_conversation_history() == windowed
+
+
+def test_topology_cache():
+    tree = Tree(branch_initialisation="empty")
+    tree.add_tool(SlowRetrievalTool(name="slow_a", sleep_time=0.0), root=True)
+
+    successive_actions = tree._get_cached_successive_actions()
+    assert "slow_a" in successive_actions
+    assert tree._get_cached_successive_actions() is successive_actions
+
+    # changing the tree invalidates the cache
+    tree.add_tool(SlowRetrievalTool(name="slow_b", sleep_time=0.0), root=True)
+    assert tree._topology_cache == {}
+    assert "slow_b" in tree._get_cached_successive_actions()
+
+    tree.remove_tool("slow_a", root=True)
+    assert "slow_a" not in tree._get_cached_successive_actions()
+
+
+def test_decision_node_options_cache():
+    class ExampleInput(BaseModel):
+        name: str
+        value: int
+
+    decision_node = DecisionNode(id="test", instruction="test", options={})
+    decision_node.add_option(
+        id="example_tool",
+        description="An example tool.",
+        inputs={
+            "example": {
+                "description": "An example input.",
+                "type": ExampleInput,
+                "default": None,
+            }
+        },
+        action=SlowRetrievalTool(name="example_tool", sleep_time=0.0),
+        end=False,
+    )
+
+    options = decision_node._options_to_json(["example_tool"])
+    assert "properties" in options["example_tool"]["inputs"]["example"]["type"]
+
+    # the node's own options are not overwritten by the schema text
+    assert decision_node.options["example_tool"]["inputs"]["example"]["type"] is (
+        ExampleInput
+    )
+
+    # cached per set of available tools
+    assert decision_node._options_to_json(["example_tool"]) is options
+    assert decision_node._options_to_json([]) == {}
+
+    # rebuilt when the options change
+    decision_node.add_option(
+        id="other_tool",
+        description="Another tool.",
+        inputs={},
+        action=SlowRetrievalTool(name="other_tool", sleep_time=0.0),
+    )
+    new_options = decision_node._options_to_json(["example_tool", "other_tool"])
+    assert "other_tool" in new_options
+    decision_node.remove_option("other_tool")
+    assert "other_tool" not in decision_node._options_to_json(
+        ["example_tool", "other_tool"]
+    )
+
+
+class CountedAvailabilityTool(Tool):
+    def __init__(self, name: str, depends_on: list[str] | None = None, **kwargs):
+        super().__init__(
+            name=name,
+            description="A tool that counts how often its availability is checked.",
+            availability_depends_on=depends_on,
+        )
+        self.num_checks = 0
+
+    async def is_tool_available(self, tree_data, base_lm, complex_lm, client_manager):
+        self.num_checks += 1
+        await asyncio.sleep(0.3)
+        return not tree_data.environment.is_empty()
+
+    async def __call__(
+        self, tree_data, inputs, base_lm, complex_lm, client_manager, **kwargs
+    ):
+        yield Result(objects=[{"a": 1}], name=self.name)
+
+
+@pytest.mark.asyncio
+async def test_available_tools_concurrent_and_memoized():
+    tree = Tree(branch_initialisation="empty")
+    memoized_tool = CountedAvailabilityTool(name="memoized", depends_on=["environment"])
+    unmemoized_tool = CountedAvailabilityTool(name="unmemoized")
+    tree.add_tool(memoized_tool, root=True)
+    tree.add_tool(unmemoized_tool, root=True)
+    decision_node = tree.decision_nodes[tree.root]
+    client_manager = ClientManager(wcd_url="", wcd_api_key="")
+
+    # checks run concurrently
+    start_time = time.time()
+    available, unavailable = await tree._get_available_tools(
+        decision_node, client_manager
+    )
+    assert time.time() - start_time < 0.55
+    assert available == []
+    assert [tool for tool, _ in unavailable] == ["memoized", "unmemoized"]
+
+    # the memoized tool is not re-checked when its dependencies have not changed
+    await tree._get_available_tools(decision_node, client_manager)
+    assert memoized_tool.num_checks == 1
+    assert unmemoized_tool.num_checks == 2
+
+    # but is once they do
+    tree.tree_data.environment.add_objects("test_tool", "test_result", [{"a": 1}])
+    available, _ = await tree._get_available_tools(decision_node, client_manager)
+    assert memoized_tool.num_checks == 2
+    assert available == ["memoized", "unmemoized"]
+
+    # including when a tool changes the environment directly
+    del tree.tree_data.environment.environment["test_tool"]
+    available, _ = await tree._get_available_tools(decision_node, client_manager)
+    assert memoized_tool.num_checks == 3
+    assert available == []
+
+    tree.tree_data.environment.hidden_environment["key"] = "value"
+    await tree._get_available_tools(decision_node, client_manager)
+    assert memoized_tool.num_checks == 4
+
+
+@pytest.mark.asyncio
+async def test_post_answer_tasks_are_shared(monkeypatch):
+    settings = Settings()
+    settings.configure(
+        base_model="gpt-4o-mini",
+        base_provider="openai",
+        complex_model="gpt-4o",
+        complex_provider="openai",
+    )
+    tree = Tree(branch_initialisation="empty", settings=settings)
+    tree.tree_index = 0
+
+    calls = {"title": 0, "suggestions": 0}
+
+    async def create_title(conversation, lm):
+        calls["title"] += 1
+        await asyncio.sleep(0.05)
+        return "A title"
+
+    async def get_suggestions(tree_data, current_suggestions, lm, **kwargs):
+        calls["suggestions"] += 1
+        await asyncio.sleep(0.05)
+        return [f"suggestion {calls['suggestions']}"]
+
+    monkeypatch.setattr("elysia.tree.tree.create_conversation_title", create_title)
+    monkeypatch.setattr("elysia.tree.tree.get_follow_up_suggestions", get_suggestions)
+
+    # nothing is started unless asked for
+    tree._start_post_answer_tasks()
+    assert tree._post_answer_tasks == {}
+
+    # requests made while the background tasks are running reuse their results
+    tree.prefetch_title_and_suggestions = True
+    tree._start_post_answer_tasks()
+    title, suggestions, same_suggestions = await asyncio.gather(
+        tree.create_conversation_title_async(),
+        tree.get_follow_up_suggestions_async(),
+        tree.get_follow_up_suggestions_async(),
+    )
+    assert title == "A title"
+    assert suggestions == same_suggestions == ["suggestion 1"]
+    assert calls == {"title": 1, "suggestions": 1}
+
+    # as do later requests for the same prompt
+    assert await tree.get_follow_up_suggestions_async() == ["suggestion 1"]
+    assert tree.suggestions == ["suggestion 1"]
+
+    # but requests with different arguments make a new call, which is not kept
+    await tree.get_follow_up_suggestions_async(num_suggestions=3)
+    await tree.get_follow_up_suggestions_async(num_suggestions=3)
+    assert calls["suggestions"] == 3
+
+    # if the final response fails, the suggestions are made again for the next one
+    tree._start_post_answer_tasks()
+    tree._cancel_post_answer_tasks()
+    assert await tree.get_follow_up_suggestions_async() == ["suggestion 4"]
+
+    # and a new prompt cancels any that are still running
+    tree._start_post_answer_tasks()
+    tasks = list(tree._post_answer_tasks.values())
+    tree.soft_reset()
+    await asyncio.sleep(0)
+    assert tree._post_answer_tasks == {}
+    assert all(task.cancelled() for task in tasks)